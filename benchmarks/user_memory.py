@@ -0,0 +1,48 @@
+"""Замер памяти на настройки одного пользователя: dataclass UserSettings и CompactUserSettings со __slots__.
+
+В кэше UserStateManager.settings бот хранит именно CompactUserSettings.
+
+Запуск из корня репозитория: python -m benchmarks.user_memory [количество пользователей]
+"""
+import gc
+import sys
+import tracemalloc
+
+from src.constants.bot_constants import IMAGE_SIZES, StyleType
+from src.models.compact import CompactUserSettings
+from src.models.user_state import UserSettings
+
+STYLE = StyleType.ANIME.name
+SIZE = IMAGE_SIZES["portrait"]
+
+def make_regular(user_id: int):
+    """Настройки в исходном представлении"""
+    return UserSettings(width=SIZE["width"], height=SIZE["height"], style=STYLE)
+
+def make_compact(user_id: int):
+    """То же самое в компактном представлении"""
+    return CompactUserSettings(width=SIZE["width"], height=SIZE["height"], style=STYLE)
+
+def measure(factory, users: int) -> float:
+    """Средний объем памяти на пользователя в байтах"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    data = {user_id: factory(user_id) for user_id in range(users)}
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del data
+    return total / users
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    regular = measure(make_regular, users)
+    compact = measure(make_compact, users)
+    print(f"Пользователей: {users}")
+    print(f"Обычные модели:     {regular:8.0f} байт на пользователя")
+    print(f"Компактные модели:  {compact:8.0f} байт на пользователя")
+    print(f"Экономия:           {regular - compact:8.0f} байт ({(1 - compact / regular) * 100:.0f}%)")
+
+if __name__ == '__main__':
+    main()
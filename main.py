@@ -1,30 +1,28 @@
+import time
+# Момент запуска процесса: от него считается время готовности бота
+STARTUP_STARTED_AT = time.monotonic()
+
 import os
 import sys
 import logging
 import asyncio
 import base64
+from dataclasses import replace
 from datetime import datetime
-from aiogram import Bot, Dispatcher, types, Router, F
+from typing import Optional
+from aiogram import Bot, Dispatcher, types, Router, F, BaseMiddleware
 from aiogram.enums import ParseMode
 from aiogram.types import BufferedInputFile
 from aiogram.filters import Command
 from aiogram.types import (
     CallbackQuery,
     InlineKeyboardMarkup,
-    InlineKeyboardButton,
-    FSInputFile
+    InlineKeyboardButton
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.exceptions import TelegramBadRequest
 import aiohttp
-import io
-import uuid as uuid_lib
-from PIL import Image, ImageEnhance, ImageFilter
-from rembg import remove
-from collections import defaultdict
 import json
-import time
-import requests
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=RuntimeWarning, module="onnxruntime")
@@ -38,34 +36,12 @@ os.environ['ORT_LOGGING_LEVEL'] = '3'  # Только критические о
 os.environ['ORT_DISABLE_TENSORRT'] = '1'
 os.environ['ORT_DISABLE_CUDA'] = '1'
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # Вывод в консоль
-        logging.FileHandler('bot.log')  # Запись в файл
-    ]
-)
-
-logger = logging.getLogger(__name__)
-
 # Создаем форматтер для логов с дополнительной информацией
 log_formatter = logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - [USER_ID:%(user_id)s] - [OPERATION:%(operation)s] - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-# Создаем файловый обработчик с ротацией по размеру и времени
-file_handler = logging.handlers.TimedRotatingFileHandler(
-    'logs/bot.log',
-    when='midnight',
-    interval=1,
-    backupCount=7,
-    encoding='utf-8'
-)
-file_handler.setFormatter(log_formatter)
-
 # Создаем консольный обработчик с цветным выводом
 class ColoredConsoleHandler(logging.StreamHandler):
     colors = {
@@ -86,14 +62,40 @@ class ColoredConsoleHandler(logging.StreamHandler):
         except Exception:
             self.handleError(record)
 
-console_handler = ColoredConsoleHandler()
-console_handler.setFormatter(log_formatter)
+def setup_logging():
+    """Настраивает вывод логов в консоль, bot.log и logs/bot.log с ротацией"""
+    # Создаем директорию для логов, если она не существует
+    os.makedirs('logs', exist_ok=True)
+
+    # Настройка логирования
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),  # Вывод в консоль
+            logging.FileHandler('bot.log')  # Запись в файл
+        ]
+    )
+
+    # Создаем файловый обработчик с ротацией по размеру и времени
+    file_handler = logging.handlers.TimedRotatingFileHandler(
+        'logs/bot.log',
+        when='midnight',
+        interval=1,
+        backupCount=7,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(log_formatter)
+
+    console_handler = ColoredConsoleHandler()
+    console_handler.setFormatter(log_formatter)
 
-# Настраиваем корневой логгер
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+
+# Настраиваем логгер модуля; обработчики подключает setup_logging() при запуске бота
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
 
 # Добавляем расширенный фильтр для контекстной информации
 class ContextFilter(logging.Filter):
@@ -106,112 +108,186 @@ class ContextFilter(logging.Filter):
 
 logger.addFilter(ContextFilter())
 
-# Создаем директорию для логов, если она не существует
-os.makedirs('logs', exist_ok=True)
-
 from dotenv import load_dotenv
 from src.api.fusion_brain import Text2ImageAPI, CensorshipError
+from src.api.http_session import HTTPSessionManager
+from src.api.model_registry import ModelRegistry
+from src.api.polling import IN_PROGRESS_STATUSES
+from src.api.poller import GenerationPoller, GenerationTimeoutError
+from src.api.single_flight import SingleFlight, make_generation_key
+from src.api.generation_cache import GenerationResultCache
+from src.api.streaming import StreamingImageDecoder
+from src.api.admission import AdmissionController
+from src.api.errors import APIError, CensorshipError, RateLimitError, TransientAPIError
+from src.api.retry import IDEMPOTENT_METHODS, RetryPolicy
+from src.api.circuit_breaker import UNAVAILABLE_MESSAGE, CircuitBreaker, CircuitOpenError
+from src.api.rate_limiter import (
+    AdaptiveRateLimiter,
+    ENDPOINT_MODELS,
+    ENDPOINT_RUN,
+    ENDPOINT_STATUS,
+    parse_retry_after
+)
 from src.models.image_info import ImageInfo
+from src.models.state_store import UserStateStore
+from src.models.storage import create_storage
+from src.models.user_state import UserStateManager
 from src.constants.messages import MessageTemplate, MessageKey
 from src.constants.bot_constants import (
     IMAGE_STYLES,
     IMAGE_SIZES,
-    StyleType,
     EmojiEnum,
     CallbackEnum,
-    ImageSize
+    ImageSize,
+    ImageProcessingConstants,
+    GenerationCacheConstants,
+    UserStateConstants,
+    StorageConstants,
+    LoggingConstants,
+    APIConstants,
+    AdmissionConstants,
+    RateLimitConstants
 )
 from src.utils.image_processor import ImageProcessor
-
-# Загрузка переменных окружения из файла .env
-load_dotenv()
-
-# Конфигурация
-API_TOKEN = os.getenv('API_TOKEN')
-FUSIONBRAIN_API_KEY = os.getenv('FUSIONBRAIN_API_KEY')
-FUSIONBRAIN_SECRET_KEY = os.getenv('FUSIONBRAIN_SECRET_KEY')
-
-# Проверяем наличие всех необходимых переменных окружения
-if not all([API_TOKEN, FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY]):
-    logger.error("Не все необходимые переменные окружения установлены!")
-    if not API_TOKEN:
-        logger.error("Отсутствует API_TOKEN")
-    if not FUSIONBRAIN_API_KEY:
-        logger.error("Отсутствует FUSIONBRAIN_API_KEY")
-    if not FUSIONBRAIN_SECRET_KEY:
-        logger.error("Отсутствует FUSIONBRAIN_SECRET_KEY")
-    sys.exit(1)
-
-# Проверяем формат ключей
-if any([' ' in key for key in [FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY]]):
-    logger.error("API ключи не должны содержать пробелов!")
-    sys.exit(1)
-
-if any(['"' in key or "'" in key for key in [FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY]]):
-    logger.error("API ключи не должны содержать кавычек!")
-    sys.exit(1)
-
-logger.info("Конфигурация загружена успешно")
-logger.debug(f"API Key length: {len(FUSIONBRAIN_API_KEY)}, Secret Key length: {len(FUSIONBRAIN_SECRET_KEY)}")
+from src.utils.bg_removal_pool import BackgroundRemovalPool
+from src.utils.disk_cache import DiskCache
+from src.utils.async_logging import QueueLogging
+from src.utils.log_payload import summarize_payload
+
+# Заполняются в bootstrap() при запуске бота
+root_queue_logging: Optional[QueueLogging] = None
+main_queue_logging: Optional[QueueLogging] = None
+LOG_FULL_PAYLOADS = False
+API_TOKEN: Optional[str] = None
+FUSIONBRAIN_API_KEY: Optional[str] = None
+FUSIONBRAIN_SECRET_KEY: Optional[str] = None
 
 START_IMAGE_URL = 'https://ваша ссылка на картинку'
 
-# Инициализация бота и диспетчера
-bot = Bot(token=API_TOKEN, parse_mode=ParseMode.HTML)
-dp = Dispatcher()
+# Бот и диспетчер создаются в bootstrap(), роутер нужен декораторам обработчиков
+bot: Optional[Bot] = None
+dp: Optional[Dispatcher] = None
 router = Router()
 
-class CensorshipError(Exception):
-    pass
-
 class Text2ImageAPI:
+    """Клиент FusionBrain: один на процесс, создается в main() и передается обработчикам"""
     MAX_PROMPT_LENGTH = 500
 
-    def __init__(self, api_key, secret_key):
+    def __init__(self, api_key, secret_key, session=None, rate_limiter=None, retry_policy=None,
+                 circuit_breaker=None, model_registry=None):
         self.URL = 'https://api-key.fusionbrain.ai'
         self.api_key = api_key
         self.secret_key = secret_key
+        # Заголовки авторизации не меняются, собираем их один раз
+        self.auth_headers = {
+            "X-Key": f"Key {api_key}",
+            "X-Secret": f"Secret {secret_key}",
+        }
+        self.session = session  # Если не задана, используется общая сессия бота
+        # Квота FusionBrain одна на ключ API, поэтому ограничитель и автомат защиты — у единственного клиента
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        # При недоступности FusionBrain запросы отклоняются сразу, восстановление проверяет один пробный запрос
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.model_registry = model_registry or ModelRegistry()
         self.logger = logging.getLogger(__name__)
 
-    async def _make_request(self, method, url, **kwargs):
-        """Выполняет запрос к API с правильной авторизацией"""
-        headers = {
-            "X-Key": f"Key {self.api_key}",
-            "X-Secret": f"Secret {self.secret_key}",
-        }
+    async def _make_request(self, method, url, endpoint, stream_image=False, form_factory=None,
+                            retry=True, **kwargs):
+        """Выполняет запрос к API с учетом ограничителя запросов и повторами после временных ошибок
+
+        При stream_image=True успешный ответ разбирается по частям, а первое изображение
+        возвращается уже декодированным в поле image_data. form_factory создает тело формы
+        заново для каждой попытки: FormData нельзя отправить дважды. retry=False — одна попытка
+        (опросы статуса повторяет опросчик). Пока автомат защиты разомкнут, запрос не отправляется
+        и завершается CircuitOpenError.
+        """
+        async def attempt(timeout):
+            await self.rate_limiter.acquire(endpoint)
+            if form_factory is not None:
+                kwargs['data'] = form_factory()
+            try:
+                result = await asyncio.wait_for(self._send(method, url, stream_image, **kwargs), timeout)
+            except RateLimitError as e:
+                self.rate_limiter.on_rate_limited(endpoint, e.retry_after)
+                raise
+            self.rate_limiter.on_success(endpoint)
+            return result
+
+        return await self.circuit_breaker.call(
+            lambda: self.retry_policy.run(
+                attempt, name=endpoint, max_retries=None if retry else 0,
+                idempotent=method in IDEMPOTENT_METHODS
+            )
+        )
+
+    async def _send(self, method, url, stream_image=False, **kwargs):
+        """Выполняет один запрос к API с правильной авторизацией"""
         if "headers" in kwargs:
-            kwargs["headers"].update(headers)
+            kwargs["headers"] = {**kwargs["headers"], **self.auth_headers}
         else:
-            kwargs["headers"] = headers
-
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method, url, **kwargs) as response:
-                response_text = await response.text()
-                self.logger.info(
-                    f"API Response: url={url}, status={response.status}, response={response_text}",
-                    extra={'operation': 'API_REQUEST'}
+            # aiohttp копирует заголовки запроса, общий словарь не изменяется
+            kwargs["headers"] = self.auth_headers
+
+        session = self.session or await HTTPSessionManager.get_session()
+        async with session.request(method, url, **kwargs) as response:
+            if stream_image and response.status in [200, 201]:
+                return await self._read_streaming(url, response)
+
+            response_text = await response.text()
+            # В лог идет разобранный ответ, как и при потоковом чтении; если это не JSON — строка
+            try:
+                payload = json.loads(response_text)
+                parsed = True
+            except json.JSONDecodeError:
+                payload = response_text
+                parsed = False
+            self.logger.info(
+                f"API Response: url={url}, status={response.status}, "
+                f"response={summarize_payload(payload, full=LOG_FULL_PAYLOADS)}",
+                extra={'operation': 'API_REQUEST'}
+            )
+            
+            # Проверяем статус ответа
+            if response.status == 401:
+                self.logger.error(
+                    "Ошибка авторизации: неверные ключи API",
+                    extra={'operation': 'AUTH_ERROR'}
                 )
-                
-                # Проверяем статус ответа
-                if response.status == 401:
-                    self.logger.error(
-                        "Ошибка авторизации: неверные ключи API",
-                        extra={'operation': 'AUTH_ERROR'}
-                    )
-                    raise Exception("Ошибка авторизации. Проверьте правильность ключей API.")
-                elif response.status == 403:
-                    raise Exception("Доступ запрещен. Проверьте права доступа.")
-                elif response.status == 429:
-                    raise Exception("Превышен лимит запросов. Пожалуйста, подождите немного.")
-                elif response.status >= 500:
-                    raise Exception("Сервер временно недоступен. Попробуйте позже.")
-                elif response.status not in [200, 201]:  # Добавляем 201 как допустимый статус
-                    raise Exception(f"Ошибка API: {response.status}")
-                
-                try:
-                    return json.loads(response_text)
-                except json.JSONDecodeError:
-                    raise Exception("Некорректный ответ от сервера")
+                raise APIError("Ошибка авторизации. Проверьте правильность ключей API.", response.status)
+            elif response.status == 403:
+                raise APIError("Доступ запрещен. Проверьте права доступа.", response.status)
+            elif response.status == 451:
+                raise CensorshipError("Запрос не прошел модерацию. Измените описание.")
+            elif response.status == 429:
+                raise RateLimitError(
+                    "Превышен лимит запросов. Пожалуйста, подождите немного.",
+                    retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                )
+            elif response.status >= 500:
+                raise TransientAPIError("Сервер временно недоступен. Попробуйте позже.", response.status)
+            elif response.status not in [200, 201]:  # Добавляем 201 как допустимый статус
+                raise APIError(f"Ошибка API: {response.status}", response.status)
+            
+            if not parsed:
+                raise Exception("Некорректный ответ от сервера")
+            return payload
+
+    async def _read_streaming(self, url, response):
+        """Читает ответ частями: тело целиком и строка base64 в памяти не хранятся"""
+        decoder = StreamingImageDecoder()
+        async for chunk in response.content.iter_chunked(APIConstants.STREAM_CHUNK_SIZE):
+            decoder.feed(chunk)
+        try:
+            result = decoder.finish()
+        except ValueError:
+            raise Exception("Некорректный ответ от сервера")
+        self.logger.info(
+            f"API Response: url={url}, status={response.status}, "
+            f"response={summarize_payload(result, full=LOG_FULL_PAYLOADS)}",
+            extra={'operation': 'API_REQUEST'}
+        )
+        return result
 
     def _prepare_prompt(self, prompt: str) -> str:
         """Подготовка промпта: обрезка до максимальной длины"""
@@ -227,7 +303,7 @@ class Text2ImageAPI:
         """Получение списка доступных моделей"""
         self.logger.info("Запрос списка моделей", extra={'operation': 'GET_MODELS'})
         try:
-            response = await self._make_request('GET', f'{self.URL}/key/api/v1/models')
+            response = await self._make_request('GET', f'{self.URL}/key/api/v1/models', ENDPOINT_MODELS)
             if not response:
                 raise Exception("Не удалось получить список моделей")
             return response
@@ -236,6 +312,14 @@ class Text2ImageAPI:
                             extra={'operation': 'GET_MODELS_ERROR'})
             raise
 
+    async def get_default_model_id(self) -> int:
+        """Идентификатор модели по умолчанию из кэша списка моделей"""
+        return await self.model_registry.get_default_model_id(self)
+
+    def prefetch_models(self):
+        """Загружает список моделей в фоне, чтобы первая генерация не ждала его"""
+        self.model_registry.prefetch(self)
+
     async def generate(self, prompt: str, model_id: int, width: int = 1024, height: int = 1024) -> str:
         """Запуск генерации изображения"""
         self.logger.info(
@@ -256,15 +340,18 @@ class Text2ImageAPI:
             }
 
             # Создаем форму для отправки
-            form = aiohttp.FormData()
-            form.add_field('model_id', str(model_id))
-            form.add_field('params', json.dumps(params), content_type='application/json')
+            def build_form():
+                form = aiohttp.FormData()
+                form.add_field('model_id', str(model_id))
+                form.add_field('params', json.dumps(params), content_type='application/json')
+                return form
 
             # Отправляем запрос
             response = await self._make_request(
                 'POST',
                 f'{self.URL}/key/api/v1/text2image/run',
-                data=form
+                ENDPOINT_RUN,
+                form_factory=build_form
             )
 
             # Проверяем ответ
@@ -294,7 +381,7 @@ class Text2ImageAPI:
             url = f"{self.URL}/key/api/v1/text2image/status/{uuid}"
             self.logger.info(f"Проверка статуса генерации: uuid={uuid}", extra={'operation': 'CHECK_STATUS'})
             
-            response = await self._make_request("GET", url)
+            response = await self._make_request("GET", url, ENDPOINT_STATUS, stream_image=True, retry=False)
             
             if not response:
                 self.logger.error("Получен пустой ответ от сервера", extra={
@@ -312,7 +399,7 @@ class Text2ImageAPI:
             
             if status == "DONE":
                 images = response.get("images")
-                if not images:
+                if not response.get("image_data") and not images:
                     self.logger.error("Изображения отсутствуют в ответе", extra={
                         'operation': 'CHECK_STATUS_ERROR',
                         'uuid': uuid,
@@ -323,17 +410,17 @@ class Text2ImageAPI:
                 self.logger.info("Генерация завершена успешно", extra={
                     'operation': 'GENERATION_DONE',
                     'uuid': uuid,
-                    'images_count': len(images)
+                    'images_count': len(images) + (1 if response.get("image_data") else 0)
                 })
                 return response
                 
-            elif status in ["INITIAL", "PROCESSING"]:
+            elif status in IN_PROGRESS_STATUSES:
                 self.logger.info("Генерация все еще выполняется", extra={
                     'operation': 'GENERATION_IN_PROGRESS',
                     'uuid': uuid,
                     'status': status
                 })
-                raise Exception("Generation still in progress")
+                return response
                 
             elif status == "FAILED":
                 error = response.get("error", "Неизвестная ошибка")
@@ -352,6 +439,9 @@ class Text2ImageAPI:
                 })
                 raise Exception(f"Неизвестный статус генерации: {status}")
                 
+        except (RateLimitError, TransientAPIError, CircuitOpenError):
+            # Опрос будет повторен опросчиком позже, это не ошибка генерации
+            raise
         except Exception as e:
             self.logger.error(f"Ошибка при проверке статуса генерации: {str(e)}", extra={
                 'operation': 'CHECK_STATUS_ERROR',
@@ -643,105 +733,43 @@ IMAGE_STYLES = {
 
 # Состояния пользователя
 class UserState:
+    # __slots__: без __dict__ у каждого пользователя
+    __slots__ = ('width', 'height', 'awaiting_prompt', 'last_image_id', 'last_image_file_id', 'last_prompt')
+
     def __init__(self):
         self.width = ImageSize.DEFAULT_SIZE
         self.height = ImageSize.DEFAULT_SIZE
         self.awaiting_prompt = False
-        self.last_image = None  # Хранение последнего сгенерированного изображения
         self.last_image_id = None  # ID последнего изображения для callback
+        self.last_image_file_id = None  # file_id изображения в Telegram, байты скачиваются только при необходимости
         self.last_prompt = None  # Последний использованный промпт
 
-# Словарь для хранения пользовательских настроек
-class UserSettings:
-    def __init__(self):
-        self.width = ImageSize.DEFAULT_SIZE
-        self.height = ImageSize.DEFAULT_SIZE
-        self.style = StyleType.DEFAULT.name  # Стиль по умолчанию
-
-user_states = defaultdict(UserState)
-user_settings = defaultdict(UserSettings)
-
-# Добавляем класс для работы с изображениями
-class ImageProcessor:
-    """Класс для обработки изображений"""
-    MAX_SIZE = 1500
-    _model = None
-
-    @classmethod
-    def _get_model(cls):
-        """Получает или создает экземпляр модели"""
-        if cls._model is None:
-            cls._model = remove
-        return cls._model
-
-    @classmethod
-    def _resize_if_needed(cls, image: Image.Image) -> Image.Image:
-        """Уменьшает изображение, если оно слишком большое"""
-        width, height = image.size
-        if width > cls.MAX_SIZE or height > cls.MAX_SIZE:
-            # Вычисляем новый размер, сохраняя пропорции
-            if width > height:
-                new_width = cls.MAX_SIZE
-                new_height = int(height * (cls.MAX_SIZE / width))
-            else:
-                new_height = cls.MAX_SIZE
-                new_width = int(width * (cls.MAX_SIZE / height))
-            
-            logger.info(
-                f"Изменение размера изображения с {width}x{height} на {new_width}x{new_height}",
-                extra={'operation': 'RESIZE_IMAGE'}
-            )
-            return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        return image
-
-    @classmethod
-    def _restore_size(cls, image: Image.Image, original_size: tuple[int, int]) -> Image.Image:
-        """Возвращает изображение к исходному размеру"""
-        if image.size != original_size:
-            logger.info(
-                f"Восстановление исходного размера {original_size[0]}x{original_size[1]}",
-                extra={'operation': 'RESTORE_SIZE'}
-            )
-            return image.resize(original_size, Image.Resampling.LANCZOS)
-        return image
+# Состояния ограничены по памяти, последние изображения пользователей хранятся на диске (bootstrap())
+user_states: Optional[UserStateStore] = None
+# Настройки пользователей: кэш в памяти, сохраняются в хранилище (memory, sqlite или redis)
+user_settings = UserStateManager.settings
 
-    @classmethod
-    def remove_background(cls, image_data: bytes) -> bytes:
-        """Удаляет фон с изображения"""
-        try:
-            logger.info("Начало удаления фона", extra={'operation': 'REMOVE_BG_START'})
-            
-            # Загружаем изображение
-            image = Image.open(io.BytesIO(image_data))
-            original_size = image.size
-            
-            # Конвертируем в RGB, если нужно
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Изменяем размер, если нужно
-            image = cls._resize_if_needed(image)
-            
-            # Удаляем фон
-            model = cls._get_model()
-            image_without_bg = model(image)
-            
-            # Восстанавливаем исходный размер
-            if image.size != original_size:
-                image_without_bg = cls._restore_size(image_without_bg, original_size)
-            
-            # Сохраняем результат в bytes
-            output = io.BytesIO()
-            image_without_bg.save(output, format='PNG')
-            result = output.getvalue()
-            
-            logger.info("Фон успешно удален", extra={'operation': 'REMOVE_BG_SUCCESS'})
-            return result
-            
-        except Exception as e:
-            logger.error(f"Ошибка при удалении фона: {str(e)}", 
-                        extra={'operation': 'REMOVE_BG_ERROR'})
-            raise
+class SettingsMiddleware(BaseMiddleware):
+    """Загружает настройки пользователя из хранилища до вызова обработчика"""
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is not None:
+            await UserStateManager.load_settings(user.id)
+        return await handler(event, data)
+
+# Общий опросчик статусов всех генераций в работе
+generation_poller = GenerationPoller()
+
+# Одинаковые одновременные запросы разделяют одну генерацию FusionBrain
+generation_flights = SingleFlight()
+
+# Лимиты генераций, кэш готовых генераций и пул удаления фона настраиваются из окружения в bootstrap()
+generation_admission: Optional[AdmissionController] = None
+generation_cache: Optional[GenerationResultCache] = None
+bg_removal_pool: Optional[BackgroundRemovalPool] = None
+BG_PRELOAD = ImageProcessingConstants.BG_PRELOAD
+bg_preload_task: Optional[asyncio.Task] = None
 
 from aiogram.filters.callback_data import CallbackData as BaseCallbackData
 
@@ -979,9 +1007,12 @@ async def process_size_change(callback_query: CallbackQuery):
             )
             return
             
-        # Обновляем настройки пользователя
-        user_settings[user_id].width = IMAGE_SIZES[size_key]['width']
-        user_settings[user_id].height = IMAGE_SIZES[size_key]['height']
+        # Обновляем настройки пользователя (запись в хранилище выполняется в фоне)
+        UserStateManager.update_settings(
+            user_id,
+            width=IMAGE_SIZES[size_key]['width'],
+            height=IMAGE_SIZES[size_key]['height']
+        )
         
         logger.info("Размер изменен", extra={
             'user_id': user_id,
@@ -1016,7 +1047,7 @@ async def process_remove_background(callback_query: CallbackQuery):
         user_id = callback_query.from_user.id
         user_state = user_states[user_id]
 
-        if not user_state.last_image:
+        if not user_state.last_image_id:
             await callback_query.answer("Нет доступного изображения для обработки")
             return
 
@@ -1036,13 +1067,13 @@ async def process_remove_background(callback_query: CallbackQuery):
             # Засекаем время начала обработки
             start_time = datetime.now()
             
-            # Запускаем удаление фона в отдельном потоке
-            loop = asyncio.get_event_loop()
-            image_without_bg = await loop.run_in_executor(
-                None, 
-                ImageProcessor.remove_background,
-                user_state.last_image
-            )
+            # Получаем исходное изображение: с диска или из Telegram по file_id
+            last_image = await load_last_image(user_id)
+            if not last_image:
+                raise Exception("Изображение больше недоступно, сгенерируйте новое")
+
+            # Запускаем удаление фона в отдельном пуле обработчиков
+            image_without_bg = await bg_removal_pool.remove_background(last_image)
             
             # Вычисляем время обработки
             processing_time = (datetime.now() - start_time).total_seconds()
@@ -1070,7 +1101,7 @@ async def process_remove_background(callback_query: CallbackQuery):
             await callback_query.message.answer_photo(
                 BufferedInputFile(
                     image_without_bg,
-                    filename=f"nobg_{user_state.last_image_id}.png"
+                    filename=f"nobg_{user_state.last_image_id}.{ImageProcessor.OUTPUT_FORMAT.lower()}"
                 ),
                 caption=message_text,
                 reply_markup=get_image_keyboard(user_state.last_image_id, user_id),
@@ -1252,8 +1283,8 @@ async def process_style_change(callback_query: CallbackQuery):
             await callback_query.answer("Ошибка: неверный стиль")
             return
         
-        # Обновляем стиль в настройках пользователя
-        user_settings[user_id].style = style_key
+        # Обновляем стиль в настройках пользователя (запись в хранилище выполняется в фоне)
+        UserStateManager.update_settings(user_id, style=style_key)
         style_data = IMAGE_STYLES[style_key]
         
         # Формируем сообщение с информацией о новом стиле
@@ -1297,7 +1328,7 @@ async def process_style_change(callback_query: CallbackQuery):
         await callback_query.answer("Произошла ошибка при изменении стиля")
 
 @router.callback_query(F.data == CallbackEnum.REGENERATE)
-async def regenerate_image(callback_query: CallbackQuery):
+async def regenerate_image(callback_query: CallbackQuery, api: Text2ImageAPI):
     """Обработчик повторной генерации изображения"""
     user_id = callback_query.from_user.id
     user_state = user_states[user_id]
@@ -1319,6 +1350,15 @@ async def regenerate_image(callback_query: CallbackQuery):
             await callback_query.answer("Ошибка: невозможно выполнить регенерацию", show_alert=True)
             return
 
+        # Пока FusionBrain недоступен, отвечаем одним уведомлением без сообщения о генерации
+        if api.circuit_breaker.is_open:
+            logger.warning("Регенерация отклонена: FusionBrain недоступен", extra={
+                'user_id': user_id,
+                'operation': 'SERVICE_UNAVAILABLE'
+            })
+            await callback_query.answer(UNAVAILABLE_MESSAGE, show_alert=True)
+            return
+
         logger.info("Запуск повторной генерации", extra={
             'user_id': user_id,
             'operation': 'REGENERATION_START',
@@ -1332,24 +1372,6 @@ async def regenerate_image(callback_query: CallbackQuery):
             parse_mode=ParseMode.HTML
         )
 
-        # Проверяем наличие и валидность ключей API
-        api_key = os.getenv('FUSIONBRAIN_API_KEY')
-        secret_key = os.getenv('FUSIONBRAIN_SECRET_KEY')
-
-        if not api_key or not secret_key:
-            logger.error("Отсутствуют ключи API", extra={
-                'user_id': user_id,
-                'operation': 'MISSING_API_KEYS'
-            })
-            await status_message.edit_text(
-                "⚠️ Ошибка конфигурации: отсутствуют ключи API. Обратитесь к администратору.",
-                reply_markup=get_back_keyboard(user_id)
-            )
-            return
-
-        # Создаем экземпляр API
-        api = Text2ImageAPI(api_key, secret_key)
-        
         # Получаем настройки пользователя
         user_settings_data = user_settings[user_id]
         width = user_settings_data.width
@@ -1357,11 +1379,8 @@ async def regenerate_image(callback_query: CallbackQuery):
         style = user_settings_data.style
         
         try:
-            # Получаем доступные модели
-            models = await api.get_model()
-            if not models:
-                raise Exception("Список моделей пуст")
-            model_id = models[0]["id"]
+            # Получаем модель из кэша списка моделей
+            model_id = await api.get_default_model_id()
             
             logger.info("Получена модель", extra={
                 'user_id': user_id,
@@ -1373,12 +1392,13 @@ async def regenerate_image(callback_query: CallbackQuery):
             style_data = IMAGE_STYLES[style]
             styled_prompt = f"{style_data['prompt_prefix']}{user_state.last_prompt}"
             
-            # Запускаем генерацию
-            uuid = await api.generate(styled_prompt, model_id, width, height)
-            
-            # Проверяем статус генерации
-            await check_generation_status(api, uuid, status_message, user_id)
+            # Запускаем генерацию и ожидаем результат
+            await run_generation(
+                api, styled_prompt, model_id, width, height, status_message, user_id, force_fresh=True
+            )
 
+        except CircuitOpenError as e:
+            await show_service_unavailable(status_message, user_id, e)
         except Exception as e:
             error_msg = str(e)
             logger.error(f"Ошибка при генерации: {str(e)}", extra={
@@ -1389,9 +1409,7 @@ async def regenerate_image(callback_query: CallbackQuery):
             
             # Преобразуем технические ошибки в понятные пользователю сообщения
             user_message = str(e)
-            if "Generation still in progress" in str(e):
-                user_message = "Генерация все еще выполняется. Пожалуйста, подождите."
-            elif "Превышено время ожидания" in str(e):
+            if "Превышено время ожидания" in str(e):
                 user_message = "Генерация заняла слишком много времени. Попробуйте еще раз."
             elif "авторизации" in str(e).lower():
                 user_message = "Ошибка доступа к сервису. Обратитесь к администратору."
@@ -1419,7 +1437,7 @@ async def regenerate_image(callback_query: CallbackQuery):
         )
 
 @router.message(F.text)
-async def handle_text(message: types.Message):
+async def handle_text(message: types.Message, api: Text2ImageAPI):
     """Обработчик текстовых сообщений для генерации изображений"""
     user_id = message.from_user.id
     
@@ -1444,6 +1462,19 @@ async def handle_text(message: types.Message):
         )
         return
 
+    # Пока FusionBrain недоступен, отвечаем одним сообщением; ожидание промпта сохраняется
+    if api.circuit_breaker.is_open:
+        logger.warning("Генерация отклонена: FusionBrain недоступен", extra={
+            'user_id': user_id,
+            'operation': 'SERVICE_UNAVAILABLE'
+        })
+        await message.answer(
+            service_unavailable_text(api.circuit_breaker.retry_after),
+            reply_markup=get_back_keyboard(user_id),
+            parse_mode=ParseMode.HTML
+        )
+        return
+
     logger.info("Начало обработки промпта", extra={
         'user_id': user_id,
         'operation': 'PROMPT_PROCESSING',
@@ -1453,18 +1484,6 @@ async def handle_text(message: types.Message):
     # Сбрасываем флаг ожидания промпта
     user_state.awaiting_prompt = False
 
-    # Проверяем наличие ключей API
-    if not all([FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY]):
-        logger.error("Отсутствуют ключи API", extra={
-            'user_id': user_id,
-            'operation': 'MISSING_API_KEYS'
-        })
-        await message.answer(
-            "⚠️ Ошибка конфигурации: отсутствуют ключи API. Обратитесь к администратору.",
-            reply_markup=get_back_keyboard(user_id)
-        )
-        return
-
     # Проверяем длину промпта
     prompt = message.text
     if len(prompt) > Text2ImageAPI.MAX_PROMPT_LENGTH:
@@ -1497,9 +1516,6 @@ async def handle_text(message: types.Message):
     })
 
     try:
-        # Инициализируем API и запускаем генерацию
-        api = Text2ImageAPI(FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY)
-        
         # Получаем настройки пользователя
         user_settings_data = user_settings[user_id]
         width = user_settings_data.width
@@ -1507,11 +1523,8 @@ async def handle_text(message: types.Message):
         style = user_settings_data.style
         
         try:
-            # Получаем доступные модели
-            models = await api.get_model()
-            if not models:
-                raise Exception("Список моделей пуст")
-            model_id = models[0]["id"]
+            # Получаем модель из кэша списка моделей
+            model_id = await api.get_default_model_id()
             
             logger.info("Получена модель", extra={
                 'user_id': user_id,
@@ -1530,12 +1543,11 @@ async def handle_text(message: types.Message):
                 'styled_prompt': styled_prompt
             })
             
-            # Запускаем генерацию
-            uuid = await api.generate(styled_prompt, model_id, width, height)
-            
-            # Проверяем статус генерации
-            await check_generation_status(api, uuid, status_message, user_id)
+            # Запускаем генерацию и ожидаем результат
+            await run_generation(api, styled_prompt, model_id, width, height, status_message, user_id)
 
+        except CircuitOpenError as e:
+            await show_service_unavailable(status_message, user_id, e)
         except Exception as e:
             logger.error(f"Ошибка при генерации: {str(e)}", extra={
                 'user_id': user_id,
@@ -1545,9 +1557,7 @@ async def handle_text(message: types.Message):
             
             # Преобразуем технические ошибки в понятные пользователю сообщения
             user_message = str(e)
-            if "Generation still in progress" in str(e):
-                user_message = "Генерация все еще выполняется. Пожалуйста, подождите."
-            elif "Превышено время ожидания" in str(e):
+            if "Превышено время ожидания" in str(e):
                 user_message = "Генерация заняла слишком много времени. Попробуйте еще раз."
             elif "авторизации" in str(e).lower():
                 user_message = "Ошибка доступа к сервису. Обратитесь к администратору."
@@ -1581,472 +1591,247 @@ async def handle_text(message: types.Message):
                 parse_mode=ParseMode.HTML
             )
 
-async def generate_image_with_prompt(message: types.Message, prompt: str):
-    user_id = message.from_user.id
-    user_state = user_states[user_id]
-    
-    # Сохраняем промпт перед генерацией
-    user_state.last_prompt = prompt
-    
-    try:
-        # Отправляем сообщение о начале генерации
-        status_message = await message.answer(
-            MessageTemplate.get(MessageKey.GENERATING, style=IMAGE_STYLES[user_settings[user_id].style]['label']),
-            reply_markup=get_back_keyboard(user_id),
-            parse_mode=ParseMode.HTML
-        )
-
-        # Проверяем наличие и валидность ключей API
-        api_key = os.getenv('FUSIONBRAIN_API_KEY')
-        secret_key = os.getenv('FUSIONBRAIN_SECRET_KEY')
-
-        # Проверяем наличие ключей API
-        if not all([api_key, secret_key]):
-            logger.error("Отсутствуют ключи API", extra={
-                'user_id': user_id,
-                'operation': 'MISSING_API_KEYS'
-            })
-            await message.answer(
-                MessageTemplate.get(MessageKey.ERROR, error_message="Отсутствуют ключи API. Обратитесь к администратору."),
-                reply_markup=get_back_keyboard(user_id),
-                parse_mode=ParseMode.HTML
-            )
-            return
-
-        # Инициализируем API и запускаем генерацию
-        api = Text2ImageAPI(api_key, secret_key)
-        
-        width = user_settings[user_id].width
-        height = user_settings[user_id].height
-        style = user_settings[user_id].style
-        
-        logger.info(f"Параметры генерации", extra={
+async def generate_and_wait(api, styled_prompt, model_id, width, height):
+    """Запускает генерацию и ожидает ее завершения, возвращает (uuid, ответ API)"""
+    uuid = await api.generate(styled_prompt, model_id, width, height)
+    response = await generation_poller.wait(api, uuid)
+    return uuid, response
+
+def get_photo_file_id(message) -> Optional[str]:
+    """Возвращает file_id самого большого варианта фото из отправленного сообщения"""
+    if isinstance(message, types.Message) and message.photo:
+        return message.photo[-1].file_id
+    return None
+
+async def load_last_image(user_id: int) -> Optional[bytes]:
+    """Возвращает последнее изображение пользователя, по file_id оно скачивается только сейчас"""
+    image_data = await user_states.load_image(user_id)
+    file_id = user_states[user_id].last_image_file_id
+    if image_data is None and file_id:
+        logger.info("Загрузка изображения из Telegram по file_id", extra={
             'user_id': user_id,
-            'operation': 'GENERATION_PARAMS',
-            'width': width,
-            'height': height,
-            'style': style
+            'operation': 'IMAGE_DOWNLOAD'
         })
+        buffer = await bot.download(file_id)
+        image_data = buffer.read() if buffer else None
+    return image_data
 
-        # Получаем модель
-        try:
-            models = await api.get_model()
-            if not models:
-                raise Exception("Список моделей пуст")
-            model_id = models[0]["id"]
-            
-            logger.info(f"Получена модель", extra={
-                'user_id': user_id,
-                'operation': 'MODEL_INFO',
-                'model_id': model_id
-            })
-            
-        except Exception as e:
-            logger.error(f"Ошибка при получении модели: {str(e)}", extra={
-                'user_id': user_id,
-                'operation': 'MODEL_ERROR'
-            })
-            raise Exception("Не удалось получить доступ к модели генерации. Попробуйте позже.")
-        
-        # Формируем промпт с учетом стиля
-        styled_prompt = f"{prompt}, {IMAGE_STYLES[style]['prompt_prefix']}" if style != StyleType.DEFAULT.name else prompt
-        
-        # Запускаем генерацию
-        start_time = datetime.now()  # Засекаем время начала генерации
-        uuid = await api.generate(styled_prompt, model_id, width, height)
-        
-        # Проверяем статус генерации
-        await check_generation_status(api, uuid, status_message, user_id, start_time)
+async def send_cached_generation(cached, status_message, user_id):
+    """Отправляет изображение из кэша генераций без обращения к FusionBrain"""
+    image_info = replace(cached.image_info, user_id=user_id, prompt=user_states[user_id].last_prompt)
 
-    except Exception as e:
-        logger.error(f"Ошибка при генерации: {str(e)}", extra={
-            'user_id': user_id,
-            'operation': 'GENERATION_ERROR'
-        })
-        
-        # Преобразуем технические ошибки в понятные пользователю сообщения
-        user_message = str(e)
-        if "Generation still in progress" in str(e):
-            user_message = "Генерация все еще выполняется. Пожалуйста, подождите."
-        elif "Превышено время ожидания" in str(e):
-            user_message = "Генерация заняла слишком много времени. Попробуйте еще раз."
-        elif "авторизации" in str(e).lower():
-            user_message = "Ошибка доступа к сервису. Обратитесь к администратору."
-        elif "модели" in str(e).lower():
-            user_message = "Сервис временно недоступен. Попробуйте позже."
-        elif "Изображение не было сгенерировано" in str(e):
-            user_message = "Не удалось сгенерировать изображение. Попробуйте другой промпт или стиль."
-        
-        await status_message.edit_text(
-            MessageTemplate.get(MessageKey.ERROR_GEN, error=user_message),
-            reply_markup=get_back_keyboard(user_id),
-            parse_mode=ParseMode.HTML
-        )
-        
-async def generate_image(message: types.Message):
-    """Генерирует изображение на основе промпта"""
-    try:
-        user_id = message.from_user.id
-        logger.info("Получен запрос на генерацию изображения", extra={
-            'user_id': user_id,
-            'operation': 'IMAGE_GENERATION_START',
-            'prompt': message.text
-        })
-        
-        if not message.text:
-            logger.warning("Получено не текстовое сообщение", extra={
-                'user_id': user_id,
-                'operation': 'INVALID_MESSAGE_TYPE'
-            })
-            return
+    logger.info("Изображение найдено в кэше генераций", extra={
+        'user_id': user_id,
+        'operation': 'GENERATION_CACHE_HIT',
+        'uuid': image_info.id
+    })
 
-        if not user_states[user_id].awaiting_prompt:
-            logger.warning("Получен промпт без ожидания", extra={
-                'user_id': user_id,
-                'operation': 'UNEXPECTED_PROMPT',
-                'prompt': message.text,
-                'awaiting_prompt': user_states[user_id].awaiting_prompt
-            })
-            await message.answer(
-                "Для генерации изображения нажмите кнопку 'Создать' и введите описание изображения.",
-                reply_markup=get_main_keyboard(user_id)
-            )
-            return
+    # Уже загруженное в Telegram изображение отправляется по file_id без повторной загрузки
+    photo = cached.file_id or BufferedInputFile(
+        cached.image_data,
+        filename=f"generation_{image_info.id}.png"
+    )
+    sent = await status_message.answer_photo(
+        photo,
+        caption=MessageTemplate.get_image_info(image_info),
+        reply_markup=get_image_keyboard(image_info.id, user_id),
+        parse_mode=ParseMode.HTML
+    )
+    await status_message.delete()
 
-        logger.info("Получен промпт для генерации", extra={
-            'user_id': user_id,
-            'operation': 'PROMPT_RECEIVED',
-            'prompt': message.text
-        })
+    # Сохраняем информацию о последнем изображении
+    file_id = get_photo_file_id(sent)
+    await user_states.save_image(user_id, cached.image_data, image_info.id, file_id=file_id)
+    return True
 
-        # Сбрасываем флаг ожидания промпта
-        user_states[user_id].awaiting_prompt = False
+def service_unavailable_text(retry_after: float) -> str:
+    """Текст ответа, пока FusionBrain недоступен"""
+    return MessageTemplate.get(MessageKey.SERVICE_UNAVAILABLE, retry_after=max(1, round(retry_after)))
 
-        # Проверяем наличие ключей API
-        if not all([FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY]):
-            logger.error("Отсутствуют ключи API", extra={
-                'user_id': user_id,
-                'operation': 'MISSING_API_KEYS'
-            })
-            await message.answer(
-                "⚠️ Ошибка конфигурации: отсутствуют ключи API. Обратитесь к администратору.",
-                reply_markup=get_back_keyboard(user_id)
-            )
-            return
+async def show_service_unavailable(status_message, user_id, error: CircuitOpenError):
+    """Сообщает пользователю, что FusionBrain временно недоступен"""
+    logger.warning("Генерация отклонена: FusionBrain недоступен", extra={
+        'user_id': user_id,
+        'operation': 'SERVICE_UNAVAILABLE'
+    })
+    await status_message.edit_text(
+        service_unavailable_text(error.retry_after),
+        reply_markup=get_back_keyboard(user_id),
+        parse_mode=ParseMode.HTML
+    )
 
-        # Проверяем длину промпта
-        prompt = message.text
-        if len(prompt) > Text2ImageAPI.MAX_PROMPT_LENGTH:
-            logger.warning(f"Промпт превышает максимальную длину: {len(prompt)}", extra={
-                'user_id': user_id,
-                'operation': 'PROMPT_TOO_LONG',
-                'prompt_length': len(prompt)
-            })
-            prompt = prompt[:Text2ImageAPI.MAX_PROMPT_LENGTH]
-            await message.answer(
-                f"⚠️ Ваш промпт слишком длинный и был сокращен до {Text2ImageAPI.MAX_PROMPT_LENGTH} символов.",
-                reply_markup=None
-            )
+async def run_generation(api, styled_prompt, model_id, width, height, status_message, user_id,
+                         start_time=None, force_fresh=False):
+    """Генерирует изображение; одинаковые одновременные запросы получают результат одной генерации"""
+    key = make_generation_key(styled_prompt, model_id, width, height)
+    # force_fresh: повторная генерация должна дать новое изображение, а не результат из кэша
+    if not force_fresh:
+        cached = generation_cache.get(key)
+        if cached is not None:
+            return await send_cached_generation(cached, status_message, user_id)
+    # Пока FusionBrain недоступен, пользователь получает ответ сразу, без ожидания в очереди
+    breaker = api.circuit_breaker
+    if breaker.is_open:
+        raise CircuitOpenError("Сервис генерации временно недоступен", breaker.retry_after)
+
+    async def show_queue_position(position):
+        # 0 — очередь пройдена, генерация началась
+        if position:
+            text = MessageTemplate.get(MessageKey.QUEUED, position=position)
+        else:
+            text = MessageTemplate.get(MessageKey.GENERATING, style=IMAGE_STYLES[user_settings[user_id].style]['label'])
+        await status_message.edit_text(text, reply_markup=get_back_keyboard(user_id), parse_mode=ParseMode.HTML)
+
+    leader = False
+
+    async def generate_in_slot():
+        nonlocal leader
+        # Выполняется только у первого из одинаковых запросов — он и сохраняет результат в кэш
+        leader = True
+        # Место в общей очереди занимает только запрос, который действительно обращается к FusionBrain
+        async with generation_admission.slot(show_queue_position):
+            return await generate_and_wait(api, styled_prompt, model_id, width, height)
+
+    async with generation_admission.admit(user_id):
+        uuid, response = await generation_flights.do(key, generate_in_slot)
+        return await check_generation_status(
+            api, uuid, status_message, user_id, start_time, response=response,
+            cache_key=key if leader else None
+        )
 
-        # Сохраняем промпт
-        user_state = user_states[user_id]
-        user_state.last_prompt = prompt
+async def send_generated_image(image_data, uuid, status_message, user_id, start_time=None, cache_key=None,
+                               replace_status=True):
+    """Отправляет готовое изображение и запоминает его у пользователя и в кэше генераций
 
-        # Отправляем сообщение о начале генерации
-        status_message = await message.answer(
-            MessageTemplate.get(MessageKey.GENERATING, style=IMAGE_STYLES[user_settings[user_id].style]['label']),
-            reply_markup=get_back_keyboard(user_id),
+    replace_status=True — изображение заменяет сообщение о генерации, иначе отправляется новым сообщением.
+    """
+    logger.info("Изображение успешно сгенерировано", extra={
+        'user_id': user_id,
+        'operation': 'GENERATION_SUCCESS'
+    })
+
+    # Создаем объект с информацией об изображении
+    generation_time = (datetime.now() - start_time).total_seconds() if start_time else 0
+    settings = user_settings[user_id]
+    image_info = ImageInfo(
+        id=uuid,
+        prompt=user_states[user_id].last_prompt,
+        style=settings.style,
+        style_prompt=IMAGE_STYLES[settings.style]['prompt_prefix'],
+        width=settings.width,
+        height=settings.height,
+        model_id=IMAGE_STYLES[settings.style].get('model_id', 1),
+        created_at=datetime.now(),
+        generation_time=generation_time,
+        user_id=user_id
+    )
+
+    # Отправляем изображение пользователю с полной информацией
+    message_text = MessageTemplate.get_image_info(image_info)
+    photo = BufferedInputFile(image_data, filename=f"generation_{uuid}.png")
+    if replace_status:
+        sent = await status_message.edit_media(
+            media=types.InputMediaPhoto(media=photo, caption=message_text, parse_mode=ParseMode.HTML),
+            reply_markup=get_image_keyboard(uuid, user_id)
+        )
+    else:
+        sent = await status_message.answer_photo(
+            photo,
+            caption=message_text,
+            reply_markup=get_image_keyboard(uuid, user_id),
             parse_mode=ParseMode.HTML
         )
 
-        logger.info("Начало генерации изображения", extra={
+    # Сохраняем информацию о последнем изображении
+    file_id = get_photo_file_id(sent)
+    await user_states.save_image(user_id, image_data, uuid, file_id=file_id)
+
+    # Сохраняем результат для повторных запросов с теми же параметрами
+    if cache_key is not None:
+        generation_cache.put(cache_key, image_data, image_info, file_id=file_id)
+
+    return True
+
+async def check_generation_status(api, uuid, status_message, user_id, start_time=None, response=None, cache_key=None):
+    try:
+        # Ожидаем завершения генерации в общем цикле опроса, если ответ еще не получен
+        if response is None:
+            response = await generation_poller.wait(api, uuid)
+        
+        logger.info("Получен ответ от API", extra={
             'user_id': user_id,
-            'operation': 'GENERATION_START',
-            'prompt': prompt
+            'operation': 'API_RESPONSE',
+            'response': summarize_payload(response, full=LOG_FULL_PAYLOADS)
         })
-
-        try:
-            # Инициализируем API и запускаем генерацию
-            api = Text2ImageAPI(FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY)
+        
+        if isinstance(response, list) and response:
+            # Если ответ - список с изображением
+            return await send_generated_image(
+                base64.b64decode(response[0]), uuid, status_message, user_id, start_time,
+                cache_key=cache_key, replace_status=False
+            )
             
-            # Получаем настройки пользователя
-            user_settings_data = user_settings[user_id]
-            width = user_settings_data.width
-            height = user_settings_data.height
-            style = user_settings_data.style
+        elif isinstance(response, dict):
+            # Если ответ - словарь со статусом
+            status = response.get('status')
             
-            logger.info("Параметры генерации", extra={
-                'user_id': user_id,
-                'operation': 'GENERATION_PARAMS',
-                'width': width,
-                'height': height,
-                'style': style
-            })
-
-            # Получаем модель
-            try:
-                models = await api.get_model()
-                if not models:
-                    raise Exception("Список моделей пуст")
-                model_id = models[0]["id"]
+            if status == "DONE":
+                # Изображение уже декодировано при потоковом чтении ответа
+                image_data = response.get('image_data')
+                images = response.get('images')
+                if not image_data and not images:
+                    raise Exception("Изображение не было сгенерировано")
+                if not image_data:
+                    image_data = base64.b64decode(images[0])
+                return await send_generated_image(
+                    image_data, uuid, status_message, user_id, start_time, cache_key=cache_key
+                )
                 
-                logger.info("Получена модель", extra={
+            elif status == "FAILED":
+                error = response.get('error', 'Неизвестная ошибка')
+                logger.error(f"Генерация не удалась: {error}", extra={
                     'user_id': user_id,
-                    'operation': 'MODEL_INFO',
-                    'model_id': model_id
+                    'operation': 'GENERATION_FAILED',
+                    'uuid': uuid,
+                    'error': error
                 })
+                await status_message.edit_text(
+                    MessageTemplate.get(MessageKey.ERROR_GEN, error=error),
+                    reply_markup=get_back_keyboard(user_id),
+                    parse_mode=ParseMode.HTML
+                )
+                return False
                 
-            except Exception as e:
-                logger.error(f"Ошибка при получении модели: {str(e)}", extra={
+            else:
+                logger.error(f"Получен неизвестный статус: {response['status']}", extra={
                     'user_id': user_id,
-                    'operation': 'MODEL_ERROR'
+                    'operation': 'UNKNOWN_STATUS',
+                    'uuid': uuid,
+                    'status': response['status']
                 })
-                raise Exception("Не удалось получить доступ к модели генерации. Попробуйте позже.")
-            
-            # Формируем промпт с учетом стиля
-            style_data = IMAGE_STYLES[style]
-            styled_prompt = f"{style_data['prompt_prefix']}{prompt}"
-            
-            logger.info("Подготовленный промпт", extra={
-                'user_id': user_id,
-                'operation': 'STYLED_PROMPT',
-                'original_prompt': prompt,
-                'styled_prompt': styled_prompt
-            })
-            
-            # Запускаем генерацию
-            uuid = await api.generate(styled_prompt, model_id, width, height)
-            
-            # Проверяем статус генерации
-            await check_generation_status(api, uuid, status_message, user_id)
-
-        except Exception as e:
-            logger.error(f"Ошибка при генерации: {str(e)}", extra={
-                'user_id': user_id,
-                'operation': 'GENERATION_ERROR',
-                'error': str(e)
-            })
-            
-            # Преобразуем технические ошибки в понятные пользователю сообщения
-            user_message = str(e)
-            if "Generation still in progress" in str(e):
-                user_message = "Генерация все еще выполняется. Пожалуйста, подождите."
-            elif "Превышено время ожидания" in str(e):
-                user_message = "Генерация заняла слишком много времени. Попробуйте еще раз."
-            elif "авторизации" in str(e).lower():
-                user_message = "Ошибка доступа к сервису. Обратитесь к администратору."
-            elif "модели" in str(e).lower():
-                user_message = "Сервис временно недоступен. Попробуйте позже."
-            elif "Изображение не было сгенерировано" in str(e):
-                user_message = "Не удалось сгенерировать изображение. Попробуйте другой промпт или стиль."
+                await status_message.edit_text(
+                    MessageTemplate.get(MessageKey.ERROR_GEN, error="Неизвестный статус генерации"),
+                    reply_markup=get_back_keyboard(user_id),
+                    parse_mode=ParseMode.HTML
+                )
+                return False
+                
             
-            await status_message.edit_text(
-                MessageTemplate.get(MessageKey.ERROR_GEN, error=user_message),
-                reply_markup=get_back_keyboard(user_id),
-                parse_mode=ParseMode.HTML
-            )
+        return False
             
-    except Exception as e:
-        logger.error(f"Критическая ошибка в generate_image: {str(e)}", extra={
-            'user_id': user_id if 'user_id' in locals() else 'N/A',
-            'operation': 'CRITICAL_ERROR',
-            'error': str(e)
-        })
-        if 'status_message' in locals():
-            await status_message.edit_text(
-                MessageTemplate.get(MessageKey.ERROR_CRITICAL),
-                reply_markup=get_back_keyboard(user_id)
-            )
-        else:
-            await message.answer(
-                MessageTemplate.get(MessageKey.ERROR_CRITICAL),
-                reply_markup=get_back_keyboard(user_id),
-                parse_mode=ParseMode.HTML
-            )
-
-async def check_generation_status(api, uuid, status_message, user_id, start_time=None):
-    try:
-        max_attempts = 60  # Максимальное количество попыток
-        attempt = 0
-        
-        while attempt < max_attempts:
-            try:
-                # Проверяем статус генерации
-                response = await api.check_generation(uuid)
-                
-                logger.info("Получен ответ от API", extra={
-                    'user_id': user_id,
-                    'operation': 'API_RESPONSE',
-                    'response': str(response)
-                })
-                
-                if isinstance(response, list) and response:
-                    # Если ответ - список с изображением
-                    logger.info("Изображение успешно сгенерировано", extra={
-                        'user_id': user_id,
-                        'operation': 'GENERATION_SUCCESS'
-                    })
-                    
-                    # Сохраняем изображение
-                    image_data = base64.b64decode(response[0])
-                    
-                    # Создаем объект с информацией об изображении
-                    generation_time = (datetime.now() - start_time).total_seconds() if start_time else 0
-                    image_info = ImageInfo(
-                        id=uuid,
-                        prompt=user_states[user_id].last_prompt,
-                        style=user_settings[user_id].style,
-                        style_prompt=IMAGE_STYLES[user_settings[user_id].style]['prompt_prefix'],
-                        width=user_settings[user_id].width,
-                        height=user_settings[user_id].height,
-                        model_id=IMAGE_STYLES[user_settings[user_id].style].get('model_id', 1),
-                        created_at=datetime.now(),
-                        generation_time=generation_time,
-                        user_id=user_id
-                    )
-                    
-                    # Отправляем изображение пользователю с полной информацией
-                    message_text = MessageTemplate.get_image_info(image_info)
-                    
-                    if status_message.photo:
-                        await status_message.answer_photo(
-                            BufferedInputFile(
-                                image_data,
-                                filename=f"generation_{uuid}.png"
-                            ),
-                            caption=message_text,
-                            reply_markup=get_image_keyboard(uuid, user_id),
-                            parse_mode=ParseMode.HTML
-                        )
-                    else:
-                        await status_message.answer_photo(
-                            BufferedInputFile(
-                                image_data,
-                                filename=f"generation_{uuid}.png"
-                            ),
-                            caption=message_text,
-                            reply_markup=get_image_keyboard(uuid, user_id),
-                            parse_mode=ParseMode.HTML
-                        )
-                    
-                    # Сохраняем информацию о последнем изображении
-                    user_states[user_id].last_image = image_data
-                    user_states[user_id].last_image_id = uuid
-                    
-                    return True
-                    
-                elif isinstance(response, dict):
-                    # Если ответ - словарь со статусом
-                    status = response.get('status')
-                    
-                    if status == "DONE":
-                        images = response.get('images')
-                        if not images:
-                            raise Exception("Изображение не было сгенерировано")
-                            
-                        logger.info("Изображение успешно сгенерировано", extra={
-                            'user_id': user_id,
-                            'operation': 'GENERATION_SUCCESS'
-                        })
-                        
-                        # Сохраняем изображение
-                        image_data = base64.b64decode(images[0])
-                        
-                        # Создаем объект с информацией об изображении
-                        generation_time = (datetime.now() - start_time).total_seconds() if start_time else 0
-                        image_info = ImageInfo(
-                            id=uuid,
-                            prompt=user_states[user_id].last_prompt,
-                            style=user_settings[user_id].style,
-                            style_prompt=IMAGE_STYLES[user_settings[user_id].style]['prompt_prefix'],
-                            width=user_settings[user_id].width,
-                            height=user_settings[user_id].height,
-                            model_id=IMAGE_STYLES[user_settings[user_id].style].get('model_id', 1),
-                            created_at=datetime.now(),
-                            generation_time=generation_time,
-                            user_id=user_id
-                        )
-                        
-                        # Отправляем изображение пользователю с полной информацией
-                        message_text = MessageTemplate.get_image_info(image_info)
-                        
-                        await status_message.edit_media(
-                            media=types.InputMediaPhoto(
-                                media=BufferedInputFile(
-                                    image_data,
-                                    filename=f"{uuid}.png"
-                                ),
-                                caption=message_text,
-                                parse_mode=ParseMode.HTML
-                            ),
-                            reply_markup=get_image_keyboard(uuid, user_id)
-                        )
-                        
-                        # Сохраняем информацию о последнем изображении
-                        user_states[user_id].last_image = image_data
-                        user_states[user_id].last_image_id = uuid
-                        
-                        return True
-                        
-                    elif status in ["INITIAL", "PROCESSING"]:
-                        logger.info("Генерация все еще выполняется", extra={
-                            'user_id': user_id,
-                            'operation': 'GENERATION_IN_PROGRESS',
-                            'uuid': uuid,
-                            'status': status,
-                            'attempt': attempt
-                        })
-                        attempt += 1
-                        await asyncio.sleep(2)  # Ждем 2 секунды перед следующей попыткой
-                        continue
-                        
-                    elif status == "FAILED":
-                        error = response.get('error', 'Неизвестная ошибка')
-                        logger.error(f"Генерация не удалась: {error}", extra={
-                            'user_id': user_id,
-                            'operation': 'GENERATION_FAILED',
-                            'uuid': uuid,
-                            'error': error
-                        })
-                        await status_message.edit_text(
-                            MessageTemplate.get(MessageKey.ERROR_GEN, error=error),
-                            reply_markup=get_back_keyboard(user_id),
-                            parse_mode=ParseMode.HTML
-                        )
-                        return False
-                        
-                    else:
-                        logger.error(f"Получен неизвестный статус: {response['status']}", extra={
-                            'user_id': user_id,
-                            'operation': 'UNKNOWN_STATUS',
-                            'uuid': uuid,
-                            'status': response['status']
-                        })
-                        await status_message.edit_text(
-                            MessageTemplate.get(MessageKey.ERROR_GEN, error="Неизвестный статус генерации"),
-                            reply_markup=get_back_keyboard(user_id),
-                            parse_mode=ParseMode.HTML
-                        )
-                        return False
-                        
-            except Exception as e:
-                if str(e) != "Generation still in progress":
-                    raise e
-                
-        # Если превышено максимальное количество попыток
+    except GenerationTimeoutError as e:
         logger.error("Превышено время ожидания генерации", extra={
             'user_id': user_id,
             'operation': 'GENERATION_TIMEOUT',
-            'uuid': uuid,
-            'max_attempts': max_attempts
+            'uuid': uuid
         })
         await status_message.edit_text(
-            MessageTemplate.get(MessageKey.ERROR_GEN, error="Превышено время ожидания генерации"),
+            MessageTemplate.get(MessageKey.ERROR_GEN, error=str(e)),
             reply_markup=get_back_keyboard(user_id),
             parse_mode=ParseMode.HTML
         )
         return False
-            
+
     except Exception as e:
         logger.error(f"Ошибка при проверке статуса генерации: {str(e)}", extra={
             'user_id': user_id,
@@ -2061,6 +1846,114 @@ async def check_generation_status(api, uuid, status_message, user_id, start_time
         )
         return False
 
+async def preload_background_removal():
+    """Запускает обработчики удаления фона, каждый загружает модель один раз"""
+    started = time.monotonic()
+    try:
+        await bg_removal_pool.start()
+        logger.info(
+            f"Модель удаления фона загружена за {time.monotonic() - started:.1f} сек",
+            extra={'operation': 'BG_PRELOAD'}
+        )
+    except Exception as e:
+        logger.error(f"Не удалось запустить пул удаления фона: {str(e)}", extra={'operation': 'BG_POOL_START_ERROR'})
+
+async def on_startup():
+    """Вызывается перед началом получения обновлений"""
+    global bg_preload_task
+    logger.info(
+        f"Бот готов к работе через {time.monotonic() - STARTUP_STARTED_AT:.2f} сек после запуска",
+        extra={'operation': 'STARTUP_READY'}
+    )
+    # Без предзагрузки модель загрузится при первом запросе на удаление фона
+    if BG_PRELOAD:
+        bg_preload_task = asyncio.create_task(preload_background_removal())
+
+def bootstrap():
+    """Загружает конфигурацию, настраивает логи и создает объекты бота
+
+    Вызывается только при запуске main.py: обработчики пула удаления фона (spawn)
+    импортируют этот модуль заново и не должны повторять запуск.
+    """
+    global root_queue_logging, main_queue_logging, LOG_FULL_PAYLOADS
+    global API_TOKEN, FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY, bot, dp, user_states
+    global generation_admission, generation_cache, bg_removal_pool, BG_PRELOAD
+
+    setup_logging()
+
+    # Загрузка переменных окружения из файла .env
+    load_dotenv()
+
+    # Обработчики логов работают в фоновых потоках: запись на диск не блокирует цикл событий
+    root_queue_logging = QueueLogging(logging.getLogger(), int(os.getenv('LOG_QUEUE_SIZE', LoggingConstants.QUEUE_SIZE)))
+    main_queue_logging = QueueLogging(logger, int(os.getenv('LOG_QUEUE_SIZE', LoggingConstants.QUEUE_SIZE)))
+    root_queue_logging.start()
+    main_queue_logging.start()
+
+    # Полные ответы API в логе нужны только для отладки
+    LOG_FULL_PAYLOADS = os.getenv('LOG_FULL_PAYLOADS', 'false').lower() in ('1', 'true', 'yes')
+
+    # Конфигурация
+    API_TOKEN = os.getenv('API_TOKEN')
+    FUSIONBRAIN_API_KEY = os.getenv('FUSIONBRAIN_API_KEY')
+    FUSIONBRAIN_SECRET_KEY = os.getenv('FUSIONBRAIN_SECRET_KEY')
+
+    # Проверяем наличие всех необходимых переменных окружения
+    if not all([API_TOKEN, FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY]):
+        logger.error("Не все необходимые переменные окружения установлены!")
+        if not API_TOKEN:
+            logger.error("Отсутствует API_TOKEN")
+        if not FUSIONBRAIN_API_KEY:
+            logger.error("Отсутствует FUSIONBRAIN_API_KEY")
+        if not FUSIONBRAIN_SECRET_KEY:
+            logger.error("Отсутствует FUSIONBRAIN_SECRET_KEY")
+        sys.exit(1)
+
+    # Проверяем формат ключей
+    if any([' ' in key for key in [FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY]]):
+        logger.error("API ключи не должны содержать пробелов!")
+        sys.exit(1)
+
+    if any(['"' in key or "'" in key for key in [FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY]]):
+        logger.error("API ключи не должны содержать кавычек!")
+        sys.exit(1)
+
+    logger.info("Конфигурация загружена успешно")
+    logger.debug(f"API Key length: {len(FUSIONBRAIN_API_KEY)}, Secret Key length: {len(FUSIONBRAIN_SECRET_KEY)}")
+
+    # Инициализация бота и диспетчера
+    bot = Bot(token=API_TOKEN, parse_mode=ParseMode.HTML)
+    dp = Dispatcher()
+
+    # Состояния ограничены по памяти, последние изображения пользователей хранятся на диске
+    user_states = UserStateStore(
+        UserState,
+        blob_store=DiskCache(
+            os.getenv('USER_IMAGES_DIR', UserStateConstants.IMAGES_DIR),
+            UserStateConstants.IMAGES_MAX_BYTES
+        )
+    )
+
+    # Лимит генераций на пользователя и общий лимит по квоте FusionBrain с очередью FIFO
+    generation_admission = AdmissionController(
+        max_concurrent=int(os.getenv('GENERATION_MAX_CONCURRENT', AdmissionConstants.MAX_CONCURRENT)),
+        per_user=int(os.getenv('GENERATION_PER_USER', AdmissionConstants.PER_USER))
+    )
+
+    # Кэш готовых генераций: популярные запросы отдаются без обращения к FusionBrain
+    generation_cache = GenerationResultCache(
+        ttl=int(os.getenv('GENERATION_CACHE_TTL', GenerationCacheConstants.TTL))
+    )
+
+    # Отдельный пул обработчиков для удаления фона
+    bg_removal_pool = BackgroundRemovalPool(
+        workers=int(os.getenv('BG_REMOVAL_WORKERS', ImageProcessingConstants.BG_WORKERS)),
+        use_processes=os.getenv('BG_REMOVAL_EXECUTOR', 'process') == 'process'
+    )
+
+    # Загрузка модели удаления фона после старта бота (BG_PRELOAD=false — при первом запросе)
+    BG_PRELOAD = os.getenv('BG_PRELOAD', str(ImageProcessingConstants.BG_PRELOAD)).lower() in ('1', 'true', 'yes')
+
 async def main():
     """Запуск бота"""
     logger.info("Запуск бота", extra={'operation': 'STARTUP'})
@@ -2082,12 +1975,47 @@ async def main():
     
     # Добавляем роутер в диспетчер
     dp.include_router(router)
+
+    # Подключаем хранилище настроек и загрузку настроек перед обработчиками
+    UserStateManager.configure(create_storage(
+        os.getenv('STORAGE_BACKEND', StorageConstants.BACKEND),
+        sqlite_path=os.getenv('STORAGE_SQLITE_PATH', StorageConstants.SQLITE_PATH),
+        redis_url=os.getenv('REDIS_URL', StorageConstants.REDIS_URL)
+    ))
+    dp.update.middleware(SettingsMiddleware())
+    # Неактивные пользователи удаляются в фоне, даже если новых обращений нет
+    user_states.start_expiry()
+    
+    # Единственный клиент FusionBrain: обработчики получают его через аргумент api
+    api = Text2ImageAPI(FUSIONBRAIN_API_KEY, FUSIONBRAIN_SECRET_KEY, session=await HTTPSessionManager.get_session())
+    # Заранее загружаем список моделей, чтобы первая генерация не ждала его
+    api.prefetch_models()
+    
+    # Запускаем общий цикл опроса статусов генераций
+    generation_poller.start()
+    
+    # Отчет о готовности и фоновая загрузка модели — когда бот уже принимает обновления
+    dp.startup.register(on_startup)
     
     try:
-        await dp.start_polling(bot)
+        await dp.start_polling(bot, api=api)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {str(e)}", extra={'operation': 'STARTUP_ERROR'})
         sys.exit(1)
+    finally:
+        # Останавливаем опрос генераций и закрываем общую HTTP-сессию FusionBrain
+        if bg_preload_task is not None and not bg_preload_task.done():
+            bg_preload_task.cancel()
+        await generation_poller.stop()
+        await user_states.stop_expiry()
+        await HTTPSessionManager.close()
+        bg_removal_pool.shutdown()
+        # Сохраняем отложенные изменения настроек
+        await UserStateManager.shutdown()
+        # Дописываем накопленные записи логов
+        main_queue_logging.stop()
+        root_queue_logging.stop()
 
 if __name__ == '__main__':
+    bootstrap()
     asyncio.run(main())
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+
+from ..constants.bot_constants import AdmissionConstants
+
+logger = logging.getLogger(__name__)
+
+# Получает позицию в очереди (1 — следующий) или 0, когда генерация началась после ожидания
+PositionCallback = Callable[[int], Awaitable[None]]
+
+class AdmissionRejectedError(Exception):
+    """Запрос на генерацию не принят: превышен лимит пользователя или переполнена очередь"""
+    pass
+
+@dataclass
+class _Waiter:
+    """Запрос, ожидающий свободного места"""
+    future: asyncio.Future
+    on_position: Optional[PositionCallback]
+    position: int = 0
+    shown: int = 0  # Последняя позиция, о которой сообщили пользователю
+    shown_at: float = 0.0
+    task: Optional[asyncio.Task] = None  # Выполняемое уведомление о позиции
+
+class AdmissionController:
+    """Ограничивает одновременные генерации: лимит на пользователя и общий лимит с очередью FIFO"""
+
+    def __init__(self, max_concurrent: int = AdmissionConstants.MAX_CONCURRENT,
+                 per_user: int = AdmissionConstants.PER_USER,
+                 max_queue: int = AdmissionConstants.MAX_QUEUE,
+                 position_exact: int = AdmissionConstants.POSITION_EXACT,
+                 position_interval: float = AdmissionConstants.POSITION_UPDATE_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.max_queue = max_queue
+        self.position_exact = position_exact
+        self.position_interval = position_interval
+        self.clock = clock
+        self._active = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._per_user: Dict[int, int] = {}
+        self._notify_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def active(self) -> int:
+        """Количество выполняемых генераций"""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """Количество генераций в очереди"""
+        return len(self._waiters)
+
+    def user_in_flight(self, user_id: int) -> int:
+        """Количество генераций пользователя в работе и в очереди"""
+        return self._per_user.get(user_id, 0)
+
+    @asynccontextmanager
+    async def admit(self, user_id: int):
+        """Учитывает генерацию пользователя; сверх лимита запрос отклоняется сразу"""
+        in_flight = self._per_user.get(user_id, 0)
+        if in_flight >= self.per_user:
+            logger.warning(f"Превышен лимит генераций пользователя: {in_flight}/{self.per_user}", extra={
+                'user_id': user_id,
+                'operation': 'ADMISSION_USER_LIMIT'
+            })
+            raise AdmissionRejectedError(
+                "У вас уже выполняется генерация. Дождитесь результата и попробуйте снова."
+            )
+        self._per_user[user_id] = in_flight + 1
+        try:
+            yield
+        finally:
+            remaining = self._per_user.get(user_id, 1) - 1
+            if remaining > 0:
+                self._per_user[user_id] = remaining
+            else:
+                self._per_user.pop(user_id, None)
+
+    @asynccontextmanager
+    async def slot(self, on_position: Optional[PositionCallback] = None):
+        """Занимает общее место на время генерации, при нехватке мест ждет в очереди"""
+        await self.acquire(on_position)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, on_position: Optional[PositionCallback] = None):
+        """Занимает место; очередь обслуживается строго по порядку поступления"""
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            logger.warning(f"Очередь генераций переполнена: {len(self._waiters)}/{self.max_queue}", extra={
+                'operation': 'ADMISSION_QUEUE_FULL'
+            })
+            raise AdmissionRejectedError("Сервис перегружен. Попробуйте через несколько минут.")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), on_position)
+        self._waiters.append(waiter)
+        self._update_positions()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Место уже было передано этому запросу — возвращаем его следующему
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+                self._update_positions()
+            raise
+        try:
+            await self._announce_start(waiter)
+        except asyncio.CancelledError:
+            self.release()
+            raise
+
+    def release(self):
+        """Освобождает место и передает его первому в очереди"""
+        self._active -= 1
+        while self._waiters and self._active < self.max_concurrent:
+            waiter = self._waiters.popleft()
+            if waiter.future.done():
+                continue
+            self._active += 1
+            waiter.future.set_result(None)
+        self._update_positions()
+
+    def _update_positions(self):
+        """Сообщает ожидающим их новые позиции"""
+        for position, waiter in enumerate(self._waiters, start=1):
+            if waiter.position != position:
+                waiter.position = position
+                self._notify(waiter, position)
+
+    def _should_notify(self, waiter: _Waiter, position: int) -> bool:
+        """Ограничивает частоту уведомлений: каждое — это редактирование сообщения в Telegram"""
+        if waiter.on_position is None or position == waiter.shown:
+            return False
+        if waiter.task is not None and not waiter.task.done():
+            # Предыдущее уведомление еще отправляется, позиция обновится при следующем сдвиге
+            return False
+        if not waiter.shown or position <= self.position_exact:
+            return True
+        return self.clock() - waiter.shown_at >= self.position_interval
+
+    def _notify(self, waiter: _Waiter, position: int):
+        """Вызывает обработчик позиции в фоне, чтобы не задерживать очередь"""
+        if not self._should_notify(waiter, position):
+            return
+        waiter.shown = position
+        waiter.shown_at = self.clock()
+        task = asyncio.ensure_future(waiter.on_position(position))
+        waiter.task = task
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_done)
+
+    async def _announce_start(self, waiter: _Waiter):
+        """Сообщает о начале генерации после всех уже отправленных позиций"""
+        if waiter.on_position is None or not waiter.shown:
+            return
+        if waiter.task is not None:
+            await asyncio.wait([waiter.task])
+        try:
+            await waiter.on_position(0)
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить о начале генерации: {str(e)}", extra={
+                'operation': 'ADMISSION_NOTIFY_ERROR'
+            })
+
+    def _notify_done(self, task: asyncio.Task):
+        self._notify_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Не удалось сообщить позицию в очереди: {str(task.exception())}", extra={
+                'operation': 'ADMISSION_NOTIFY_ERROR'
+            })
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import aiohttp
+
+from ..constants.bot_constants import CircuitBreakerConstants
+from .errors import APIError, RateLimitError
+from .retry import is_retryable
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+UNAVAILABLE_MESSAGE = "Сервис генерации временно недоступен. Попробуйте позже."
+
+class CircuitOpenError(APIError):
+    """FusionBrain недоступен: запросы не отправляются до проверки восстановления"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def is_outage(error: BaseException) -> bool:
+    """Ошибка говорит о недоступности сервиса (сбой сервера, сеть, таймаут), а не о запросе"""
+    # 429 означает, что сервис работает, но просит снизить частоту
+    return is_retryable(error) and not isinstance(error, RateLimitError)
+
+def is_service_response(error: BaseException) -> bool:
+    """Ошибка — осмысленный ответ сервиса на запрос (4xx), значит, сервис доступен"""
+    if isinstance(error, APIError):
+        status = error.status
+    elif isinstance(error, aiohttp.ClientResponseError):
+        status = error.status
+    else:
+        return False
+    return status is not None and 400 <= status < 500
+
+class CircuitBreaker:
+    """Автомат защиты: после серии сбоев запросы сразу отклоняются, восстановление проверяет один пробный запрос"""
+
+    def __init__(self, failure_threshold: int = CircuitBreakerConstants.FAILURE_THRESHOLD,
+                 recovery_timeout: float = CircuitBreakerConstants.RECOVERY_TIMEOUT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def retry_after(self) -> float:
+        """Через сколько секунд будет пробный запрос"""
+        return max(0.0, self._opened_at + self.recovery_timeout - self.clock())
+
+    @property
+    def is_open(self) -> bool:
+        """Запрос сейчас будет отклонен (пробный запрос не занимается)"""
+        if self.state == OPEN:
+            return self.retry_after > 0
+        return self.state == HALF_OPEN and self._probe_in_flight
+
+    def _before_call(self):
+        """Пропускает запрос или отклоняет его без обращения к сервису"""
+        if self.state == OPEN and self.retry_after <= 0:
+            self.state = HALF_OPEN
+            logger.info("Проверка восстановления FusionBrain пробным запросом", extra={'operation': 'CIRCUIT_HALF_OPEN'})
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(UNAVAILABLE_MESSAGE, self.recovery_timeout)
+            self._probe_in_flight = True
+        elif self.state == OPEN:
+            raise CircuitOpenError(UNAVAILABLE_MESSAGE, self.retry_after)
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = self.clock()
+        logger.error(
+            f"FusionBrain недоступен, запросы приостановлены на {self.recovery_timeout:.0f} сек",
+            extra={'operation': 'CIRCUIT_OPEN'}
+        )
+
+    def record_success(self):
+        """Сервис ответил: автомат замыкается"""
+        if self.state != CLOSED:
+            logger.info("FusionBrain снова доступен", extra={'operation': 'CIRCUIT_CLOSED'})
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        """Сбой сервиса: после порога или неудачной пробы автомат размыкается"""
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._open()
+
+    async def call(self, operation: Callable[[], Awaitable[T]]) -> T:
+        """Выполняет запрос под защитой автомата"""
+        self._before_call()
+        probe = self.state == HALF_OPEN
+        try:
+            result = await operation()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if is_outage(e):
+                self.record_failure()
+            elif is_service_response(e):
+                # Сервис ответил ошибкой запроса — значит, он доступен
+                self.record_success()
+            # Прочие ошибки (некорректный ответ, отказ ограничителя) состояние не меняют,
+            # пробный запрос освобождается для следующей попытки
+            raise
+        finally:
+            if probe:
+                self._probe_in_flight = False
+        self.record_success()
+        return result
@@ -0,0 +1,25 @@
+from typing import Optional
+
+class APIError(Exception):
+    """Ошибка ответа FusionBrain API"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class TransientAPIError(APIError):
+    """Временная ошибка: сбой сервера (5xx), обрыв соединения или таймаут — запрос можно повторить"""
+    pass
+
+class CensorshipError(APIError):
+    """Запрос отклонен модерацией (HTTP 451)"""
+
+    def __init__(self, message: str, status: Optional[int] = 451):
+        super().__init__(message, status)
+
+class RateLimitError(APIError):
+    """Запрос отклонен из-за лимита (HTTP 429) или отложен ограничителем клиента"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, status: Optional[int] = 429):
+        super().__init__(message, status)
+        self.retry_after = retry_after
@@ -2,35 +2,62 @@ import logging
 import aiohttp
 from typing import List, Dict, Any, Optional
 
-class CensorshipError(Exception):
-    pass
+from .circuit_breaker import CircuitBreaker
+from .errors import CensorshipError, RateLimitError
+from .http_session import HTTPSessionManager
+from .rate_limiter import AdaptiveRateLimiter, ENDPOINT_MODELS, ENDPOINT_RUN, ENDPOINT_STATUS, parse_retry_after
+from .retry import IDEMPOTENT_METHODS, RetryPolicy
 
 class Text2ImageAPI:
     MAX_PROMPT_LENGTH = 500
 
-    def __init__(self, api_key: str, secret_key: str):
+    def __init__(self, api_key: str, secret_key: str, session: Optional[aiohttp.ClientSession] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None, retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None):
         self.URL = 'https://api-key.fusionbrain.ai'
         self.api_key = api_key
         self.secret_key = secret_key
+        # Заголовки авторизации не меняются, собираем их один раз
+        self.auth_headers = {
+            "X-API-KEY": api_key,
+            "X-SECRET-KEY": secret_key
+        }
+        self.session = session  # Если не задана, используется общая сессия бота
+        # У каждого клиента свои ограничитель, повторы и автомат защиты, общие можно передать явно
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
         self.logger = logging.getLogger(__name__)
 
-    async def _make_request(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
-        """Выполняет запрос к API с правильной авторизацией"""
-        headers = {
-            "X-API-KEY": self.api_key,
-            "X-SECRET-KEY": self.secret_key
-        }
-        if 'headers' in kwargs:
-            kwargs['headers'].update(headers)
-        else:
-            kwargs['headers'] = headers
+    async def _make_request(self, method: str, url: str, endpoint: str, **kwargs) -> Dict[str, Any]:
+        """Выполняет запрос к API с правильной авторизацией через ограничитель, повторы и автомат защиты"""
+        # Заголовки вызывающего не изменяются
+        kwargs['headers'] = {**kwargs.get('headers', {}), **self.auth_headers}
+
+        session = self.session or await HTTPSessionManager.get_session()
+
+        async def attempt(timeout: float) -> Dict[str, Any]:
+            await self.rate_limiter.acquire(endpoint)
+            try:
+                async with session.request(method, url, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs) as response:
+                    if response.status == 451:
+                        raise CensorshipError("Контент не прошел модерацию")
+                    if response.status == 429:
+                        raise RateLimitError(
+                            "Превышен лимит запросов",
+                            retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                        )
+                    response.raise_for_status()
+                    result = await response.json()
+            except RateLimitError as e:
+                self.rate_limiter.on_rate_limited(endpoint, e.retry_after)
+                raise
+            self.rate_limiter.on_success(endpoint)
+            return result
 
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method, url, **kwargs) as response:
-                if response.status == 451:
-                    raise CensorshipError("Контент не прошел модерацию")
-                response.raise_for_status()
-                return await response.json()
+        return await self.circuit_breaker.call(
+            lambda: self.retry_policy.run(attempt, name=endpoint, idempotent=method in IDEMPOTENT_METHODS)
+        )
 
     def _prepare_prompt(self, prompt: str) -> str:
         """Подготовка промпта: обрезка до максимальной длины"""
@@ -39,7 +66,7 @@ class Text2ImageAPI:
     async def get_model(self) -> List[Dict[str, Any]]:
         """Получение списка доступных моделей"""
         url = f"{self.URL}/key/api/v1/models"
-        return await self._make_request('GET', url)
+        return await self._make_request('GET', url, ENDPOINT_MODELS)
 
     async def generate(self, prompt: str, model_id: int, width: int = 1024, height: int = 1024) -> str:
         """Запуск генерации изображения"""
@@ -52,13 +79,13 @@ class Text2ImageAPI:
                 "query": self._prepare_prompt(prompt)
             }
         }
-        response = await self._make_request('POST', url, json=data)
+        response = await self._make_request('POST', url, ENDPOINT_RUN, json=data)
         return response['uuid']
 
     async def check_generation(self, uuid: str) -> Optional[bytes]:
         """Проверка статуса генерации"""
         url = f"{self.URL}/key/api/v1/text2image/status/{uuid}"
-        response = await self._make_request('GET', url)
+        response = await self._make_request('GET', url, ENDPOINT_STATUS)
         
         if response['status'] == 'DONE':
             if 'images' in response and response['images']:
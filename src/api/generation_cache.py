@@ -0,0 +1,71 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional
+
+from ..constants.bot_constants import GenerationCacheConstants
+from ..models.image_info import ImageInfo
+from ..utils.byte_cache import ByteLRUCache
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CachedGeneration:
+    """Готовая генерация в кэше"""
+    image_data: Optional[bytes]  # None, если изображение уже загружено в Telegram
+    image_info: ImageInfo
+    expires_at: float
+    file_id: Optional[str] = None  # file_id в Telegram для повторной отправки без загрузки
+
+class GenerationResultCache:
+    """Кэш готовых изображений по параметрам генерации с TTL и ограничением объема"""
+
+    def __init__(self, ttl: float = GenerationCacheConstants.TTL,
+                 max_entries: int = GenerationCacheConstants.MAX_ENTRIES,
+                 max_bytes: int = GenerationCacheConstants.MAX_BYTES):
+        self.ttl = ttl
+        self._cache = ByteLRUCache(max_entries=max_entries, max_bytes=max_bytes)
+
+    @property
+    def enabled(self) -> bool:
+        """Кэш включен, если задано положительное время жизни"""
+        return self.ttl > 0
+
+    def get(self, key: Hashable) -> Optional[CachedGeneration]:
+        """Возвращает неустаревший результат или None"""
+        if not self.enabled:
+            return None
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._cache.pop(key)
+            return None
+        return entry
+
+    def put(self, key: Hashable, image_data: bytes, image_info: ImageInfo, file_id: Optional[str] = None) -> bool:
+        """Сохраняет результат генерации; при известном file_id байты изображения не хранятся"""
+        if not self.enabled:
+            return False
+        entry = CachedGeneration(
+            image_data=None if file_id else image_data,
+            image_info=image_info,
+            expires_at=time.monotonic() + self.ttl,
+            file_id=file_id
+        )
+        size = len(file_id) if file_id else len(image_data)
+        stored = self._cache.put(key, entry, size=size)
+        if stored:
+            logger.info(
+                f"Результат генерации сохранен в кэш: {self._cache.stats()}",
+                extra={'operation': 'GENERATION_CACHE_PUT'}
+            )
+        return stored
+
+    def clear(self):
+        """Очищает кэш"""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика использования кэша"""
+        return self._cache.stats()
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+from ..constants.bot_constants import HTTPConstants
+
+logger = logging.getLogger(__name__)
+
+class HTTPSessionManager:
+    """Общая HTTP-сессия бота с ограниченным пулом соединений"""
+    _session: Optional[aiohttp.ClientSession] = None
+    _lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def _create_session(cls) -> aiohttp.ClientSession:
+        """Создает сессию с keep-alive и кэшированием DNS"""
+        connector = aiohttp.TCPConnector(
+            limit=HTTPConstants.POOL_LIMIT,
+            limit_per_host=HTTPConstants.POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTPConstants.DNS_CACHE_TTL,
+            use_dns_cache=True,
+            keepalive_timeout=HTTPConstants.KEEPALIVE_TIMEOUT
+        )
+        logger.info(
+            f"Создание HTTP-сессии: limit={HTTPConstants.POOL_LIMIT}, "
+            f"limit_per_host={HTTPConstants.POOL_LIMIT_PER_HOST}"
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    @classmethod
+    async def get_session(cls) -> aiohttp.ClientSession:
+        """Возвращает общую сессию, создавая ее при первом обращении"""
+        if cls._session is not None and not cls._session.closed:
+            return cls._session
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        async with cls._lock:
+            if cls._session is None or cls._session.closed:
+                cls._session = cls._create_session()
+        return cls._session
+
+    @classmethod
+    async def close(cls):
+        """Закрывает общую сессию и освобождает соединения пула"""
+        session, cls._session = cls._session, None
+        cls._lock = None
+        if session is not None and not session.closed:
+            await session.close()
+            logger.info("HTTP-сессия закрыта")
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from ..constants.bot_constants import APIConstants
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Кэш списка моделей FusionBrain с TTL и фоновым обновлением"""
+
+    def __init__(self, ttl: float = APIConstants.MODELS_CACHE_TTL,
+                 retry_interval: float = APIConstants.MODELS_RETRY_INTERVAL):
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._models: Optional[List[Dict[str, Any]]] = None
+        self._expires_at: float = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def models(self) -> Optional[List[Dict[str, Any]]]:
+        """Последний успешно полученный список моделей"""
+        return self._models
+
+    def is_fresh(self) -> bool:
+        """Проверяет, не истек ли срок жизни кэша"""
+        return self._models is not None and time.monotonic() < self._expires_at
+
+    async def _fetch(self, api) -> List[Dict[str, Any]]:
+        """Запрашивает список моделей, при ошибке возвращает последний удачный"""
+        try:
+            models = await api.get_model()
+            if not models:
+                raise Exception("Список моделей пуст")
+        except Exception as e:
+            if self._models:
+                # Не дергаем API на каждом запросе, пока сервис недоступен
+                self._expires_at = time.monotonic() + self.retry_interval
+                logger.warning(
+                    f"Не удалось обновить список моделей, используется сохраненный: {str(e)}",
+                    extra={'operation': 'MODELS_FALLBACK'}
+                )
+                return self._models
+            raise
+
+        self._models = models
+        self._expires_at = time.monotonic() + self.ttl
+        logger.info(
+            f"Список моделей обновлен: {len(models)} шт.",
+            extra={'operation': 'MODELS_REFRESHED'}
+        )
+        return models
+
+    def _start_refresh(self, api) -> asyncio.Task:
+        """Запускает обновление, если оно еще не выполняется"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._fetch(api))
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    @staticmethod
+    def _on_refresh_done(task: asyncio.Task):
+        """Логирует ошибку фонового обновления, чтобы она не потерялась"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                f"Ошибка при обновлении списка моделей: {str(task.exception())}",
+                extra={'operation': 'MODELS_REFRESH_ERROR'}
+            )
+
+    def prefetch(self, api):
+        """Запускает загрузку списка моделей в фоне"""
+        self._start_refresh(api)
+
+    async def refresh(self, api) -> List[Dict[str, Any]]:
+        """Обновляет список; параллельные вызовы ждут один общий запрос"""
+        return await asyncio.shield(self._start_refresh(api))
+
+    async def get_models(self, api) -> List[Dict[str, Any]]:
+        """Возвращает список моделей, устаревший кэш обновляется в фоне"""
+        if self._models is None:
+            return await self.refresh(api)
+        if not self.is_fresh():
+            self._start_refresh(api)
+        return self._models
+
+    async def get_default_model_id(self, api) -> int:
+        """Возвращает ID модели по умолчанию"""
+        models = await self.get_models(api)
+        return models[0]["id"]
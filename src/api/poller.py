@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from ..constants.bot_constants import PollingConstants
+from .circuit_breaker import CircuitOpenError
+from .errors import RateLimitError
+from .polling import IN_PROGRESS_STATUSES, GenerationTimeStats, PollSchedule, generation_stats
+from .retry import is_retryable
+
+logger = logging.getLogger(__name__)
+
+class GenerationTimeoutError(Exception):
+    """Генерация не завершилась за отведенное время"""
+    pass
+
+@dataclass
+class PendingGeneration:
+    """Генерация, ожидающая завершения"""
+    api: Any
+    uuid: str
+    future: asyncio.Future
+    schedule: PollSchedule
+    next_poll_at: float
+    waiters: int = 0  # Сколько вызовов wait() ждут результат
+    poll_task: Optional[asyncio.Task] = None  # Выполняемый сейчас опрос
+
+class GenerationPoller:
+    """Единый опросчик статусов всех генераций в работе"""
+
+    def __init__(self, tick: float = PollingConstants.POLLER_TICK,
+                 max_concurrency: int = PollingConstants.POLLER_MAX_CONCURRENCY,
+                 stats: GenerationTimeStats = generation_stats,
+                 schedule_factory: Optional[Callable[[], PollSchedule]] = None):
+        self.tick = tick
+        self.max_concurrency = max_concurrency
+        self.stats = stats
+        self.schedule_factory = schedule_factory or (lambda: PollSchedule(self.stats))
+        self._pending: Dict[str, PendingGeneration] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Количество генераций в работе"""
+        return len(self._pending)
+
+    def start(self):
+        """Запускает фоновый цикл опроса"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Опросчик генераций запущен: tick={self.tick}, max_concurrency={self.max_concurrency}",
+            extra={'operation': 'POLLER_START'}
+        )
+
+    async def stop(self):
+        """Останавливает цикл опроса и отменяет ожидающие генерации"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for entry in self._pending.values():
+            if entry.poll_task is not None:
+                entry.poll_task.cancel()
+            if not entry.future.done():
+                entry.future.cancel()
+        self._pending.clear()
+        logger.info("Опросчик генераций остановлен", extra={'operation': 'POLLER_STOP'})
+
+    def submit(self, api, uuid: str) -> asyncio.Future:
+        """Ставит генерацию на опрос и возвращает future с итоговым ответом API"""
+        return self._submit(api, uuid).future
+
+    def _submit(self, api, uuid: str) -> PendingGeneration:
+        self.start()
+        entry = self._pending.get(uuid)
+        if entry is None or entry.future.done():
+            schedule = self.schedule_factory()
+            entry = PendingGeneration(
+                api=api,
+                uuid=uuid,
+                future=asyncio.get_running_loop().create_future(),
+                schedule=schedule,
+                next_poll_at=time.monotonic() + schedule.next_delay()
+            )
+            self._pending[uuid] = entry
+            self._wakeup.set()
+        return entry
+
+    async def wait(self, api, uuid: str) -> Any:
+        """Ожидает завершения генерации (DONE, FAILED или неизвестный статус)
+
+        Когда уходит последний ожидающий, генерация снимается с опроса.
+        """
+        entry = self._submit(api, uuid)
+        entry.waiters += 1
+        try:
+            # shield: отмена одного ожидающего не должна отменять общую future
+            return await asyncio.shield(entry.future)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.future.done():
+                self._drop(entry)
+
+    def _drop(self, entry: PendingGeneration):
+        """Снимает с опроса генерацию, результат которой больше никто не ждет"""
+        logger.info("Генерация снята с опроса: ожидающие отменили запрос", extra={
+            'operation': 'POLL_ABANDONED',
+            'uuid': entry.uuid
+        })
+        if self._pending.get(entry.uuid) is entry:
+            del self._pending[entry.uuid]
+        if entry.poll_task is not None:
+            entry.poll_task.cancel()
+        entry.future.cancel()
+
+    async def _run(self):
+        """Общий цикл: на каждом шаге опрашивает генерации, у которых подошел срок"""
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            # Каждый опрос — отдельная задача: медленный запрос не задерживает остальные генерации
+            for entry in list(self._pending.values()):
+                if entry.poll_task is None and entry.next_poll_at <= now:
+                    entry.poll_task = asyncio.create_task(self._poll(entry))
+                    entry.poll_task.add_done_callback(lambda task, entry=entry: self._poll_done(entry, task))
+
+    def _poll_done(self, entry: PendingGeneration, task: asyncio.Task):
+        """Освобождает генерацию для следующего опроса"""
+        entry.poll_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка опроса статуса: {str(task.exception())}", extra={
+                'operation': 'POLL_ERROR',
+                'uuid': entry.uuid
+            })
+            self._resolve(entry, error=task.exception())
+
+    def _resolve(self, entry: PendingGeneration, result: Any = None, error: Optional[BaseException] = None):
+        """Завершает future генерации и снимает ее с опроса"""
+        if self._pending.get(entry.uuid) is entry:
+            del self._pending[entry.uuid]
+        if entry.future.done():
+            return
+        if error is not None:
+            entry.future.set_exception(error)
+        else:
+            entry.future.set_result(result)
+
+    def _reschedule(self, entry: PendingGeneration, min_delay: float = 0.0):
+        """Назначает следующий опрос или завершает генерацию по таймауту"""
+        if entry.schedule.expired():
+            logger.error("Превышено время ожидания генерации", extra={
+                'operation': 'GENERATION_TIMEOUT',
+                'uuid': entry.uuid,
+                'attempts': entry.schedule.attempt,
+                'elapsed': entry.schedule.elapsed()
+            })
+            self._resolve(entry, error=GenerationTimeoutError("Превышено время ожидания генерации"))
+        else:
+            entry.next_poll_at = time.monotonic() + max(min_delay, entry.schedule.next_delay())
+
+    async def _poll(self, entry: PendingGeneration):
+        """Опрашивает статус одной генерации"""
+        async with self._semaphore:
+            try:
+                response = await entry.api.check_generation(entry.uuid)
+            except RateLimitError as e:
+                # Опрос отложен ограничителем или отклонен с 429 — переносим его, генерация продолжается
+                self._reschedule(entry, e.retry_after or 0.0)
+                return
+            except CircuitOpenError as e:
+                # FusionBrain недоступен: опрос ждет пробного запроса, пока не истечет время генерации
+                self._reschedule(entry, e.retry_after)
+                return
+            except Exception as e:
+                if is_retryable(e):
+                    # Временная ошибка сети или сервера: следующий опрос по обычному расписанию
+                    logger.warning(f"Временная ошибка опроса статуса: {str(e)}", extra={
+                        'operation': 'POLL_RETRY',
+                        'uuid': entry.uuid
+                    })
+                    self._reschedule(entry)
+                else:
+                    self._resolve(entry, error=e)
+                return
+
+        status = response.get('status') if isinstance(response, dict) else None
+        if status in IN_PROGRESS_STATUSES:
+            self._reschedule(entry)
+            return
+
+        if status == "DONE" or isinstance(response, list):
+            self.stats.record(entry.schedule.elapsed())
+        self._resolve(entry, result=response)
@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+from collections import deque
+from typing import Optional
+
+from ..constants.bot_constants import PollingConstants
+
+# Статусы FusionBrain, при которых генерация еще не завершена
+IN_PROGRESS_STATUSES = ("INITIAL", "PROCESSING")
+
+class GenerationTimeStats:
+    """Скользящая статистика времени генерации"""
+
+    def __init__(self, window: int = PollingConstants.STATS_WINDOW,
+                 default: float = PollingConstants.DEFAULT_EXPECTED_TIME):
+        self.default = default
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        """Добавляет время завершенной генерации"""
+        if seconds > 0:
+            self._samples.append(seconds)
+
+    def expected(self) -> float:
+        """Ожидаемое время генерации (медиана последних замеров)"""
+        if not self._samples:
+            return self.default
+        return statistics.median(self._samples)
+
+class PollSchedule:
+    """Расписание опроса: первая пауза по статистике, далее экспоненциальный рост с джиттером"""
+
+    def __init__(self, stats: Optional[GenerationTimeStats] = None,
+                 deadline: float = PollingConstants.DEADLINE,
+                 min_delay: float = PollingConstants.MIN_DELAY,
+                 max_delay: float = PollingConstants.MAX_DELAY,
+                 factor: float = PollingConstants.BACKOFF_FACTOR,
+                 jitter: float = PollingConstants.JITTER):
+        self.stats = stats
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.attempt = 0
+        self.started_at = time.monotonic()
+        self.deadline_at = self.started_at + deadline
+
+    def elapsed(self) -> float:
+        """Время с начала ожидания в секундах"""
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        """Время до истечения срока ожидания"""
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Проверяет, истек ли срок ожидания"""
+        return time.monotonic() >= self.deadline_at
+
+    def next_delay(self) -> float:
+        """Пауза перед следующим опросом"""
+        if self.attempt == 0 and self.stats is not None:
+            # Первый опрос незадолго до ожидаемого завершения генерации
+            delay = max(self.stats.expected() * PollingConstants.INITIAL_DELAY_RATIO, self.min_delay)
+        else:
+            steps = self.attempt - 1 if self.stats is not None else self.attempt
+            delay = self.min_delay * self.factor ** min(steps, 32)
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+            delay = min(max(delay, self.min_delay), self.max_delay)
+        self.attempt += 1
+        return min(delay, self.remaining())
+
+# Общая статистика генераций процесса
+generation_stats = GenerationTimeStats()
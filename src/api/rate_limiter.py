@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+from ..constants.bot_constants import RateLimitConstants
+from .errors import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+# Типы запросов к FusionBrain, у каждого свое ведро токенов
+ENDPOINT_RUN = "run"
+ENDPOINT_STATUS = "status"
+ENDPOINT_MODELS = "models"
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After: число секунд или HTTP-дата"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+class TokenBucket:
+    """Ведро токенов с адаптивной скоростью: резкое снижение на 429, плавный рост после успехов"""
+
+    def __init__(self, rate: float, burst: float,
+                 min_rate: Optional[float] = None,
+                 decrease_factor: float = RateLimitConstants.DECREASE_FACTOR,
+                 increase_ratio: float = RateLimitConstants.INCREASE_RATIO,
+                 ramp_up_after: int = RateLimitConstants.RAMP_UP_AFTER,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate * RateLimitConstants.MIN_RATE_RATIO
+        self.rate = rate
+        self.burst = burst
+        self.decrease_factor = decrease_factor
+        self.increase_step = rate * increase_ratio
+        self.ramp_up_after = ramp_up_after
+        self.clock = clock
+        self.tokens = burst
+        self.blocked_until = 0.0
+        self.waiters = 0
+        self._successes = 0
+        self._updated = clock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Через сколько секунд будет доступен токен (0 — доступен сейчас)"""
+        now = self.clock()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    @property
+    def under_pressure(self) -> bool:
+        """Есть ожидающие запросы или действует пауза после 429"""
+        return self.waiters > 0 or self.clock() < self.blocked_until
+
+    def try_acquire(self) -> bool:
+        """Забирает токен, если он доступен сейчас"""
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self):
+        """Ожидает и забирает токен"""
+        self.waiters += 1
+        try:
+            while not self.try_acquire():
+                await asyncio.sleep(self.delay())
+        finally:
+            self.waiters -= 1
+
+    def on_success(self):
+        """Аддитивный рост скорости после серии успешных запросов"""
+        self._successes += 1
+        if self._successes >= self.ramp_up_after and self.rate < self.max_rate:
+            self._successes = 0
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """Мультипликативное снижение скорости и пауза на время Retry-After"""
+        now = self.clock()
+        self._refill(now)
+        self._successes = 0
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        pause = retry_after if retry_after is not None else RateLimitConstants.DEFAULT_RETRY_AFTER
+        self.blocked_until = max(self.blocked_until, now + pause)
+        # Ведро опустошается так, чтобы ровно один токен появился к концу паузы
+        self.tokens = 1 - (self.blocked_until - now) * self.rate
+
+class AdaptiveRateLimiter:
+    """Общий ограничитель запросов к FusionBrain с отдельными ведрами для run, status и models"""
+
+    def __init__(self, buckets: Optional[Dict[str, TokenBucket]] = None):
+        self.buckets = buckets or {
+            ENDPOINT_RUN: TokenBucket(RateLimitConstants.RUN_RATE, RateLimitConstants.RUN_BURST),
+            ENDPOINT_STATUS: TokenBucket(RateLimitConstants.STATUS_RATE, RateLimitConstants.STATUS_BURST),
+            ENDPOINT_MODELS: TokenBucket(RateLimitConstants.MODELS_RATE, RateLimitConstants.MODELS_BURST),
+        }
+        self.shed = 0
+
+    def _others_under_pressure(self, endpoint: str) -> bool:
+        return any(bucket.under_pressure for name, bucket in self.buckets.items() if name != endpoint)
+
+    async def acquire(self, endpoint: str):
+        """Получает разрешение на запрос
+
+        Опросы статуса не ждут: при нехватке токенов или при нагрузке на другие запросы они
+        отклоняются первыми (RateLimitError), и опросчик переносит их на следующий шаг.
+        """
+        bucket = self.buckets[endpoint]
+        if endpoint != ENDPOINT_STATUS:
+            await bucket.acquire()
+            return
+        if self._others_under_pressure(endpoint) or not bucket.try_acquire():
+            self.shed += 1
+            retry_after = max(bucket.delay(), 1 / bucket.rate)
+            raise RateLimitError("Опрос статуса отложен ограничителем запросов", retry_after=retry_after, status=None)
+
+    def on_success(self, endpoint: str):
+        self.buckets[endpoint].on_success()
+
+    def on_rate_limited(self, endpoint: str, retry_after: Optional[float] = None):
+        """Учитывает ответ 429: замедляется ведро запроса, опросы статуса приостанавливаются тоже"""
+        self.buckets[endpoint].on_rate_limited(retry_after)
+        if endpoint != ENDPOINT_STATUS:
+            self.buckets[ENDPOINT_STATUS].on_rate_limited(retry_after)
+        logger.warning(
+            f"FusionBrain ограничил запросы ({endpoint}), пауза {retry_after or RateLimitConstants.DEFAULT_RETRY_AFTER} сек",
+            extra={'operation': 'RATE_LIMITED'}
+        )
+
+    def stats(self) -> Dict[str, float]:
+        """Текущие скорости ведер и количество отложенных опросов"""
+        result = {f"{name}_rate": bucket.rate for name, bucket in self.buckets.items()}
+        result['shed'] = self.shed
+        return result
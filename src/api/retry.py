@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+
+from ..constants.bot_constants import APIConstants, RateLimitConstants
+from .errors import APIError, RateLimitError, TransientAPIError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Коды ответа, после которых повтор бесполезен: ключи, права доступа, модерация
+FATAL_STATUSES = frozenset({400, 401, 403, 404, 451})
+
+# Методы, повтор которых не создает на сервере ничего нового
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+def is_retryable(error: BaseException, idempotent: bool = True) -> bool:
+    """Можно ли повторить запрос после этой ошибки
+
+    Неидемпотентный запрос (запуск генерации) повторяется, только если сервер его точно
+    не принял: явный ответ 5xx/408/429 или ошибка установки соединения. После таймаута
+    или оборванного ответа запуск мог уже состояться, повтор создал бы вторую генерацию.
+    """
+    if isinstance(error, RateLimitError):
+        return True
+    if isinstance(error, TransientAPIError):
+        return idempotent or error.status is not None
+    if isinstance(error, APIError):
+        return False
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status not in FATAL_STATUSES and (error.status >= 500 or error.status == 408)
+    if not idempotent:
+        return isinstance(error, aiohttp.ClientConnectorError)
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError,
+                              aiohttp.ClientPayloadError, ConnectionError))
+
+class RetryPolicy:
+    """Повтор запросов: экспоненциальная пауза со случайным разбросом и общий бюджет времени"""
+
+    def __init__(self, max_retries: int = APIConstants.MAX_RETRIES,
+                 attempt_timeout: float = APIConstants.TIMEOUT,
+                 budget: float = APIConstants.RETRY_BUDGET,
+                 base_delay: float = APIConstants.RETRY_BASE_DELAY,
+                 max_delay: float = APIConstants.RETRY_MAX_DELAY,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_retries = max_retries
+        self.attempt_timeout = attempt_timeout
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.clock = clock
+
+    def backoff(self, retry: int) -> float:
+        """Пауза перед повтором: случайная в пределах экспоненциально растущей границы"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def _delay(self, error: BaseException, retry: int, idempotent: bool = True) -> Optional[float]:
+        """Пауза перед повтором или None, если повторять нельзя"""
+        if not is_retryable(error, idempotent):
+            return None
+        if isinstance(error, RateLimitError):
+            # Паузу после 429 выдерживает ограничитель запросов, слишком долгую не ждем
+            if (error.retry_after or 0) > RateLimitConstants.MAX_RETRY_WAIT:
+                return None
+            return 0.0
+        return self.backoff(retry)
+
+    async def run(self, operation: Callable[[float], Awaitable[T]], name: str = "request",
+                  max_retries: Optional[int] = None, idempotent: bool = True) -> T:
+        """Выполняет operation(timeout) с повторами; timeout — время на одну попытку
+
+        idempotent=False — запрос создает ресурс на сервере (POST), повторы только после ошибок,
+        при которых сервер запрос точно не принял.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        deadline = self.clock() + self.budget
+        retry = 0
+        while True:
+            remaining = deadline - self.clock()
+            try:
+                return await operation(max(0.0, min(self.attempt_timeout, remaining)))
+            except Exception as e:
+                delay = self._delay(e, retry, idempotent)
+                if delay is None or retry >= max_retries or self.clock() + delay >= deadline:
+                    raise self._final_error(e)
+                retry += 1
+                logger.warning(
+                    f"Повтор запроса {name} через {delay:.1f} сек (попытка {retry}/{max_retries}): "
+                    f"{type(e).__name__}: {str(e)}",
+                    extra={'operation': 'API_RETRY'}
+                )
+                await self.sleep(delay)
+
+    @staticmethod
+    def _final_error(error: Exception) -> Exception:
+        """Сетевые ошибки и таймауты заменяются понятной пользователю временной ошибкой"""
+        if isinstance(error, APIError) or not is_retryable(error):
+            return error
+        if isinstance(error, aiohttp.ClientResponseError):
+            transient = TransientAPIError("Сервер временно недоступен. Попробуйте позже.", error.status)
+        else:
+            transient = TransientAPIError("Нет связи с сервером генерации. Попробуйте позже.")
+        transient.__cause__ = error
+        return transient
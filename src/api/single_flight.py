@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+def make_generation_key(styled_prompt: str, model_id: int, width: int, height: int) -> Tuple[str, int, int, int]:
+    """Нормализованный ключ генерации: лишние пробелы в промпте не важны, регистр важен (его учитывает FusionBrain)"""
+    prompt = " ".join(styled_prompt.split())
+    return (prompt, int(model_id), int(width), int(height))
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые запросы в одно выполнение"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """Количество выполняемых запросов"""
+        return len(self._calls)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет factory() или присоединяется к уже идущему выполнению с тем же ключом"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            logger.info("Запрос присоединен к уже выполняемому", extra={'operation': 'SINGLE_FLIGHT_JOIN'})
+        # shield: отмена одного ожидающего не должна прерывать выполнение для остальных
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        """Снимает завершенное выполнение, следующий запрос с тем же ключом начнется заново"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Помечаем ошибку как полученную, если все ожидающие ушли
@@ -0,0 +1,137 @@
+import binascii
+import io
+import json
+from typing import Any, Optional
+
+QUOTE = ord('"')
+BACKSLASH = ord('\\')
+SLASH = ord('/')
+WHITESPACE = b' \t\r\n'
+
+class StreamingImageDecoder:
+    """Разбирает ответ статуса генерации по частям: первое изображение декодируется из base64 сразу в буфер"""
+
+    KEY_CAPTURE_LIMIT = 64  # Строки верхнего уровня длиннее лимита не могут быть искомым ключом
+
+    def __init__(self, field: str = 'images'):
+        self.field = field.encode('utf-8')
+        self._meta = bytearray()  # JSON ответа без содержимого первого изображения
+        self._image = io.BytesIO()
+        self._tail = b''  # Неполная четверка символов base64 с конца предыдущей части
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string = bytearray()
+        self._last_string: Optional[bytes] = None
+        self._key: Optional[bytes] = None
+        self._await_image = False
+        self._in_image = False
+        self._image_found = False
+
+    def feed(self, chunk: bytes):
+        """Обрабатывает очередную часть тела ответа"""
+        i, start, n = 0, 0, len(chunk)
+        while i < n:
+            if self._in_image:
+                i = self._feed_image(chunk, i)
+                start = i
+                continue
+
+            byte = chunk[i]
+            i += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif byte == BACKSLASH:
+                    self._escape = True
+                elif byte == QUOTE:
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = bytes(self._string)
+                    continue
+                if self._depth == 1 and len(self._string) < self.KEY_CAPTURE_LIMIT:
+                    self._string.append(byte)
+            elif byte == QUOTE:
+                if self._await_image:
+                    # Начало первого изображения: в метаданных остается пустая строка
+                    self._await_image = False
+                    self._in_image = self._image_found = True
+                    self._meta += chunk[start:i]
+                    start = i
+                else:
+                    self._in_string = True
+                    self._string.clear()
+            elif byte in b'{[':
+                self._depth += 1
+                self._await_image = (byte == ord('[') and self._depth == 2
+                                     and self._key == self.field and not self._image_found)
+            elif byte in b'}]':
+                self._depth -= 1
+                self._await_image = False
+            elif self._depth == 1 and byte == ord(':'):
+                self._key = self._last_string
+            elif self._depth == 1 and byte == ord(','):
+                self._key = None
+            elif byte not in WHITESPACE:
+                self._await_image = False
+        self._meta += chunk[start:]
+
+    def _feed_image(self, chunk: bytes, i: int) -> int:
+        """Декодирует base64 до закрывающей кавычки; возвращает позицию после обработанных данных"""
+        n = len(chunk)
+        while i < n:
+            if self._escape:
+                # В base64 допустимо только экранирование слэша: \/
+                if chunk[i] != SLASH:
+                    raise ValueError("Недопустимая escape-последовательность в изображении")
+                self._escape = False
+                self._write_base64(b'/')
+                i += 1
+                continue
+
+            end = chunk.find(b'"', i)
+            stop = n if end < 0 else end
+            backslash = chunk.find(b'\\', i, stop)
+            if backslash >= 0:
+                self._write_base64(chunk[i:backslash])
+                self._escape = True
+                i = backslash + 1
+                continue
+
+            self._write_base64(chunk[i:stop])
+            if end < 0:
+                return n
+            # Закрывающая кавычка изображения
+            self._finish_image()
+            self._meta += b'"'
+            return end + 1
+        return n
+
+    def _write_base64(self, data: bytes):
+        """Декодирует данные целыми четверками, остаток переносится в следующую часть"""
+        if self._tail:
+            data = self._tail + data
+        cut = len(data) - len(data) % 4
+        if cut:
+            self._image.write(binascii.a2b_base64(data[:cut]))
+        self._tail = data[cut:]
+
+    def _finish_image(self):
+        if self._escape:
+            raise ValueError("Недопустимая escape-последовательность в изображении")
+        if self._tail:
+            self._image.write(binascii.a2b_base64(self._tail))
+            self._tail = b''
+        self._in_image = False
+
+    def finish(self) -> Any:
+        """Завершает разбор; декодированное изображение возвращается в поле image_data"""
+        if self._in_image or self._in_string or self._depth != 0:
+            raise ValueError("Ответ API оборван")
+        result = json.loads(self._meta)
+        if self._image_found and isinstance(result, dict):
+            images = result.get(self.field.decode('utf-8'))
+            images.pop(0)
+            # getvalue() отдает внутренний буфер без копирования
+            result['image_data'] = self._image.getvalue()
+        return result
@@ -111,10 +111,103 @@ for style_name, style_config in IMAGE_STYLES.items():
 # Константы для API
 class APIConstants:
     """Константы для работы с API"""
-    MAX_RETRIES: Final[int] = 3
-    TIMEOUT: Final[int] = 30
+    MAX_RETRIES: Final[int] = 3  # Повторов запроса после временной ошибки
+    TIMEOUT: Final[int] = 30  # Время на одну попытку запроса в секундах
+    RETRY_BASE_DELAY: Final[float] = 0.5  # Начальная граница паузы перед повтором
+    RETRY_MAX_DELAY: Final[float] = 8.0  # Максимальная граница паузы перед повтором
+    RETRY_BUDGET: Final[float] = 90.0  # Общее время на запрос со всеми повторами
     MAX_PROMPT_LENGTH: Final[int] = 500
     BASE_URL: Final[str] = "https://api-key.fusionbrain.ai"
+    MODELS_CACHE_TTL: Final[int] = 3600  # Время жизни кэша списка моделей в секундах
+    MODELS_RETRY_INTERVAL: Final[int] = 30  # Пауза перед повторным обновлением после ошибки
+    STREAM_CHUNK_SIZE: Final[int] = 64 * 1024  # Размер части при потоковом чтении ответа с изображением
+
+# Константы для опроса статуса генерации
+class PollingConstants:
+    """Параметры адаптивного опроса статуса генерации"""
+    DEADLINE: Final[float] = 180.0  # Максимальное время ожидания генерации в секундах
+    MIN_DELAY: Final[float] = 1.0  # Минимальная пауза между опросами
+    MAX_DELAY: Final[float] = 10.0  # Максимальная пауза между опросами
+    BACKOFF_FACTOR: Final[float] = 1.5  # Множитель экспоненциального роста паузы
+    JITTER: Final[float] = 0.2  # Доля случайного разброса паузы
+    INITIAL_DELAY_RATIO: Final[float] = 0.7  # Доля ожидаемого времени генерации до первого опроса
+    DEFAULT_EXPECTED_TIME: Final[float] = 15.0  # Ожидаемое время генерации без статистики
+    STATS_WINDOW: Final[int] = 50  # Количество последних генераций в статистике
+    POLLER_TICK: Final[float] = 0.5  # Шаг общего цикла опроса в секундах
+    POLLER_MAX_CONCURRENCY: Final[int] = 8  # Максимум одновременных запросов статуса
+
+# Константы для кэша результатов генерации
+class GenerationCacheConstants:
+    """Параметры кэша готовых генераций"""
+    TTL: Final[int] = 900  # Время жизни результата в секундах, 0 отключает кэш
+    MAX_ENTRIES: Final[int] = 200  # Максимум результатов в кэше
+    MAX_BYTES: Final[int] = 128 * 1024 * 1024  # Объем кэша, 128MB
+
+# Константы для ограничения частоты запросов к FusionBrain
+class RateLimitConstants:
+    """Параметры адаптивного ограничителя запросов (ведра токенов)"""
+    RUN_RATE: Final[float] = 1.0  # Запусков генерации в секунду
+    RUN_BURST: Final[float] = 3.0  # Допустимый всплеск запусков
+    STATUS_RATE: Final[float] = 5.0  # Опросов статуса в секунду
+    STATUS_BURST: Final[float] = 10.0
+    MODELS_RATE: Final[float] = 0.2  # Запросов списка моделей в секунду
+    MODELS_BURST: Final[float] = 2.0
+    MIN_RATE_RATIO: Final[float] = 0.1  # Нижняя граница скорости — доля от исходной
+    DECREASE_FACTOR: Final[float] = 0.5  # Во сколько раз снижается скорость после 429
+    INCREASE_RATIO: Final[float] = 0.1  # Прирост скорости после серии успехов — доля от исходной
+    RAMP_UP_AFTER: Final[int] = 10  # Успешных запросов подряд до увеличения скорости
+    DEFAULT_RETRY_AFTER: Final[float] = 5.0  # Пауза после 429 без заголовка Retry-After
+    MAX_RETRY_WAIT: Final[float] = 30.0  # Дольше этой паузы запрос после 429 не ждет и завершается ошибкой
+
+# Константы для автомата защиты от недоступности FusionBrain
+class CircuitBreakerConstants:
+    """Параметры автомата защиты (circuit breaker)"""
+    FAILURE_THRESHOLD: Final[int] = 5  # Сбоев подряд до размыкания
+    RECOVERY_TIMEOUT: Final[float] = 30.0  # Через сколько секунд после размыкания выполняется пробный запрос
+
+# Константы для ограничения одновременных генераций
+class AdmissionConstants:
+    """Лимиты одновременных генераций"""
+    MAX_CONCURRENT: Final[int] = 4  # Одновременных генераций в FusionBrain (по квоте ключа API)
+    PER_USER: Final[int] = 1  # Одновременных генераций одного пользователя
+    MAX_QUEUE: Final[int] = 100  # Максимум генераций в очереди, сверх лимита запросы отклоняются
+    POSITION_EXACT: Final[int] = 3  # Позиции ближе к началу очереди сообщаются при каждом сдвиге
+    POSITION_UPDATE_INTERVAL: Final[float] = 10.0  # Остальным ожидающим — не чаще раза в столько секунд
+
+# Константы для хранилища состояний пользователей
+class UserStateConstants:
+    """Ограничения хранилища состояний пользователей"""
+    MAX_USERS: Final[int] = 10000  # Максимум состояний в памяти
+    MEMORY_BUDGET: Final[int] = 16 * 1024 * 1024  # Оценочный объем состояний в памяти, 16MB
+    IDLE_TIMEOUT: Final[int] = 24 * 60 * 60  # Состояние неактивного пользователя удаляется через сутки
+    IMAGES_DIR: Final[str] = "cache/user_images"  # Каталог последних изображений пользователей
+    IMAGES_MAX_BYTES: Final[int] = 1024 * 1024 * 1024  # Объем каталога изображений, 1GB
+
+# Константы для постоянного хранилища
+class StorageConstants:
+    """Параметры хранилища настроек пользователей"""
+    BACKEND: Final[str] = "memory"  # memory, sqlite или redis
+    SQLITE_PATH: Final[str] = "data/bot.sqlite3"  # Файл базы SQLite
+    REDIS_URL: Final[str] = "redis://localhost:6379/0"  # Адрес Redis-совместимого сервера
+    KEY_PREFIX: Final[str] = "fusionbrain"  # Префикс ключей в Redis
+    FLUSH_INTERVAL: Final[float] = 2.0  # Период отложенной записи измененных настроек в секундах
+    SETTINGS_RELOAD_INTERVAL: Final[float] = 60.0  # Через сколько секунд перечитывать настройки из хранилища
+    SETTINGS_CACHE_SIZE: Final[int] = 10000  # Максимум настроек в кэше памяти
+    SETTINGS_IDLE_TIMEOUT: Final[float] = 60 * 60  # Настройки неактивного пользователя убираются из кэша через час
+
+# Константы для логирования
+class LoggingConstants:
+    """Параметры асинхронного логирования"""
+    QUEUE_SIZE: Final[int] = 10000  # Максимум записей в очереди, сверх лимита записи отбрасываются
+    PREVIEW_CHARS: Final[int] = 200  # Сколько символов длинных значений ответа API попадает в лог
+
+# Константы для HTTP-сессии
+class HTTPConstants:
+    """Параметры пула соединений общей HTTP-сессии"""
+    POOL_LIMIT: Final[int] = 100  # Всего соединений в пуле
+    POOL_LIMIT_PER_HOST: Final[int] = 20  # Соединений к одному хосту
+    DNS_CACHE_TTL: Final[int] = 300  # Время жизни DNS-кэша в секундах
+    KEEPALIVE_TIMEOUT: Final[int] = 30  # Время удержания простаивающего соединения
 
 # Константы для обработки изображений
 class ImageProcessingConstants:
@@ -122,3 +215,15 @@ class ImageProcessingConstants:
     MAX_IMAGE_SIZE: Final[int] = 1500
     SUPPORTED_FORMATS: Final[tuple] = ("PNG", "JPEG", "JPG", "WEBP")
     MAX_FILE_SIZE: Final[int] = 10 * 1024 * 1024  # 10MB
+    BG_WORKERS: Final[int] = 2  # Количество обработчиков удаления фона
+    BG_USE_PROCESSES: Final[bool] = True  # Обработчики в отдельных процессах
+    BG_START_METHOD: Final[str] = "spawn"  # Способ запуска процессов-обработчиков
+    BG_MAX_QUEUE: Final[int] = 8  # Максимум задач в очереди сверх занятых обработчиков
+    BG_JOB_TIMEOUT: Final[float] = 60.0  # Время на одну задачу удаления фона в секундах
+    BG_PRELOAD: Final[bool] = True  # Загружать модель в фоне сразу после старта бота
+    BG_CACHE_MAX_BYTES: Final[int] = 64 * 1024 * 1024  # Объем кэша результатов в памяти, 64MB
+    BG_OUTPUT_FORMAT: Final[str] = "PNG"  # Формат результата удаления фона (PNG или WEBP)
+    BG_PNG_COMPRESS_LEVEL: Final[int] = 1  # Быстрое сжатие PNG: файл чуть больше, кодирование в разы быстрее
+    BG_WEBP_QUALITY: Final[int] = 90  # Качество WebP
+    BG_DISK_CACHE_DIR: Final[str] = "cache/bg_removed"  # Каталог дискового кэша результатов
+    BG_DISK_CACHE_MAX_BYTES: Final[int] = 512 * 1024 * 1024  # Объем дискового кэша, 512MB
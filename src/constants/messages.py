@@ -7,6 +7,8 @@ class MessageKey(str, Enum):
     HELP = "help"
     PROMPT = "prompt"
     GENERATING = "generating"
+    QUEUED = "queued"
+    SERVICE_UNAVAILABLE = "service_unavailable"
     REMOVING_BG = "removing_bg"
     REMOVE_BG_SUCCESS = "remove_bg_success"
     REMOVE_BG_ERROR = "remove_bg_error"
@@ -84,6 +86,18 @@ class MessageTemplate:
 
 Это может занять некоторое время.
 🎨 Стиль: <b>{style}</b>
+""",
+        MessageKey.QUEUED: """
+⏳ <b>Запрос в очереди</b>
+
+Ваша позиция: <b>{position}</b>
+Генерация начнется автоматически.
+""",
+        MessageKey.SERVICE_UNAVAILABLE: """
+⚠️ <b>Сервис генерации временно недоступен</b>
+
+Проверка доступности через {retry_after} сек.
+Пожалуйста, повторите запрос позже.
 """,
         MessageKey.REMOVING_BG: """
 ⏳ <b>Удаление фона...</b>
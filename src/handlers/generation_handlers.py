@@ -1,5 +1,6 @@
 from aiogram import types
 from aiogram.types import CallbackQuery, BufferedInputFile
+import asyncio
 import logging
 import base64
 import os
@@ -10,6 +11,7 @@ from ..utils.image_processor import ImageProcessor
 from ..constants.messages import Messages
 from ..constants.bot_constants import IMAGE_STYLES
 from ..api.fusion_brain import Text2ImageAPI, CensorshipError
+from ..api.polling import PollSchedule, generation_stats
 from .command_handlers import (
     user_states,
     user_settings,
@@ -111,9 +113,12 @@ async def regenerate_image(callback_query: CallbackQuery):
 async def check_generation_status(api: Text2ImageAPI, uuid: str, status_message: types.Message, user_id: int):
     """Проверяет статус генерации изображения"""
     try:
-        while True:
+        schedule = PollSchedule(generation_stats)
+        while not schedule.expired():
+            await asyncio.sleep(schedule.next_delay())
             result = await api.check_generation(uuid)
             if result:
+                generation_stats.record(schedule.elapsed())
                 # Декодируем base64 в байты
                 image_data = base64.b64decode(result)
                 
@@ -133,6 +138,7 @@ async def check_generation_status(api: Text2ImageAPI, uuid: str, status_message:
                 # Удаляем статусное сообщение
                 await status_message.delete()
                 return True
+        raise Exception("Превышено время ожидания генерации")
     except Exception as e:
         logger.error(f"Error checking generation status: {str(e)}")
         await status_message.edit_text(
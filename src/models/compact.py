@@ -0,0 +1,121 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, Hashable, Iterable, List, Union
+
+from ..constants.bot_constants import IMAGE_SIZES, ImageSize, StyleType
+
+Timestamp = Union[datetime, float, None]
+
+class CodeTable:
+    """Таблица интернирования: каждое значение хранится один раз, экземпляры держат маленький код"""
+
+    def __init__(self, values: Iterable[Hashable]):
+        self._values: List[Hashable] = []
+        self._codes: Dict[Hashable, int] = {}
+        for value in values:
+            self.code(value)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def code(self, value: Hashable) -> int:
+        """Возвращает код значения, новое значение добавляется в таблицу"""
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self._values)
+            self._values.append(value)
+            self._codes[value] = code
+        return code
+
+    def value(self, code: int) -> Any:
+        """Возвращает значение по коду"""
+        return self._values[code]
+
+# Коды стилей совпадают с порядком StyleType, коды размеров — с порядком IMAGE_SIZES
+STYLE_CODES = CodeTable(style.name for style in StyleType)
+SIZE_CODES = CodeTable((config["width"], config["height"]) for config in IMAGE_SIZES.values())
+
+def _to_timestamp(value: Timestamp) -> float:
+    """Приводит время к timestamp; None означает текущий момент"""
+    if value is None:
+        return time.time()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+def _validate_size(width: int, height: int):
+    """Проверка размеров по тем же правилам, что и в UserSettings"""
+    if not isinstance(width, int) or not isinstance(height, int):
+        raise ValueError("Width and height must be integers")
+    if width < ImageSize.MIN_SIZE or width > ImageSize.MAX_SIZE or height < ImageSize.MIN_SIZE or height > ImageSize.MAX_SIZE:
+        raise ValueError("Width and height must be between 64 and 2048")
+
+class CompactUserSettings:
+    """Настройки пользователя без __dict__: размер и стиль хранятся кодами, время — timestamp"""
+    __slots__ = ('_size', '_style', '_created_at', '_last_modified')
+
+    def __init__(self, width: int = ImageSize.DEFAULT_SIZE, height: int = ImageSize.DEFAULT_SIZE,
+                 style: str = StyleType.DEFAULT.name, created_at: Timestamp = None,
+                 last_modified: Timestamp = None):
+        self._validate(width, height, style)
+        self._size = SIZE_CODES.code((width, height))
+        self._style = STYLE_CODES.code(style)
+        self._created_at = _to_timestamp(created_at)
+        self._last_modified = _to_timestamp(last_modified)
+
+    @staticmethod
+    def _validate(width: int, height: int, style: str):
+        """Проверка корректности значений"""
+        _validate_size(width, height)
+        if not isinstance(style, str):
+            raise ValueError("Style must be a string")
+
+    @property
+    def width(self) -> int:
+        return SIZE_CODES.value(self._size)[0]
+
+    @property
+    def height(self) -> int:
+        return SIZE_CODES.value(self._size)[1]
+
+    @property
+    def style(self) -> str:
+        return STYLE_CODES.value(self._style)
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromtimestamp(self._created_at)
+
+    @property
+    def last_modified(self) -> datetime:
+        return datetime.fromtimestamp(self._last_modified)
+
+    def update(self, **kwargs):
+        """Обновление настроек с валидацией"""
+        width = kwargs.pop('width', self.width)
+        height = kwargs.pop('height', self.height)
+        style = kwargs.pop('style', self.style)
+        self._validate(width, height, style)
+        self._size = SIZE_CODES.code((width, height))
+        self._style = STYLE_CODES.code(style)
+        if 'created_at' in kwargs:
+            self._created_at = _to_timestamp(kwargs['created_at'])
+        self._last_modified = time.time()
+
+    def to_dict(self) -> dict:
+        """Преобразование в словарь для сохранения (формат совпадает с UserSettings)"""
+        return {
+            "width": self.width,
+            "height": self.height,
+            "style": self.style,
+            "created_at": self.created_at.isoformat(),
+            "last_modified": self.last_modified.isoformat()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CompactUserSettings':
+        """Создание объекта из словаря"""
+        data = data.copy()
+        data['created_at'] = datetime.fromisoformat(data['created_at'])
+        data['last_modified'] = datetime.fromisoformat(data['last_modified'])
+        return cls(**data)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from ..constants.bot_constants import UserStateConstants
+from ..utils.disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+class UserStateStore:
+    """Хранилище состояний пользователей с ограничением памяти и вытеснением неактивных"""
+
+    STATE_OVERHEAD = 512  # Оценка размера пустого состояния в байтах
+    EXPIRY_MAX_SLEEP = 60.0  # Максимальная пауза фоновой очистки в секундах
+
+    def __init__(self, factory: Callable[[], Any], blob_store: DiskCache,
+                 max_users: int = UserStateConstants.MAX_USERS,
+                 max_bytes: int = UserStateConstants.MEMORY_BUDGET,
+                 idle_timeout: float = UserStateConstants.IDLE_TIMEOUT):
+        self.factory = factory
+        self.blob_store = blob_store
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        # user_id -> [состояние, время последнего обращения]; порядок — от давно неактивных к недавним
+        self._entries: "OrderedDict[int, List[Any]]" = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._total_bytes = 0
+        self.evictions = 0
+        self._expiry_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    def __getitem__(self, user_id: int) -> Any:
+        """Возвращает состояние пользователя, создавая его при первом обращении (как defaultdict)"""
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = [self.factory(), now]
+            self._entries[user_id] = entry
+        else:
+            entry[1] = now
+            self._entries.move_to_end(user_id)
+
+        # Размер пересчитывается при обращении: учитываются изменения с прошлого раза
+        size = self._estimate_size(entry[0])
+        self._total_bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+
+        self._evict()
+        return entry[0]
+
+    @property
+    def total_bytes(self) -> int:
+        """Оценочный объем состояний в памяти"""
+        return self._total_bytes
+
+    @classmethod
+    def _estimate_size(cls, state: Any) -> int:
+        """Оценивает размер состояния по строкам и байтам в его полях"""
+        size = cls.STATE_OVERHEAD
+        slots = getattr(type(state), '__slots__', None)
+        values = [getattr(state, name, None) for name in slots] if slots is not None else vars(state).values()
+        for value in values:
+            if isinstance(value, str):
+                size += len(value.encode('utf-8'))
+            elif isinstance(value, (bytes, bytearray)):
+                size += len(value)
+        return size
+
+    def _evict(self):
+        """Вытесняет давно неактивных пользователей только при превышении лимитов
+
+        Неактивные по таймауту удаляются фоновой очисткой (expire_idle), чтобы обращения не платили за нее.
+        """
+        while len(self._entries) > 1:
+            if len(self._entries) <= self.max_users and self._total_bytes <= self.max_bytes:
+                break
+            user_id = next(iter(self._entries))
+            self._remove(user_id)
+            self.evictions += 1
+
+    def expire_idle(self, now: Optional[float] = None) -> int:
+        """Удаляет пользователей, неактивных дольше idle_timeout; просматриваются только истекшие записи"""
+        now = time.monotonic() if now is None else now
+        removed = 0
+        while self._entries:
+            user_id, (_, last_access) = next(iter(self._entries.items()))
+            if now - last_access <= self.idle_timeout:
+                break
+            self._remove(user_id)
+            removed += 1
+        if removed:
+            self.evictions += removed
+            logger.info(f"Удалено неактивных пользователей: {removed}")
+        return removed
+
+    async def _expiry_loop(self):
+        """Фоновая очистка: спит до истечения самой давней записи"""
+        while True:
+            delay = self.EXPIRY_MAX_SLEEP
+            if self._entries:
+                _, last_access = next(iter(self._entries.values()))
+                delay = min(delay, max(0.0, last_access + self.idle_timeout - time.monotonic()))
+            await asyncio.sleep(delay)
+            self.expire_idle()
+
+    def start_expiry(self):
+        """Запускает фоновую очистку: без нее неактивные удаляются только при превышении лимитов"""
+        if self._expiry_task is None or self._expiry_task.done():
+            self._expiry_task = asyncio.create_task(self._expiry_loop())
+
+    async def stop_expiry(self):
+        """Останавливает фоновую очистку"""
+        task, self._expiry_task = self._expiry_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _remove(self, user_id: int):
+        """Удаляет состояние и изображение пользователя"""
+        self._entries.pop(user_id, None)
+        self._total_bytes -= self._sizes.pop(user_id, 0)
+        try:
+            self.blob_store.delete(self._blob_key(user_id))
+        except OSError as e:
+            logger.warning(f"Не удалось удалить изображение пользователя {user_id}: {str(e)}")
+
+    def pop(self, user_id: int):
+        """Полностью удаляет данные пользователя"""
+        self._remove(user_id)
+
+    @staticmethod
+    def _blob_key(user_id: int) -> str:
+        """Ключ изображения пользователя на диске"""
+        return DiskCache.make_key(str(user_id).encode('utf-8'), 'last_image')
+
+    async def save_image(self, user_id: int, image_data: Optional[bytes], image_id: str, file_id: Optional[str] = None):
+        """Запоминает последнее изображение пользователя, в памяти остаются только идентификаторы
+
+        Файл пишется в пуле потоков, чтобы запись нескольких мегабайт не блокировала цикл событий.
+        """
+        state = self[user_id]
+        key = self._blob_key(user_id)
+        loop = asyncio.get_running_loop()
+        if file_id:
+            # Изображение уже в Telegram: байты не храним, при необходимости их скачают по file_id
+            await loop.run_in_executor(None, self.blob_store.delete, key)
+        else:
+            await loop.run_in_executor(None, self.blob_store.put, key, image_data)
+        state.last_image_id = image_id
+        state.last_image_file_id = file_id
+
+    async def load_image(self, user_id: int) -> Optional[bytes]:
+        """Загружает сохраненное на диске изображение пользователя или None (чтение в пуле потоков)"""
+        if user_id not in self._entries or not self._entries[user_id][0].last_image_id:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(None, self.blob_store.get, self._blob_key(user_id))
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика хранилища"""
+        return {
+            'users': len(self._entries),
+            'bytes': self._total_bytes,
+            'evictions': self.evictions,
+            'image_bytes': self.blob_store.total_bytes
+        }
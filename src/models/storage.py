@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from ..constants.bot_constants import StorageConstants
+
+logger = logging.getLogger(__name__)
+
+class StorageError(Exception):
+    """Ошибка хранилища данных пользователей"""
+    pass
+
+class StorageBackend(ABC):
+    """Хранилище данных пользователей: словари JSON по пространству имен и ключу"""
+
+    @abstractmethod
+    async def load(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        """Загружает запись или возвращает None"""
+
+    @abstractmethod
+    async def save_many(self, namespace: str, items: Dict[str, Dict[str, Any]]):
+        """Сохраняет несколько записей одной пачкой"""
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str):
+        """Удаляет запись"""
+
+    async def save(self, namespace: str, key: str, value: Dict[str, Any]):
+        """Сохраняет одну запись"""
+        await self.save_many(namespace, {key: value})
+
+    async def close(self):
+        """Освобождает ресурсы хранилища"""
+
+class MemoryStorage(StorageBackend):
+    """Хранилище в памяти процесса (данные теряются при перезапуске)"""
+
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], str] = {}
+
+    async def load(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        raw = self._data.get((namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    async def save_many(self, namespace: str, items: Dict[str, Dict[str, Any]]):
+        # Храним копию в JSON, чтобы поведение совпадало с постоянными хранилищами
+        for key, value in items.items():
+            self._data[(namespace, key)] = json.dumps(value)
+
+    async def delete(self, namespace: str, key: str):
+        self._data.pop((namespace, key), None)
+
+class SQLiteStorage(StorageBackend):
+    """Хранилище SQLite в режиме WAL; все обращения идут через один поток"""
+
+    def __init__(self, path: str = StorageConstants.SQLITE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        # Соединение используется только потоком исполнителя, поэтому check_same_thread отключен
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    async def _run(self, func, *args):
+        """Выполняет операцию с базой в потоке исполнителя"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _load_sync(self, namespace: str, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _save_many_sync(self, rows: List[Tuple[str, str, str]]):
+        # Вся пачка записывается одной транзакцией
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)", rows
+            )
+
+    def _delete_sync(self, namespace: str, key: str):
+        with self._conn:
+            self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    async def load(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self._run(self._load_sync, namespace, key)
+        return json.loads(raw) if raw is not None else None
+
+    async def save_many(self, namespace: str, items: Dict[str, Dict[str, Any]]):
+        if not items:
+            return
+        rows = [(namespace, key, json.dumps(value)) for key, value in items.items()]
+        await self._run(self._save_many_sync, rows)
+
+    async def delete(self, namespace: str, key: str):
+        await self._run(self._delete_sync, namespace, key)
+
+    async def close(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+class RedisStorage(StorageBackend):
+    """Хранилище по протоколу Redis (RESP); подходит любой совместимый сервер"""
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 prefix: str = StorageConstants.KEY_PREFIX):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.prefix = prefix
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_url(cls, url: str = StorageConstants.REDIS_URL) -> 'RedisStorage':
+        """Создает хранилище по адресу вида redis://host:port/db"""
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip('/') or 0)
+        return cls(host=parsed.hostname or "localhost", port=parsed.port or 6379, db=db)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        """Кодирует команду в формате RESP"""
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        """Читает один ответ сервера"""
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Соединение с Redis закрыто")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode('utf-8')
+        if kind == b"-":
+            raise StorageError(f"Ошибка Redis: {payload.decode('utf-8')}")
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise StorageError(f"Неизвестный ответ Redis: {line!r}")
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.db:
+            self._writer.write(self._encode("SELECT", self.db))
+            await self._writer.drain()
+            await self._read_reply()
+
+    async def _execute(self, *commands: Tuple) -> List[Any]:
+        """Отправляет команды одним пакетом (pipeline) и читает ответы"""
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                self._writer.write(b"".join(self._encode(*command) for command in commands))
+                await self._writer.drain()
+                return [await self._read_reply() for _ in commands]
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                await self._disconnect()
+                raise StorageError(f"Redis недоступен: {str(e)}")
+
+    async def _disconnect(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def load(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        (raw,) = await self._execute(("GET", self._key(namespace, key)))
+        return json.loads(raw) if raw is not None else None
+
+    async def save_many(self, namespace: str, items: Dict[str, Dict[str, Any]]):
+        if not items:
+            return
+        await self._execute(*(
+            ("SET", self._key(namespace, key), json.dumps(value)) for key, value in items.items()
+        ))
+
+    async def delete(self, namespace: str, key: str):
+        await self._execute(("DEL", self._key(namespace, key)))
+
+    async def close(self):
+        async with self._lock:
+            await self._disconnect()
+
+def create_storage(kind: str = StorageConstants.BACKEND, sqlite_path: str = StorageConstants.SQLITE_PATH,
+                   redis_url: str = StorageConstants.REDIS_URL) -> StorageBackend:
+    """Создает хранилище по названию: memory, sqlite или redis"""
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    if kind == "redis":
+        return RedisStorage.from_url(redis_url)
+    raise ValueError(f"Неизвестный тип хранилища: {kind}")
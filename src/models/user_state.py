@@ -1,8 +1,15 @@
 from dataclasses import dataclass, field
-from typing import Optional, Dict
+from typing import Optional, Dict, Set
+import asyncio
 import logging
+import time
+from collections import OrderedDict, defaultdict
 from datetime import datetime, timedelta
 
+from ..constants.bot_constants import StorageConstants
+from .compact import CompactUserSettings
+from .storage import StorageBackend, MemoryStorage
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -68,46 +75,158 @@ class UserSettings:
         self.last_modified = datetime.now()
         self.validate()
 
+    def to_dict(self) -> dict:
+        """Преобразование в словарь для сохранения"""
+        return {
+            "width": self.width,
+            "height": self.height,
+            "style": self.style,
+            "created_at": self.created_at.isoformat(),
+            "last_modified": self.last_modified.isoformat()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'UserSettings':
+        """Создание объекта из словаря"""
+        data = data.copy()
+        data['created_at'] = datetime.fromisoformat(data['created_at'])
+        data['last_modified'] = datetime.fromisoformat(data['last_modified'])
+        return cls(**data)
+
 class UserStateManager:
-    """Менеджер состояний пользователей с автоочисткой неактивных сессий"""
-    _states: Dict[int, UserState] = {}
-    _settings: Dict[int, UserSettings] = {}
-    _last_cleanup: datetime = datetime.now()
-    CLEANUP_INTERVAL = timedelta(minutes=60)
-    INACTIVE_TIMEOUT = timedelta(minutes=30)
-    
+    """Менеджер настроек пользователей; сессии хранит UserStateStore вместе с очисткой неактивных"""
+    # Кэш настроек (компактное представление), источник истины — хранилище
+    settings: Dict[int, CompactUserSettings] = defaultdict(CompactUserSettings)
+    SETTINGS_NAMESPACE = "settings"
+    FLUSH_INTERVAL = StorageConstants.FLUSH_INTERVAL
+    SETTINGS_RELOAD_INTERVAL = StorageConstants.SETTINGS_RELOAD_INTERVAL
+    SETTINGS_CACHE_SIZE = StorageConstants.SETTINGS_CACHE_SIZE
+    SETTINGS_IDLE_TIMEOUT = StorageConstants.SETTINGS_IDLE_TIMEOUT
+    _backend: StorageBackend = MemoryStorage()
+    _loaded_at: Dict[int, float] = {}  # Когда настройки пользователя читались из хранилища
+    # Время последнего обращения; порядок — от давно неактивных к недавним
+    _last_access: "OrderedDict[int, float]" = OrderedDict()
+    _dirty: Set[int] = set()  # Пользователи с несохраненными настройками
+    _saving: Set[int] = set()  # Настройки, которые сейчас записываются в хранилище
+    _flush_task: Optional[asyncio.Task] = None
+
     @classmethod
-    def get_state(cls, user_id: int) -> UserState:
-        """Получение состояния пользователя"""
-        if user_id not in cls._states:
-            cls._states[user_id] = UserState()
-        cls._states[user_id].update_activity()
-        cls._cleanup_if_needed()
-        return cls._states[user_id]
+    def configure(cls, backend: StorageBackend):
+        """Задает хранилище настроек"""
+        cls._backend = backend
+        cls._loaded_at.clear()
     
     @classmethod
-    def get_settings(cls, user_id: int) -> UserSettings:
-        """Получение настроек пользователя"""
-        if user_id not in cls._settings:
-            cls._settings[user_id] = UserSettings()
-        return cls._settings[user_id]
-    
+    def get_settings(cls, user_id: int) -> CompactUserSettings:
+        """Получение настроек пользователя из кэша"""
+        return cls.settings[user_id]
+
+    @classmethod
+    def _touch(cls, user_id: int):
+        """Отмечает обращение к настройкам и убирает из кэша лишние"""
+        now = time.monotonic()
+        cls._last_access[user_id] = now
+        cls._last_access.move_to_end(user_id)
+        cls._evict(now)
+
+    @classmethod
+    def _evict(cls, now: float):
+        """Убирает из кэша давно неактивных сверх лимита или по простою; несохраненные остаются до записи"""
+        excess = len(cls._last_access) - cls.SETTINGS_CACHE_SIZE
+        victims = []
+        for user_id, last_access in cls._last_access.items():
+            if excess <= 0 and now - last_access <= cls.SETTINGS_IDLE_TIMEOUT:
+                break
+            if user_id in cls._dirty or user_id in cls._saving:
+                continue
+            victims.append(user_id)
+            excess -= 1
+        for user_id in victims:
+            cls._forget(user_id)
+
+    @classmethod
+    def _forget(cls, user_id: int):
+        """Убирает настройки пользователя из кэша (в хранилище они остаются)"""
+        cls.settings.pop(user_id, None)
+        cls._loaded_at.pop(user_id, None)
+        cls._last_access.pop(user_id, None)
+
+    @classmethod
+    async def load_settings(cls, user_id: int) -> CompactUserSettings:
+        """Загружает настройки из хранилища, если в кэше их нет или они устарели"""
+        cls._touch(user_id)
+        loaded_at = cls._loaded_at.get(user_id)
+        fresh = loaded_at is not None and time.monotonic() - loaded_at < cls.SETTINGS_RELOAD_INTERVAL
+        if fresh or user_id in cls._dirty:
+            return cls.settings[user_id]
+
+        try:
+            data = await cls._backend.load(cls.SETTINGS_NAMESPACE, str(user_id))
+        except Exception as e:
+            logger.error(f"Не удалось загрузить настройки пользователя {user_id}: {str(e)}")
+            return cls.settings[user_id]
+
+        # Пока шла загрузка, пользователь мог изменить настройки — их не перезаписываем
+        if user_id not in cls._dirty:
+            if data:
+                cls.settings[user_id] = CompactUserSettings.from_dict(data)
+            cls._loaded_at[user_id] = time.monotonic()
+        return cls.settings[user_id]
+
+    @classmethod
+    def update_settings(cls, user_id: int, **kwargs) -> CompactUserSettings:
+        """Изменяет настройки; запись в хранилище выполняется позже в фоне"""
+        cls._touch(user_id)
+        settings = cls.settings[user_id]
+        settings.update(**kwargs)
+        cls._dirty.add(user_id)
+        if cls._flush_task is None or cls._flush_task.done():
+            cls._flush_task = asyncio.create_task(cls._flush_later())
+        return settings
+
+    @classmethod
+    async def _flush_later(cls):
+        """Собирает изменения за FLUSH_INTERVAL и записывает их одной пачкой"""
+        await asyncio.sleep(cls.FLUSH_INTERVAL)
+        await cls.flush()
+
+    @classmethod
+    async def flush(cls):
+        """Записывает измененные настройки в хранилище"""
+        if not cls._dirty:
+            return
+        dirty, cls._dirty = cls._dirty, set()
+        items = {str(user_id): cls.settings[user_id].to_dict() for user_id in dirty}
+        # До окончания записи настройки не вытесняются: при ошибке они снова попадут в очередь
+        cls._saving = dirty
+        try:
+            await cls._backend.save_many(cls.SETTINGS_NAMESPACE, items)
+            now = time.monotonic()
+            for user_id in dirty:
+                cls._loaded_at[user_id] = now
+            logger.info(f"Сохранены настройки {len(items)} пользователей")
+        except Exception as e:
+            # Вернем изменения в очередь, их запишет следующий сброс
+            cls._dirty |= dirty
+            logger.error(f"Не удалось сохранить настройки: {str(e)}")
+        finally:
+            cls._saving = set()
+
     @classmethod
-    def _cleanup_if_needed(cls):
-        """Очистка неактивных сессий"""
-        now = datetime.now()
-        if now - cls._last_cleanup > cls.CLEANUP_INTERVAL:
-            inactive_users = [
-                user_id for user_id, state in cls._states.items()
-                if now - state.last_activity > cls.INACTIVE_TIMEOUT
-            ]
-            for user_id in inactive_users:
-                cls._states.pop(user_id, None)
-                logger.info(f"Cleaned up inactive session for user {user_id}")
-            cls._last_cleanup = now
+    async def shutdown(cls):
+        """Записывает несохраненные настройки и закрывает хранилище"""
+        task, cls._flush_task = cls._flush_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await cls.flush()
+        await cls._backend.close()
     
     @classmethod
     def clear_user_data(cls, user_id: int):
         """Полная очистка данных пользователя"""
-        cls._states.pop(user_id, None)
-        cls._settings.pop(user_id, None)
+        cls._forget(user_id)
+        cls._dirty.discard(user_id)
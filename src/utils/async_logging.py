@@ -0,0 +1,71 @@
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from ..constants.bot_constants import LoggingConstants
+
+class DroppingQueueHandler(QueueHandler):
+    """Кладет записи в ограниченную очередь; при переполнении запись отбрасывается и учитывается"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    @property
+    def dropped(self) -> int:
+        """Количество отброшенных записей"""
+        return self._dropped
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Диск не успевает — теряем запись, но не блокируем цикл событий
+            with self._dropped_lock:
+                self._dropped += 1
+
+class _DrainingQueueListener(QueueListener):
+    """QueueListener, который при остановке дожидается места в очереди для сигнала завершения"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+class QueueLogging:
+    """Переносит обработчики логгера в фоновый поток через ограниченную очередь"""
+
+    def __init__(self, logger: logging.Logger, max_size: int = LoggingConstants.QUEUE_SIZE):
+        self.logger = logger
+        self.handlers = list(logger.handlers)
+        self.queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        self.listener = _DrainingQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self._started = False
+
+    @property
+    def dropped(self) -> int:
+        """Количество отброшенных из-за переполнения записей"""
+        return self.queue_handler.dropped
+
+    def start(self):
+        """Заменяет обработчики логгера очередью и запускает фоновый поток записи"""
+        if self._started:
+            return
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.queue_handler)
+        self.listener.start()
+        self._started = True
+
+    def stop(self):
+        """Дописывает накопленные записи и возвращает обработчики логгеру"""
+        if not self._started:
+            return
+        self.listener.stop()
+        self.logger.removeHandler(self.queue_handler)
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+        self._started = False
+        if self.dropped:
+            self.logger.warning(f"Отброшено записей лога из-за переполнения очереди: {self.dropped}")
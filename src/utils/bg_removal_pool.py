@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from ..constants.bot_constants import ImageProcessingConstants
+from .image_processor import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+class PoolBusyError(Exception):
+    """Очередь задач удаления фона переполнена"""
+    pass
+
+class BackgroundRemovalTimeoutError(Exception):
+    """Задача удаления фона не уложилась в отведенное время"""
+    pass
+
+def _init_worker():
+    """Инициализация обработчика: загружает собственную сессию rembg"""
+    try:
+        ImageProcessor.warm_up()
+    except Exception as e:
+        # Ошибка инициализатора ломает весь пул, поэтому модель загрузится при первой задаче
+        logger.error(f"Не удалось загрузить модель в обработчике: {str(e)}")
+
+def _remove_background_job(image_data: bytes) -> bytes:
+    """Задача удаления фона, выполняемая в обработчике пула"""
+    return ImageProcessor.remove_background(image_data)
+
+def _ping_job() -> bool:
+    """Пустая задача для запуска обработчиков заранее"""
+    return True
+
+class BackgroundRemovalPool:
+    """Отдельный пул обработчиков для удаления фона с ограниченной очередью"""
+
+    def __init__(self, workers: int = ImageProcessingConstants.BG_WORKERS,
+                 use_processes: bool = ImageProcessingConstants.BG_USE_PROCESSES,
+                 max_queue: int = ImageProcessingConstants.BG_MAX_QUEUE,
+                 job_timeout: float = ImageProcessingConstants.BG_JOB_TIMEOUT):
+        self.workers = workers
+        self.use_processes = use_processes
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+
+    @property
+    def capacity(self) -> int:
+        """Сколько задач может одновременно находиться в пуле"""
+        return self.workers + self.max_queue
+
+    @property
+    def in_flight(self) -> int:
+        """Количество задач в работе и в очереди"""
+        return self._in_flight
+
+    def _get_executor(self) -> Executor:
+        """Создает исполнитель при первом обращении или после сбоя"""
+        if self._executor is None:
+            if self.use_processes:
+                # spawn: fork процесса с уже запущенными потоками onnxruntime может зависнуть
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(ImageProcessingConstants.BG_START_METHOD),
+                    initializer=_init_worker
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='rembg',
+                    initializer=_init_worker
+                )
+            logger.info(
+                f"Пул удаления фона создан: workers={self.workers}, "
+                f"processes={self.use_processes}, max_queue={self.max_queue}",
+                extra={'operation': 'BG_POOL_START'}
+            )
+        return self._executor
+
+    async def start(self):
+        """Запускает обработчики заранее, чтобы модель загрузилась до первых запросов"""
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, _ping_job) for _ in range(self.workers)
+        ))
+
+    def shutdown(self):
+        """Останавливает обработчики, не дожидаясь задач в очереди"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.info("Пул удаления фона остановлен", extra={'operation': 'BG_POOL_STOP'})
+
+    def _release(self, future: asyncio.Future):
+        """Освобождает место в очереди, когда обработчик действительно закончил задачу"""
+        self._in_flight -= 1
+        if not future.cancelled():
+            future.exception()  # Помечаем ошибку как полученную, если ожидающий ушел по таймауту
+
+    async def remove_background(self, image_data: bytes) -> bytes:
+        """Удаляет фон в пуле обработчиков"""
+        if self._in_flight >= self.capacity:
+            logger.warning(
+                f"Очередь удаления фона переполнена: {self._in_flight}/{self.capacity}",
+                extra={'operation': 'BG_POOL_BUSY'}
+            )
+            raise PoolBusyError("Слишком много запросов на удаление фона. Попробуйте через минуту.")
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._get_executor(), _remove_background_job, image_data)
+        except BrokenProcessPool:
+            self._executor = None
+            future = loop.run_in_executor(self._get_executor(), _remove_background_job, image_data)
+
+        # Место занято, пока задача реально выполняется, даже если ожидающий ушел по таймауту
+        self._in_flight += 1
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            raise BackgroundRemovalTimeoutError("Превышено время обработки изображения. Попробуйте позже.")
+        except BrokenProcessPool:
+            # Обработчик упал (например, из-за нехватки памяти) — пересоздаем пул при следующем запросе
+            self._executor = None
+            raise
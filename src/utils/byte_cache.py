@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class ByteLRUCache:
+    """Потокобезопасный LRU-кэш, ограниченный числом записей и суммарным объемом в байтах"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    @property
+    def total_bytes(self) -> int:
+        """Суммарный объем закэшированных значений"""
+        return self._total_bytes
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Возвращает значение и помечает его как недавно использованное"""
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> bool:
+        """Сохраняет значение; возвращает False, если оно больше всего бюджета"""
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._total_bytes += size
+            while len(self._data) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Удаляет запись и возвращает ее значение"""
+        with self._lock:
+            if key not in self._data:
+                return None
+            return self._remove(key)
+
+    def _remove(self, key: Hashable) -> Any:
+        """Удаляет запись (вызывается под блокировкой)"""
+        self._total_bytes -= self._sizes.pop(key)
+        return self._data.pop(key)
+
+    def clear(self):
+        """Очищает кэш, счетчики сохраняются"""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика использования кэша"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class DiskCache:
+    """Контентно-адресуемый кэш на диске с ограничением объема и LRU-вытеснением"""
+
+    # После вытеснения оставляем запас, чтобы не чистить каталог на каждой записи
+    EVICT_TARGET_RATIO = 0.9
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._scan())
+
+    @staticmethod
+    def make_key(data: bytes, *params) -> str:
+        """Ключ по содержимому и параметрам обработки"""
+        digest = hashlib.sha256(data)
+        for param in params:
+            digest.update(b"\0" + str(param).encode('utf-8'))
+        return digest.hexdigest()
+
+    @property
+    def total_bytes(self) -> int:
+        """Объем кэша по оценке текущего процесса"""
+        return self._total_bytes
+
+    def _path(self, key: str) -> str:
+        """Путь к файлу записи (двухуровневая раскладка по префиксу ключа)"""
+        return os.path.join(self.directory, key[:2], key)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """Список файлов кэша: (время последнего использования, путь, размер)"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Читает запись целиком и отмечает ее использование"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime служит временем последнего использования для LRU
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать запись дискового кэша {key}: {str(e)}")
+            return None
+
+    def put(self, key: str, data: bytes):
+        """Атомарно записывает значение: временный файл и переименование"""
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            try:
+                # Перезапись учитывается разницей размеров, иначе оценка объема расходится с диском
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            self._total_bytes = max(0, self._total_bytes + len(data) - old_size)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key: str):
+        """Удаляет запись, если она есть"""
+        try:
+            size = os.stat(self._path(key)).st_size
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._total_bytes = max(0, self._total_bytes - size)
+
+    def _evict(self):
+        """Удаляет давно не использованные файлы, пока объем не опустится ниже порога"""
+        entries = sorted(self._scan())
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * self.EVICT_TARGET_RATIO
+        removed = 0
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._total_bytes = total
+        logger.info(f"Дисковый кэш: удалено {removed} записей, объем {total} байт")
+
+    def clear(self):
+        """Удаляет все записи кэша"""
+        with self._lock:
+            for _, path, _ in self._scan():
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self._total_bytes = 0
@@ -1,19 +1,56 @@
 from PIL import Image
-from rembg import remove
 import io
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Any
 import logging
-from functools import lru_cache
 import hashlib
+import os
+import threading
+import time
+
+from ..constants.bot_constants import ImageProcessingConstants
+from .byte_cache import ByteLRUCache
+from .disk_cache import DiskCache
 
 logger = logging.getLogger(__name__)
 
+# rembg и onnxruntime загружаются при первом удалении фона: импорт занимает секунды,
+# а многим сессиям бота удаление фона не нужно
+remove = None
+new_session = None
+_rembg_lock = threading.Lock()
+
+def _load_rembg():
+    """Импортирует rembg при первом обращении"""
+    global remove, new_session
+    if remove is not None and new_session is not None:
+        return
+    with _rembg_lock:
+        if remove is not None and new_session is not None:
+            return
+        started = time.perf_counter()
+        import rembg
+        # Уже заданные (например, подмененные в тестах) функции не перезаписываем
+        if remove is None:
+            remove = rembg.remove
+        if new_session is None:
+            new_session = rembg.new_session
+        logger.info(f"rembg загружен за {time.perf_counter() - started:.2f} сек")
+
 class ImageProcessor:
     """Класс для обработки изображений с оптимизированным кэшированием и обработкой ошибок"""
     MAX_SIZE = 1500
+    MODEL_NAME = "u2net"  # Модель rembg по умолчанию
     _model = None
-    _cache: Dict[str, bytes] = {}
+    _sessions: Dict[str, Any] = {}  # Постоянные ONNX-сессии rembg по имени модели
+    _sessions_lock = threading.Lock()
+    OUTPUT_FORMAT = os.getenv('BG_OUTPUT_FORMAT', ImageProcessingConstants.BG_OUTPUT_FORMAT).upper()
+    PNG_COMPRESS_LEVEL = ImageProcessingConstants.BG_PNG_COMPRESS_LEVEL
+    WEBP_QUALITY = ImageProcessingConstants.BG_WEBP_QUALITY
     MAX_CACHE_SIZE = 100  # Максимальное количество кэшированных результатов
+    MAX_CACHE_BYTES = ImageProcessingConstants.BG_CACHE_MAX_BYTES  # Максимальный объем кэша
+    _cache = ByteLRUCache(max_entries=MAX_CACHE_SIZE, max_bytes=MAX_CACHE_BYTES)
+    _disk_cache: Optional[DiskCache] = None  # Дисковый уровень кэша, создается при первом обращении
+    _disk_cache_configured = False
 
     @classmethod
     def _get_model(cls):
@@ -21,14 +58,64 @@ class ImageProcessor:
         logger.info("Получение модели для удаления фона")
         if cls._model is None:
             logger.info("Инициализация новой модели")
+            _load_rembg()
             cls._model = remove
         return cls._model
 
+    @classmethod
+    def _get_session(cls, model_name: Optional[str] = None):
+        """Возвращает постоянную сессию rembg, модель загружается один раз"""
+        model_name = model_name or cls.MODEL_NAME
+        session = cls._sessions.get(model_name)
+        if session is None:
+            with cls._sessions_lock:
+                session = cls._sessions.get(model_name)
+                if session is None:
+                    logger.info(f"Создание сессии rembg для модели {model_name}")
+                    _load_rembg()
+                    session = new_session(model_name)
+                    cls._sessions[model_name] = session
+        return session
+
+    @classmethod
+    def warm_up(cls, model_name: Optional[str] = None):
+        """Заранее загружает модель, чтобы первый запрос не ждал инициализации"""
+        cls._get_session(model_name)
+        logger.info(f"Модель {model_name or cls.MODEL_NAME} загружена")
+
     @staticmethod
     def _calculate_hash(image_data: bytes) -> str:
         """Вычисляет хеш изображения для кэширования"""
         return hashlib.md5(image_data).hexdigest()
 
+    @classmethod
+    def _cache_key(cls, image_data: bytes) -> str:
+        """Ключ кэша: содержимое изображения и параметры обработки"""
+        return DiskCache.make_key(
+            image_data, cls.MODEL_NAME, cls.MAX_SIZE,
+            cls.OUTPUT_FORMAT, cls.PNG_COMPRESS_LEVEL, cls.WEBP_QUALITY
+        )
+
+    @classmethod
+    def configure_disk_cache(cls, directory: Optional[str], max_bytes: int = ImageProcessingConstants.BG_DISK_CACHE_MAX_BYTES):
+        """Включает дисковый кэш в каталоге directory или отключает его (None)"""
+        cls._disk_cache = DiskCache(directory, max_bytes) if directory else None
+        cls._disk_cache_configured = True
+
+    @classmethod
+    def _get_disk_cache(cls) -> Optional[DiskCache]:
+        """Возвращает дисковый кэш; настройки читаются из окружения, чтобы их видели и процессы-обработчики"""
+        if not cls._disk_cache_configured:
+            directory = os.getenv('IMAGE_CACHE_DIR', ImageProcessingConstants.BG_DISK_CACHE_DIR)
+            max_mb = os.getenv('IMAGE_CACHE_MAX_MB')
+            max_bytes = int(max_mb) * 1024 * 1024 if max_mb else ImageProcessingConstants.BG_DISK_CACHE_MAX_BYTES
+            try:
+                cls.configure_disk_cache(directory, max_bytes)
+            except OSError as e:
+                logger.error(f"Дисковый кэш недоступен: {str(e)}")
+                cls.configure_disk_cache(None)
+        return cls._disk_cache
+
     @classmethod
     def _resize_if_needed(cls, image: Image.Image) -> Tuple[Image.Image, Optional[Tuple[int, int]]]:
         """Уменьшает изображение, если оно слишком большое"""
@@ -51,35 +138,42 @@ class ImageProcessor:
         return image, original_size
 
     @classmethod
-    @lru_cache(maxsize=32)
-    def _restore_size(cls, width: int, height: int, original_width: int, original_height: int) -> Tuple[int, int]:
-        """Кэшированный расчет параметров восстановления размера"""
-        return (original_width, original_height)
+    def _restore_size(cls, image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        """Возвращает изображение к исходному размеру"""
+        return image.resize(size, Image.Resampling.LANCZOS)
 
     @classmethod
-    def _manage_cache(cls):
-        """Управление размером кэша"""
-        if len(cls._cache) > cls.MAX_CACHE_SIZE:
-            logger.info(f"Кэш превысил максимальный размер ({cls.MAX_CACHE_SIZE}). Очистка...")
-            # Удаляем 20% старых записей
-            items_to_remove = int(cls.MAX_CACHE_SIZE * 0.2)
-            for _ in range(items_to_remove):
-                cls._cache.pop(next(iter(cls._cache)))
-            logger.info(f"Удалено {items_to_remove} элементов из кэша")
+    def _encode(cls, image: Image.Image) -> bytes:
+        """Кодирует результат в выходной формат"""
+        output = io.BytesIO()
+        if cls.OUTPUT_FORMAT == 'WEBP':
+            image.save(output, format='WEBP', quality=cls.WEBP_QUALITY)
+        else:
+            image.save(output, format='PNG', compress_level=cls.PNG_COMPRESS_LEVEL)
+        return output.getvalue()
 
     @classmethod
     def remove_background(cls, image_data: bytes) -> bytes:
         """Удаляет фон с изображения с использованием кэширования"""
         logger.info("Начало процесса удаления фона")
-        image_hash = cls._calculate_hash(image_data)
+        image_hash = cls._cache_key(image_data)
         
         # Проверяем кэш
-        if image_hash in cls._cache:
-            logger.info("Найден кэшированный результат")
-            return cls._cache[image_hash]
+        cached = cls._cache.get(image_hash)
+        if cached is not None:
+            logger.info(f"Найден кэшированный результат: {cls._cache.stats()}")
+            return cached
+
+        disk_cache = cls._get_disk_cache()
+        if disk_cache is not None:
+            cached = disk_cache.get(image_hash)
+            if cached is not None:
+                logger.info("Найден результат в дисковом кэше")
+                cls._cache.put(image_hash, cached)
+                return cached
 
         try:
-            # Открываем изображение
+            # Единственное декодирование: дальше изображение передается в rembg без промежуточного PNG
             logger.info("Открытие изображения")
             image = Image.open(io.BytesIO(image_data))
             logger.info(f"Изображение открыто. Режим: {image.mode}, Размер: {image.size}")
@@ -93,38 +187,27 @@ class ImageProcessor:
             logger.info("Проверка размера изображения")
             image, original_size = cls._resize_if_needed(image)
             
-            # Конвертируем в bytes для обработки
-            logger.info("Конвертация изображения в bytes")
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
-            
-            # Удаляем фон
+            # Удаляем фон: для PIL-изображения rembg возвращает PIL-изображение
             logger.info("Запуск процесса удаления фона")
             model = cls._get_model()
-            result = model(img_byte_arr)
+            result_image = model(image, session=cls._get_session())
             logger.info("Фон успешно удален")
             
             # Восстанавливаем размер если нужно
             if original_size:
                 logger.info(f"Восстановление исходного размера: {original_size}")
-                result_image = Image.open(io.BytesIO(result))
-                restore_size = cls._restore_size(
-                    result_image.width,
-                    result_image.height,
-                    original_size[0],
-                    original_size[1]
-                )
-                result_image = result_image.resize(restore_size, Image.Resampling.LANCZOS)
-                
-                # Конвертируем обратно в bytes
-                output = io.BytesIO()
-                result_image.save(output, format='PNG')
-                result = output.getvalue()
+                result_image = cls._restore_size(result_image, original_size)
+
+            # Единственное кодирование результата
+            result = cls._encode(result_image)
             
             # Сохраняем в кэш
-            cls._cache[image_hash] = result
-            cls._manage_cache()
+            cls._cache.put(image_hash, result)
+            if disk_cache is not None:
+                try:
+                    disk_cache.put(image_hash, result)
+                except OSError as e:
+                    logger.warning(f"Не удалось сохранить результат в дисковый кэш: {str(e)}")
             
             logger.info("Процесс удаления фона успешно завершен")
             return result
@@ -140,5 +223,6 @@ class ImageProcessor:
     def clear_cache(cls):
         """Очищает кэш обработанных изображений"""
         cls._cache.clear()
-        cls._restore_size.cache_clear()
+        if cls._disk_cache is not None:
+            cls._disk_cache.clear()
         logger.info("Кэш очищен")
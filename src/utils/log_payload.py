@@ -0,0 +1,37 @@
+from typing import Any
+
+from ..constants.bot_constants import LoggingConstants
+
+def _preview(text: str, preview_chars: int) -> str:
+    """Обрезает строку до preview_chars символов"""
+    if len(text) <= preview_chars:
+        return repr(text)
+    return repr(text[:preview_chars]) + '...'
+
+def summarize_payload(payload: Any, preview_chars: int = LoggingConstants.PREVIEW_CHARS,
+                      full: bool = False) -> str:
+    """Краткое описание ответа API для лога: поля, длины в байтах и начало длинных значений"""
+    if full:
+        return payload if isinstance(payload, str) else repr(payload)
+
+    if isinstance(payload, dict):
+        fields = ', '.join(
+            f"{key}={summarize_payload(value, preview_chars)}" for key, value in payload.items()
+        )
+        return f"{{{fields}}}"
+    if isinstance(payload, (list, tuple)):
+        if not payload:
+            return '[]'
+        # Достаточно первого элемента: в ответах API списки однородные
+        first = summarize_payload(payload[0], preview_chars)
+        more = f", +{len(payload) - 1}" if len(payload) > 1 else ''
+        return f"[{first}{more}]"
+    if isinstance(payload, (bytes, bytearray)):
+        return f"<{len(payload)} bytes>"
+    if isinstance(payload, str):
+        if len(payload) <= preview_chars:
+            return repr(payload)
+        # Для ASCII (base64, JSON) длина в символах равна длине в байтах, копию не создаем
+        size = len(payload) if payload.isascii() else len(payload.encode('utf-8'))
+        return f"<{size} bytes: {_preview(payload, preview_chars)}>"
+    return repr(payload)
@@ -1,56 +1,687 @@
+import asyncio
+import base64
+import json
+import os
+import time
+from datetime import datetime
+import aiohttp
 import pytest
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from src.api.fusion_brain import Text2ImageAPI, CensorshipError
+from src.api.http_session import HTTPSessionManager
+from src.api.model_registry import ModelRegistry
+from src.api.polling import GenerationTimeStats, PollSchedule
+from src.api.poller import GenerationPoller, GenerationTimeoutError
+from src.api.single_flight import SingleFlight, make_generation_key
+from src.api.generation_cache import GenerationResultCache
+from src.api.streaming import StreamingImageDecoder
+from src.api.admission import AdmissionController, AdmissionRejectedError
+from src.api.errors import APIError, RateLimitError, TransientAPIError
+from src.api.retry import RetryPolicy, is_retryable
+from src.api.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, HALF_OPEN, OPEN
+from src.api.rate_limiter import AdaptiveRateLimiter, TokenBucket, ENDPOINT_MODELS, ENDPOINT_RUN, ENDPOINT_STATUS, parse_retry_after
+from src.models.image_info import ImageInfo
+from src.constants.bot_constants import PollingConstants
+
+def make_session(status, payload=None):
+    """Создает мок сессии, возвращающей ответ с заданным статусом"""
+    mock_response = MagicMock()
+    mock_response.status = status
+    mock_response.json = AsyncMock(return_value=payload)
+
+    mock_session = MagicMock()
+    mock_session.request.return_value.__aenter__.return_value = mock_response
+    return mock_session
 
 @pytest.mark.asyncio
 async def test_generate_success():
     """Тест успешной генерации изображения"""
-    with patch('aiohttp.ClientSession') as MockSession:
-        mock_session = AsyncMock()
-        MockSession.return_value.__aenter__.return_value = mock_session
-        
-        mock_response = AsyncMock()
-        mock_response.status = 200
-        mock_response.json.return_value = {"uuid": "test-uuid"}
-        mock_session.request.return_value.__aenter__.return_value = mock_response
-        
-        api = Text2ImageAPI("test-key", "test-secret")
-        result = await api.generate("test prompt", 1)
-        
-        assert result == "test-uuid"
+    mock_session = make_session(200, {"uuid": "test-uuid"})
+
+    api = Text2ImageAPI("test-key", "test-secret", session=mock_session)
+    result = await api.generate("test prompt", 1)
+
+    assert result == "test-uuid"
 
 @pytest.mark.asyncio
 async def test_generate_censorship():
     """Тест обработки ошибки цензуры"""
-    with patch('aiohttp.ClientSession') as MockSession:
-        mock_session = AsyncMock()
-        MockSession.return_value.__aenter__.return_value = mock_session
-        
-        mock_response = AsyncMock()
-        mock_response.status = 451
-        mock_session.request.return_value.__aenter__.return_value = mock_response
-        
-        api = Text2ImageAPI("test-key", "test-secret")
-        
-        with pytest.raises(CensorshipError):
-            await api.generate("test prompt", 1)
+    mock_session = make_session(451)
+
+    api = Text2ImageAPI("test-key", "test-secret", session=mock_session)
+
+    with pytest.raises(CensorshipError):
+        await api.generate("test prompt", 1)
+
+@pytest.mark.asyncio
+async def test_requests_go_through_rate_limiter():
+    """Тест: запросы проходят через ограничитель, 429 замедляет его, заголовки вызывающего не меняются"""
+    mock_session = make_session(429)
+    mock_session.request.return_value.__aenter__.return_value.headers = {"Retry-After": "3"}
+    limiter = MagicMock()
+    limiter.acquire = AsyncMock()
+    retry_policy, _ = make_retry_policy(max_retries=0)
+    api = Text2ImageAPI("test-key", "test-secret", session=mock_session,
+                        rate_limiter=limiter, retry_policy=retry_policy)
+    headers = {"Accept": "application/json"}
+
+    with pytest.raises(RateLimitError):
+        await api._make_request('GET', f"{api.URL}/key/api/v1/models", ENDPOINT_MODELS, headers=headers)
+
+    limiter.acquire.assert_awaited_once_with(ENDPOINT_MODELS)
+    limiter.on_rate_limited.assert_called_once_with(ENDPOINT_MODELS, 3.0)
+    assert headers == {"Accept": "application/json"}
+    assert mock_session.request.call_args.kwargs['headers']["X-API-KEY"] == "test-key"
 
 @pytest.mark.asyncio
 async def test_check_generation_success():
     """Тест успешной проверки статуса генерации"""
-    with patch('aiohttp.ClientSession') as MockSession:
-        mock_session = AsyncMock()
-        MockSession.return_value.__aenter__.return_value = mock_session
-        
-        mock_response = AsyncMock()
-        mock_response.status = 200
-        mock_response.json.return_value = {
-            "status": "DONE",
-            "images": ["test-image-data"]
-        }
-        mock_session.request.return_value.__aenter__.return_value = mock_response
-        
-        api = Text2ImageAPI("test-key", "test-secret")
-        result = await api.check_generation("test-uuid")
-        
-        assert result == "test-image-data"
+    mock_session = make_session(200, {
+        "status": "DONE",
+        "images": ["test-image-data"]
+    })
+
+    api = Text2ImageAPI("test-key", "test-secret", session=mock_session)
+    result = await api.check_generation("test-uuid")
+
+    assert result == "test-image-data"
+
+@pytest.mark.asyncio
+async def test_shared_session_reused():
+    """Тест: общая сессия создается один раз и переиспользуется"""
+    try:
+        first = await HTTPSessionManager.get_session()
+        second = await HTTPSessionManager.get_session()
+        assert first is second
+        assert not first.closed
+    finally:
+        await HTTPSessionManager.close()
+
+    assert first.closed
+
+@pytest.mark.asyncio
+async def test_model_registry_caches_models():
+    """Тест: список моделей запрашивается один раз в пределах TTL"""
+    api = MagicMock()
+    api.get_model = AsyncMock(return_value=[{"id": 4}])
+    registry = ModelRegistry(ttl=60)
+
+    assert await registry.get_default_model_id(api) == 4
+    assert await registry.get_default_model_id(api) == 4
+    api.get_model.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_model_registry_single_flight():
+    """Тест: параллельные обновления объединяются в один запрос"""
+    api = MagicMock()
+    api.get_model = AsyncMock(return_value=[{"id": 4}])
+    registry = ModelRegistry()
+
+    results = await asyncio.gather(*(registry.get_models(api) for _ in range(5)))
+
+    assert all(result == [{"id": 4}] for result in results)
+    api.get_model.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_model_registry_fallback_on_error():
+    """Тест: при ошибке API используется последний удачный список"""
+    api = MagicMock()
+    api.get_model = AsyncMock(return_value=[{"id": 4}])
+    registry = ModelRegistry(ttl=0)
+    await registry.refresh(api)
+
+    api.get_model = AsyncMock(side_effect=Exception("Сервер временно недоступен"))
+
+    assert await registry.refresh(api) == [{"id": 4}]
+
+def test_poll_schedule_initial_delay_from_stats():
+    """Тест: первая пауза рассчитывается по статистике генераций"""
+    stats = GenerationTimeStats(default=10.0)
+    for seconds in (20.0, 30.0, 40.0):
+        stats.record(seconds)
+    schedule = PollSchedule(stats, deadline=120, jitter=0)
+
+    assert stats.expected() == 30.0
+    assert schedule.next_delay() == pytest.approx(30.0 * PollingConstants.INITIAL_DELAY_RATIO)
+
+def test_poll_schedule_backoff_is_bounded():
+    """Тест: пауза растет экспоненциально и не превышает максимум"""
+    schedule = PollSchedule(deadline=600, min_delay=1.0, max_delay=8.0, factor=2.0, jitter=0)
+
+    delays = [schedule.next_delay() for _ in range(6)]
+
+    assert delays == [1.0, 2.0, 4.0, 8.0, 8.0, 8.0]
+
+def test_poll_schedule_respects_deadline():
+    """Тест: пауза не выходит за срок ожидания"""
+    schedule = PollSchedule(deadline=0.5, min_delay=1.0, jitter=0)
+
+    assert schedule.next_delay() <= 0.5
+
+def make_fast_poller(deadline=5.0):
+    """Создает опросчик с короткими паузами для тестов"""
+    return GenerationPoller(
+        tick=0.01,
+        schedule_factory=lambda: PollSchedule(deadline=deadline, min_delay=0.01, max_delay=0.02)
+    )
+
+@pytest.mark.asyncio
+async def test_poller_resolves_all_generations():
+    """Тест: общий опросчик завершает все ожидающие генерации"""
+    api = MagicMock()
+    calls = {}
+
+    async def check_generation(uuid):
+        calls[uuid] = calls.get(uuid, 0) + 1
+        if calls[uuid] < 3:
+            return {"status": "PROCESSING"}
+        return {"status": "DONE", "images": [uuid]}
+
+    api.check_generation = check_generation
+    poller = make_fast_poller()
+    try:
+        results = await asyncio.gather(*(poller.wait(api, f"uuid-{i}") for i in range(4)))
+    finally:
+        await poller.stop()
+
+    assert [result["images"][0] for result in results] == [f"uuid-{i}" for i in range(4)]
+    assert poller.pending_count == 0
+
+@pytest.mark.asyncio
+async def test_poller_timeout():
+    """Тест: генерация снимается с опроса по истечении срока"""
+    api = MagicMock()
+    api.check_generation = AsyncMock(return_value={"status": "PROCESSING"})
+    poller = make_fast_poller(deadline=0.05)
+    try:
+        with pytest.raises(GenerationTimeoutError):
+            await poller.wait(api, "slow-uuid")
+    finally:
+        await poller.stop()
+
+@pytest.mark.asyncio
+async def test_poller_slow_poll_does_not_block_others():
+    """Тест: зависший опрос одной генерации не задерживает опрос остальных"""
+    api = MagicMock()
+    stuck = asyncio.Event()
+    calls = {}
+
+    async def check_generation(uuid):
+        calls[uuid] = calls.get(uuid, 0) + 1
+        if uuid == "stuck-uuid":
+            await stuck.wait()
+        elif calls[uuid] < 3:
+            return {"status": "PROCESSING"}
+        return {"status": "DONE", "images": [uuid]}
+
+    api.check_generation = check_generation
+    poller = make_fast_poller()
+    try:
+        stuck_task = asyncio.create_task(poller.wait(api, "stuck-uuid"))
+        result = await asyncio.wait_for(poller.wait(api, "fast-uuid"), timeout=1.0)
+        assert result["images"] == ["fast-uuid"]
+        assert not stuck_task.done()
+        stuck.set()
+        assert (await stuck_task)["images"] == ["stuck-uuid"]
+    finally:
+        await poller.stop()
+
+@pytest.mark.asyncio
+async def test_poller_drops_abandoned_generation():
+    """Тест: после отмены последнего ожидающего генерация больше не опрашивается"""
+    api = MagicMock()
+    api.check_generation = AsyncMock(return_value={"status": "PROCESSING"})
+    poller = make_fast_poller()
+    try:
+        first = asyncio.create_task(poller.wait(api, "uuid-1"))
+        second = asyncio.create_task(poller.wait(api, "uuid-1"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.sleep(0.05)
+        assert poller.pending_count == 1
+
+        second.cancel()
+        await asyncio.sleep(0.05)
+        assert poller.pending_count == 0
+        polls = api.check_generation.await_count
+        await asyncio.sleep(0.05)
+        assert api.check_generation.await_count == polls
+    finally:
+        await poller.stop()
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_one_execution():
+    """Тест: одинаковые одновременные запросы выполняются один раз"""
+    flights = SingleFlight()
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "uuid-1", {"status": "DONE"}
+
+    key = make_generation_key("anime style,  cat ", 1, 1024, 1024)
+    same_key = make_generation_key("anime style, cat", 1, 1024, 1024)
+    results = await asyncio.gather(*(flights.do(k, generate) for k in (key, same_key, key)))
+
+    assert calls == 1
+    assert all(result == ("uuid-1", {"status": "DONE"}) for result in results)
+    assert flights.in_flight == 0
+
+    await flights.do(make_generation_key("anime style, cat", 1, 1536, 1024), generate)
+    assert calls == 2
+    # Регистр промпта значим для FusionBrain, такие запросы не объединяются
+    assert make_generation_key("anime style, Cat", 1, 1024, 1024) != key
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_error_and_retries():
+    """Тест: ошибку получают все ожидающие, следующий запрос выполняется заново"""
+    flights = SingleFlight()
+    failing = AsyncMock(side_effect=Exception("Ошибка API"))
+
+    results = await asyncio.gather(
+        flights.do("key", failing), flights.do("key", failing), return_exceptions=True
+    )
+    assert all(isinstance(result, Exception) for result in results)
+    assert failing.call_count == 1
+
+    assert await flights.do("key", AsyncMock(return_value="ok")) == "ok"
+
+def make_image_info(image_id="uuid-1"):
+    """Создает метаданные тестового изображения"""
+    return ImageInfo(
+        id=image_id, prompt="cat", style="DEFAULT", style_prompt="", width=1024, height=1024,
+        model_id=1, created_at=datetime.now(), generation_time=5.0, user_id=1
+    )
+
+def test_generation_cache_ttl_and_budget():
+    """Тест: кэш генераций учитывает время жизни и объем"""
+    cache = GenerationResultCache(ttl=60, max_entries=10, max_bytes=10)
+    key = make_generation_key("cat", 1, 1024, 1024)
+    assert cache.put(key, b"12345678", make_image_info())
+    assert cache.get(key).image_data == b"12345678"
+
+    cache.put("other", b"12345678", make_image_info("uuid-2"))
+    assert cache.get(key) is None  # вытеснен по объему
+
+    with patch('src.api.generation_cache.time.monotonic', return_value=time.monotonic() + 61):
+        assert cache.get("other") is None
+
+    cache.put(key, b"12345678", make_image_info(), file_id="file-id")
+    cached = cache.get(key)
+    assert cached.file_id == "file-id" and cached.image_data is None
+    assert cache.stats()['bytes'] == len("file-id")
+
+    disabled = GenerationResultCache(ttl=0)
+    assert disabled.put(key, b"1", make_image_info()) is False
+    assert disabled.get(key) is None
+
+def test_streaming_decoder_decodes_image_in_chunks():
+    """Тест: изображение декодируется по частям, в том числе с экранированными слэшами"""
+    image = os.urandom(30000)
+    body = json.dumps({
+        "uuid": "test-uuid",
+        "status": "DONE",
+        "images": [base64.b64encode(image).decode()],
+        "censored": False
+    }).encode().replace(b'/', b'\\/')
+
+    for chunk_size in (1, 5, 4096, len(body)):
+        decoder = StreamingImageDecoder()
+        for i in range(0, len(body), chunk_size):
+            decoder.feed(body[i:i + chunk_size])
+        result = decoder.finish()
+
+        assert result["image_data"] == image
+        assert result["images"] == []
+        assert result["status"] == "DONE"
+        assert result["censored"] is False
+
+def test_streaming_decoder_without_image():
+    """Тест: ответ без изображения разбирается как обычный JSON"""
+    decoder = StreamingImageDecoder()
+    decoder.feed(b'{"uuid": "test-uuid", "status": "PROCESSING", "images": []}')
+    assert decoder.finish() == {"uuid": "test-uuid", "status": "PROCESSING", "images": []}
+
+    truncated = StreamingImageDecoder()
+    truncated.feed(b'{"status": "DONE", "images": ["AAAA')
+    with pytest.raises(ValueError):
+        truncated.finish()
+
+@pytest.mark.asyncio
+async def test_admission_fifo_queue_with_positions():
+    """Тест: сверх общего лимита запросы ждут по порядку и получают свои позиции"""
+    controller = AdmissionController(max_concurrent=1, per_user=1, max_queue=2)
+    positions = {"b": [], "c": []}
+    order = []
+
+    def reporter(name):
+        async def report(position):
+            positions[name].append(position)
+        return report
+
+    async def job(name, on_position=None):
+        async with controller.slot(on_position):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    first = asyncio.create_task(job("a"))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(job("b", reporter("b")))
+    third = asyncio.create_task(job("c", reporter("c")))
+    await asyncio.sleep(0)
+    assert controller.active == 1
+    assert controller.queued == 2
+
+    # Очередь заполнена — следующий запрос отклоняется сразу
+    with pytest.raises(AdmissionRejectedError):
+        await controller.acquire()
+
+    await asyncio.gather(first, second, third)
+    await asyncio.sleep(0)
+    assert order == ["a", "b", "c"]
+    assert positions["b"] == [1, 0]
+    assert positions["c"] == [2, 1, 0]
+    assert controller.active == 0
+
+@pytest.mark.asyncio
+async def test_admission_throttles_position_updates():
+    """Тест: дальние позиции сообщаются не чаще интервала, ближние — при каждом сдвиге"""
+    clock = FakeClock()
+    controller = AdmissionController(max_concurrent=1, max_queue=20, position_exact=3,
+                                     position_interval=10.0, clock=clock)
+    positions = []
+
+    async def report(position):
+        positions.append(position)
+
+    await controller.acquire()
+    others = [asyncio.create_task(controller.acquire()) for _ in range(9)]
+    await asyncio.sleep(0)
+    last = asyncio.create_task(controller.acquire(report))
+    await asyncio.sleep(0)
+
+    for waiter in others:
+        controller.release()
+        await waiter
+        await asyncio.sleep(0)
+    controller.release()
+    await last
+    assert positions == [10, 3, 2, 1, 0]
+
+    # По истечении интервала дальняя позиция обновляется снова
+    positions.clear()
+    others = [asyncio.create_task(controller.acquire()) for _ in range(9)]
+    await asyncio.sleep(0)
+    last = asyncio.create_task(controller.acquire(report))
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)  # Уведомление о первой позиции отправлено
+    clock.now += 10.0
+    controller.release()
+    await others[0]
+    await asyncio.sleep(0)
+    assert positions == [10, 9]
+    for waiter in others[1:]:
+        controller.release()
+        await waiter
+    controller.release()
+    await last
+
+@pytest.mark.asyncio
+async def test_admission_per_user_limit_and_cancel():
+    """Тест: лимит пользователя и освобождение места при отмене ожидания"""
+    controller = AdmissionController(max_concurrent=1, per_user=1)
+
+    async with controller.admit(1):
+        with pytest.raises(AdmissionRejectedError):
+            async with controller.admit(1):
+                pass
+        # Другой пользователь не ограничен лимитом первого
+        async with controller.admit(2):
+            assert controller.user_in_flight(2) == 1
+    assert controller.user_in_flight(1) == 0
+
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert controller.queued == 0
+    controller.release()
+    assert controller.active == 0
+
+class FakeClock:
+    """Управляемые часы для тестов ограничителя"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_aimd():
+    """Тест: после 429 скорость падает и действует пауза, после серии успехов скорость растет"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=2, min_rate=0.5, decrease_factor=0.5,
+                         increase_ratio=0.25, ramp_up_after=2, clock=clock)
+
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.delay() == pytest.approx(0.5)
+
+    bucket.on_rate_limited(retry_after=10)
+    assert bucket.rate == 1.0
+    assert bucket.delay() == pytest.approx(10)
+    bucket.on_rate_limited(retry_after=1)
+    bucket.on_rate_limited(retry_after=1)
+    assert bucket.rate == 0.5  # не ниже минимума
+
+    clock.now += 10
+    assert bucket.try_acquire()
+    for _ in range(4):
+        bucket.on_success()
+    assert bucket.rate == 1.5
+    for _ in range(10):
+        bucket.on_success()
+    assert bucket.rate == 2.0  # не выше исходной скорости
+
+def test_rate_limiter_sheds_status_first():
+    """Тест: при нагрузке на запуск генераций опросы статуса откладываются, а не ждут"""
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter({
+        ENDPOINT_RUN: TokenBucket(rate=1.0, burst=1, clock=clock),
+        ENDPOINT_STATUS: TokenBucket(rate=10.0, burst=10, clock=clock),
+    })
+
+    limiter.on_rate_limited(ENDPOINT_RUN, retry_after=5)
+    with pytest.raises(RateLimitError) as error:
+        asyncio.run(limiter.acquire(ENDPOINT_STATUS))
+    assert error.value.retry_after == pytest.approx(5)
+    assert limiter.shed == 1
+
+    clock.now += 5
+    asyncio.run(limiter.acquire(ENDPOINT_STATUS))
+    assert limiter.shed == 1
+
+def test_parse_retry_after():
+    """Тест: Retry-After в секундах и в виде HTTP-даты"""
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("garbage") is None
+
+@pytest.mark.asyncio
+async def test_poller_reschedules_rate_limited_polls():
+    """Тест: отложенный ограничителем опрос повторяется, генерация не завершается ошибкой"""
+    api = MagicMock()
+    api.check_generation = AsyncMock(side_effect=[
+        RateLimitError("shed", retry_after=0.01),
+        {"status": "DONE", "images": ["image"]}
+    ])
+    poller = make_fast_poller()
+    try:
+        result = await poller.wait(api, "limited-uuid")
+    finally:
+        await poller.stop()
+
+    assert result["images"] == ["image"]
+    assert api.check_generation.await_count == 2
+
+def make_retry_policy(**kwargs):
+    """Политика повторов без реальных пауз; паузы записываются в список"""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    return RetryPolicy(sleep=sleep, **kwargs), delays
+
+def test_is_retryable_classification():
+    """Тест: временные ошибки повторяются, ошибки ключей и модерации — нет"""
+    assert is_retryable(TransientAPIError("5xx", 503))
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ConnectionResetError())
+    assert not is_retryable(APIError("auth", 401))
+    assert not is_retryable(CensorshipError("censored"))
+    assert not is_retryable(ValueError("bad json"))
+
+@pytest.mark.asyncio
+async def test_retry_policy_recovers_from_transient_errors():
+    """Тест: временные сбои повторяются с растущей паузой, попытка получает таймаут"""
+    policy, delays = make_retry_policy(max_retries=3, attempt_timeout=5, base_delay=1.0, max_delay=8.0)
+    timeouts = []
+    errors = [TransientAPIError("503", 503), asyncio.TimeoutError()]
+
+    async def operation(timeout):
+        timeouts.append(timeout)
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert await policy.run(operation) == "ok"
+    assert len(delays) == 2
+    assert 0 <= delays[0] <= 1.0 and 0 <= delays[1] <= 2.0
+    assert all(0 < timeout <= 5 for timeout in timeouts)
+
+@pytest.mark.asyncio
+async def test_retry_policy_stops_on_fatal_errors_and_limits():
+    """Тест: фатальная ошибка не повторяется, после исчерпания попыток ошибка понятна пользователю"""
+    policy, delays = make_retry_policy(max_retries=2)
+    fatal = AsyncMock(side_effect=APIError("auth", 401))
+    with pytest.raises(APIError):
+        await policy.run(fatal)
+    assert fatal.await_count == 1
+
+    broken = AsyncMock(side_effect=ConnectionResetError("reset"))
+    with pytest.raises(TransientAPIError) as error:
+        await policy.run(broken)
+    assert broken.await_count == 3
+    assert isinstance(error.value.__cause__, ConnectionResetError)
+
+    # Одна попытка, если повторы отключены
+    single = AsyncMock(side_effect=TransientAPIError("503", 503))
+    with pytest.raises(TransientAPIError):
+        await policy.run(single, max_retries=0)
+    assert single.await_count == 1
+
+@pytest.mark.asyncio
+async def test_run_not_reposted_after_timeout():
+    """Тест: запуск генерации после таймаута не отправляется повторно, после 503 — повторяется"""
+    mock_session = make_session(200, {"uuid": "test-uuid"})
+    mock_session.request.side_effect = asyncio.TimeoutError()
+    retry_policy, delays = make_retry_policy(max_retries=3)
+    api = Text2ImageAPI("test-key", "test-secret", session=mock_session, retry_policy=retry_policy)
+
+    with pytest.raises(TransientAPIError):
+        await api.generate("test prompt", 1)
+    assert mock_session.request.call_count == 1
+    assert delays == []
+    # Автомат защиты у каждого клиента свой: сбои одного не влияют на другой
+    assert Text2ImageAPI("test-key", "test-secret").circuit_breaker is not api.circuit_breaker
+
+    assert not is_retryable(aiohttp.ClientPayloadError("broken body"), idempotent=False)
+    assert is_retryable(TransientAPIError("503", 503), idempotent=False)
+    assert not is_retryable(TransientAPIError("timeout"), idempotent=False)
+
+@pytest.mark.asyncio
+async def test_retry_policy_budget():
+    """Тест: повтор не начинается, если пауза выходит за общий бюджет времени"""
+    clock = FakeClock()
+    policy, delays = make_retry_policy(max_retries=10, budget=1.0, base_delay=10.0, max_delay=10.0)
+    policy.clock = clock
+    policy.backoff = lambda retry: 2.0
+    operation = AsyncMock(side_effect=TransientAPIError("503", 503))
+
+    with pytest.raises(TransientAPIError):
+        await policy.run(operation)
+    assert operation.await_count == 1
+    assert delays == []
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_and_recovers():
+    """Тест: после серии сбоев запросы отклоняются сразу, успешная проба замыкает автомат"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10.0, clock=clock)
+    failing = AsyncMock(side_effect=TransientAPIError("503", 503))
+
+    for _ in range(2):
+        with pytest.raises(TransientAPIError):
+            await breaker.call(failing)
+    assert breaker.state == OPEN and breaker.is_open
+
+    # Пока автомат разомкнут, запрос не выполняется
+    with pytest.raises(CircuitOpenError) as error:
+        await breaker.call(failing)
+    assert failing.await_count == 2
+    assert error.value.retry_after == 10.0
+
+    # Ошибки запроса и 429 не считаются недоступностью сервиса
+    clock.now += 10.0
+    assert not breaker.is_open
+    assert await breaker.call(AsyncMock(return_value="ok")) == "ok"
+    assert breaker.state == CLOSED
+    for failure in (APIError("auth", 401), RateLimitError("429", retry_after=1.0)):
+        with pytest.raises(type(failure)):
+            await breaker.call(AsyncMock(side_effect=failure))
+    assert breaker.failures == 0
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_single_probe():
+    """Тест: в полуоткрытом состоянии выполняется один пробный запрос, неудачная проба снова размыкает автомат"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5.0, clock=clock)
+    with pytest.raises(TransientAPIError):
+        await breaker.call(AsyncMock(side_effect=TransientAPIError("503", 503)))
+
+    clock.now += 5.0
+    probe_started = asyncio.Event()
+    finish_probe = asyncio.Event()
+
+    async def probe():
+        probe_started.set()
+        await finish_probe.wait()
+        raise asyncio.TimeoutError()
+
+    task = asyncio.create_task(breaker.call(probe))
+    await probe_started.wait()
+    assert breaker.state == HALF_OPEN and breaker.is_open
+    other = AsyncMock(return_value="ok")
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(other)
+    other.assert_not_awaited()
+
+    finish_probe.set()
+    with pytest.raises(asyncio.TimeoutError):
+        await task
+    assert breaker.state == OPEN
+    assert breaker.retry_after == 5.0
+
+    # Некорректный ответ не доказывает восстановление: проба освобождается, автомат остается полуоткрытым
+    clock.now += 5.0
+    with pytest.raises(ValueError):
+        await breaker.call(AsyncMock(side_effect=ValueError("bad json")))
+    assert breaker.state == HALF_OPEN and not breaker.is_open
+    with pytest.raises(CensorshipError):
+        await breaker.call(AsyncMock(side_effect=CensorshipError("censored")))
+    assert breaker.state == CLOSED
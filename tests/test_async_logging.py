@@ -0,0 +1,52 @@
+import logging
+import threading
+from src.utils.async_logging import QueueLogging
+from src.utils.log_payload import summarize_payload
+
+class SlowHandler(logging.Handler):
+    """Обработчик, который ждет разрешения на запись (имитация зависшего диска)"""
+    def __init__(self):
+        super().__init__()
+        self.unblock = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.unblock.wait(5)
+        self.records.append(record.getMessage())
+
+def test_queue_logging_drops_on_overflow_without_blocking():
+    """Тест: при переполнении очереди записи отбрасываются и считаются, вызывающий не блокируется"""
+    logger = logging.getLogger("test_async_logging")
+    logger.propagate = False
+    handler = SlowHandler()
+    logger.addHandler(handler)
+    queue_logging = QueueLogging(logger, max_size=2)
+    queue_logging.start()
+    try:
+        assert logger.handlers == [queue_logging.queue_handler]
+        for i in range(10):
+            logger.warning(f"message {i}")
+        assert queue_logging.dropped >= 7
+    finally:
+        handler.unblock.set()
+        queue_logging.stop()
+
+    assert logger.handlers == [handler]
+    assert handler.records[0] == "message 0"
+    # Все записи либо доставлены, либо учтены; в конце — предупреждение о потерях
+    assert len(handler.records) - 1 == 10 - queue_logging.dropped
+    assert str(queue_logging.dropped) in handler.records[-1]
+
+def test_summarize_payload_caps_large_values():
+    """Тест: в сводке ответа остаются поля и размеры, а base64 изображения обрезается"""
+    image = "A" * 1_000_000
+    payload = {"uuid": "abc", "status": "DONE", "images": [image], "censored": False}
+
+    summary = summarize_payload(payload, preview_chars=10)
+
+    assert "status='DONE'" in summary
+    assert "censored=False" in summary
+    assert "<1000000 bytes: 'AAAAAAAAAA'...>" in summary
+    assert len(summary) < 200
+    assert summarize_payload(payload, full=True) == repr(payload)
+    assert summarize_payload('{"status": "DONE"}', full=True) == '{"status": "DONE"}'
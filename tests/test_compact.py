@@ -0,0 +1,11 @@
+from src.models.compact import CompactUserSettings
+from src.models.user_state import UserSettings
+
+def test_compact_settings_match_regular_ones():
+    """Тест: компактные настройки без __dict__ совместимы с обычными по данным"""
+    settings = CompactUserSettings()
+    settings.update(width=1536, height=1024, style="ANIME")
+    restored = UserSettings.from_dict(settings.to_dict())
+    assert (restored.width, restored.height, restored.style) == (1536, 1024, "ANIME")
+    assert CompactUserSettings.from_dict(restored.to_dict()).to_dict() == restored.to_dict()
+    assert not hasattr(settings, '__dict__')
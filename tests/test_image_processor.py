@@ -1,8 +1,25 @@
 import pytest
+import os
+import subprocess
+import sys
+import threading
 from unittest.mock import patch, MagicMock
 from PIL import Image
 import io
 from src.utils.image_processor import ImageProcessor
+from src.utils.byte_cache import ByteLRUCache
+from src.utils.disk_cache import DiskCache
+from src.utils.bg_removal_pool import BackgroundRemovalPool, PoolBusyError, BackgroundRemovalTimeoutError
+
+@pytest.fixture(autouse=True)
+def isolated_disk_cache(tmp_path, monkeypatch):
+    """Дисковый кэш во временном каталоге: тесты не создают cache/ в репозитории"""
+    directory = str(tmp_path / "bg_removed")
+    # Переменная окружения нужна процессам-обработчикам пула
+    monkeypatch.setenv('IMAGE_CACHE_DIR', directory)
+    ImageProcessor.configure_disk_cache(directory)
+    yield
+    ImageProcessor.configure_disk_cache(None)
 
 @pytest.fixture
 def sample_image():
@@ -46,3 +63,158 @@ async def test_remove_background(sample_image):
         
         assert result == b"processed_image"
         mock_remove.assert_called_once()
+
+def test_session_created_once():
+    """Тест: сессия rembg создается один раз и переиспользуется"""
+    ImageProcessor._sessions.clear()
+    with patch('src.utils.image_processor.new_session') as mock_new_session:
+        mock_new_session.return_value = MagicMock()
+
+        ImageProcessor.warm_up()
+        session = ImageProcessor._get_session()
+
+        assert session is mock_new_session.return_value
+        mock_new_session.assert_called_once_with(ImageProcessor.MODEL_NAME)
+    ImageProcessor._sessions.clear()
+
+@pytest.mark.asyncio
+async def test_bg_removal_pool_thread_workers():
+    """Тест: пул потоков удаляет фон и освобождает место в очереди"""
+    with patch('src.utils.bg_removal_pool.ImageProcessor') as MockProcessor:
+        MockProcessor.remove_background.return_value = b"processed_image"
+        pool = BackgroundRemovalPool(workers=1, use_processes=False, max_queue=0)
+        try:
+            result = await pool.remove_background(b"image")
+        finally:
+            pool.shutdown()
+
+    assert result == b"processed_image"
+    assert pool.in_flight == 0
+    MockProcessor.warm_up.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_bg_removal_pool_backpressure_and_timeout():
+    """Тест: переполненная очередь отклоняет задачи, долгие задачи прерываются по таймауту"""
+    release = threading.Event()
+    with patch('src.utils.bg_removal_pool.ImageProcessor') as MockProcessor:
+        MockProcessor.remove_background.side_effect = lambda data: release.wait(5) and data
+        pool = BackgroundRemovalPool(workers=1, use_processes=False, max_queue=0, job_timeout=0.05)
+        try:
+            with pytest.raises(BackgroundRemovalTimeoutError):
+                await pool.remove_background(b"image")
+            with pytest.raises(PoolBusyError):
+                await pool.remove_background(b"image")
+        finally:
+            release.set()
+            pool.shutdown()
+
+def test_byte_cache_evicts_by_bytes():
+    """Тест: кэш вытесняет давно неиспользуемые записи при превышении объема"""
+    cache = ByteLRUCache(max_entries=10, max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+
+    cache.put("c", b"1234")
+
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.total_bytes == 8
+    assert cache.stats()['evictions'] == 1
+
+def test_byte_cache_counters_and_limits():
+    """Тест: счетчики попаданий и ограничение числа записей"""
+    cache = ByteLRUCache(max_entries=2, max_bytes=100)
+    assert cache.put("big", b"x" * 101) is False
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    cache.put("c", b"3")
+
+    assert cache.get("a") is None
+    assert cache.get("c") == b"3"
+    assert cache.stats() == {'entries': 2, 'bytes': 2, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+def test_disk_cache_roundtrip_and_eviction(tmp_path):
+    """Тест: дисковый кэш переживает пересоздание и вытесняет давно неиспользуемые файлы"""
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    key_a = DiskCache.make_key(b"image_a", "u2net")
+    key_b = DiskCache.make_key(b"image_b", "u2net")
+    key_c = DiskCache.make_key(b"image_c", "u2net")
+    assert key_a != DiskCache.make_key(b"image_a", "u2netp")
+
+    cache.put(key_a, b"1234")
+    cache.put(key_b, b"1234")
+    os.utime(cache._path(key_b), (0, 0))  # b использовался давно
+    assert cache.get(key_a) == b"1234"
+
+    cache.put(key_c, b"1234")
+
+    assert cache.get(key_b) is None
+    reopened = DiskCache(str(tmp_path), max_bytes=10)
+    assert reopened.get(key_a) == b"1234"
+    assert reopened.get(key_c) == b"1234"
+    assert reopened.total_bytes == 8
+    assert not [name for _, _, files in os.walk(tmp_path) for name in files if name.startswith('.tmp')]
+
+def test_disk_cache_overwrite_keeps_size(tmp_path):
+    """Тест: перезапись ключа данными другого размера не искажает объем кэша"""
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    key = DiskCache.make_key(b"image", "u2net")
+    cache.put(key, b"12345678")
+    cache.put(key, b"12")
+    assert cache.total_bytes == 2
+    cache.put(key, b"1234")
+    assert cache.total_bytes == 4
+    assert DiskCache(str(tmp_path), max_bytes=100).total_bytes == 4
+
+def test_remove_background_uses_disk_cache(tmp_path, sample_image):
+    """Тест: результат из дискового кэша возвращается без повторного удаления фона"""
+    ImageProcessor.configure_disk_cache(str(tmp_path))
+    try:
+        ImageProcessor.clear_cache()
+        with patch('src.utils.image_processor.remove') as mock_remove, \
+             patch.object(ImageProcessor, '_get_session'), \
+             patch.object(ImageProcessor, '_model', None):
+            mock_remove.return_value = Image.new('RGBA', (100, 100))
+            result = ImageProcessor.remove_background(sample_image)
+
+            ImageProcessor._cache.clear()  # Имитируем перезапуск: память пуста, диск сохранился
+            assert ImageProcessor.remove_background(sample_image) == result
+
+            mock_remove.assert_called_once()
+    finally:
+        ImageProcessor.clear_cache()
+        ImageProcessor.configure_disk_cache(None)
+
+def test_remove_background_decodes_and_encodes_once():
+    """Тест: rembg получает PIL-изображение, результат восстанавливается и кодируется один раз"""
+    image = Image.new('RGB', (2000, 1000), color='red')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+
+    ImageProcessor.clear_cache()
+    with patch('src.utils.image_processor.remove') as mock_remove, \
+         patch.object(ImageProcessor, '_get_session'), \
+         patch.object(ImageProcessor, '_model', None), \
+         patch.object(ImageProcessor, '_get_disk_cache', return_value=None), \
+         patch.object(ImageProcessor, '_encode', wraps=ImageProcessor._encode) as mock_encode:
+        mock_remove.side_effect = lambda img, session: img.convert('RGBA')
+        result = ImageProcessor.remove_background(buffer.getvalue())
+
+        passed = mock_remove.call_args[0][0]
+        assert isinstance(passed, Image.Image)
+        assert max(passed.size) <= ImageProcessor.MAX_SIZE
+        mock_encode.assert_called_once()
+    ImageProcessor.clear_cache()
+
+    output = Image.open(io.BytesIO(result))
+    assert output.format == ImageProcessor.OUTPUT_FORMAT
+    assert output.size == (2000, 1000)
+
+def test_rembg_imported_lazily():
+    """Тест: импорт модулей обработки изображений не загружает rembg и onnxruntime"""
+    code = (
+        "import sys; import src.utils.bg_removal_pool; "
+        "assert 'rembg' not in sys.modules and 'onnxruntime' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
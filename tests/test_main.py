@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram import types
+
+import main
+from src.api.admission import AdmissionController
+from src.api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.api.generation_cache import GenerationResultCache
+from src.api.single_flight import SingleFlight
+from src.models.state_store import UserStateStore
+from src.models.user_state import UserStateManager
+from src.utils.disk_cache import DiskCache
+
+def make_text_session(status, text):
+    """Создает мок сессии, возвращающей текст ответа"""
+    mock_response = MagicMock()
+    mock_response.status = status
+    mock_response.text = AsyncMock(return_value=text)
+
+    mock_session = MagicMock()
+    mock_session.request.return_value.__aenter__.return_value = mock_response
+    return mock_session
+
+@pytest.mark.asyncio
+async def test_send_logs_parsed_response(caplog):
+    """Тест: в лог попадают поля разобранного ответа, как и при потоковом чтении"""
+    api = main.Text2ImageAPI("test-key", "test-secret", session=make_text_session(200, '{"uuid": "abc", "status": "INITIAL"}'))
+
+    with caplog.at_level(logging.INFO, logger='main'):
+        result = await api._send('GET', f"{api.URL}/key/api/v1/models")
+
+    assert result == {"uuid": "abc", "status": "INITIAL"}
+    assert "response={uuid='abc', status='INITIAL'}" in caplog.text
+
+    api.session = make_text_session(200, "not json")
+    with pytest.raises(Exception, match="Некорректный ответ"):
+        await api._send('GET', f"{api.URL}/key/api/v1/models")
+    assert "response='not json'" in caplog.text
+
+@pytest.fixture
+def generation_env(tmp_path, monkeypatch):
+    """Подменяет глобальные объекты бота, которые создает bootstrap()"""
+    monkeypatch.setattr(main, 'user_states', UserStateStore(main.UserState, blob_store=DiskCache(str(tmp_path), 1024 * 1024)))
+    monkeypatch.setattr(main, 'generation_cache', GenerationResultCache())
+    monkeypatch.setattr(main, 'generation_admission', AdmissionController())
+    monkeypatch.setattr(main, 'generation_flights', SingleFlight())
+    poller = MagicMock()
+    poller.wait = AsyncMock(return_value={"status": "DONE", "image_data": b"png-bytes"})
+    monkeypatch.setattr(main, 'generation_poller', poller)
+
+    api = MagicMock()
+    api.circuit_breaker = CircuitBreaker()
+    api.generate = AsyncMock(return_value="uuid-1")
+    yield api, poller
+    for user_id in (1, 2, 3, 4):
+        UserStateManager.clear_user_data(user_id)
+
+def make_status_message(file_id="file-1"):
+    """Сообщение о генерации; отправленное фото получает file_id"""
+    sent = types.Message.model_construct(photo=[types.PhotoSize.model_construct(file_id=file_id)])
+    status_message = MagicMock()
+    status_message.photo = None
+    status_message.edit_text = AsyncMock()
+    status_message.edit_media = AsyncMock(return_value=sent)
+    status_message.answer_photo = AsyncMock(return_value=sent)
+    status_message.delete = AsyncMock()
+    return status_message
+
+@pytest.mark.asyncio
+async def test_run_generation_uses_cache_and_breaker(generation_env):
+    """Тест: повторный запрос отдается из кэша по file_id, при разомкнутом автомате FusionBrain не вызывается"""
+    api, _ = generation_env
+    main.user_states[1].last_prompt = "cat"
+    main.user_states[2].last_prompt = "cat"
+
+    first = make_status_message()
+    assert await main.run_generation(api, "cat", 1, 1024, 1024, first, 1)
+    first.edit_media.assert_awaited_once()
+    assert api.generate.await_count == 1
+    assert main.user_states[1].last_image_file_id == "file-1"
+
+    # Такой же запрос другого пользователя: изображение уже в Telegram, повторно не загружается
+    second = make_status_message(file_id="file-1")
+    assert await main.run_generation(api, "cat", 1, 1024, 1024, second, 2)
+    assert second.answer_photo.await_args.args[0] == "file-1"
+    assert api.generate.await_count == 1
+
+    for _ in range(api.circuit_breaker.failure_threshold):
+        api.circuit_breaker.record_failure()
+    # Кэш отвечает и при недоступном сервисе, новый запрос отклоняется сразу
+    assert await main.run_generation(api, "cat", 1, 1024, 1024, make_status_message(), 1)
+    with pytest.raises(CircuitOpenError):
+        await main.run_generation(api, "dog", 1, 1024, 1024, make_status_message(), 1)
+    assert api.generate.await_count == 1
+
+@pytest.mark.asyncio
+async def test_run_generation_shared_result_cached_once(generation_env, monkeypatch):
+    """Тест: одинаковые одновременные запросы — одна генерация и одна запись в кэш"""
+    api, poller = generation_env
+    done = asyncio.Event()
+
+    async def wait(api, uuid):
+        await done.wait()
+        return {"status": "DONE", "image_data": b"png-bytes"}
+
+    poller.wait = wait
+    put = MagicMock(wraps=main.generation_cache.put)
+    monkeypatch.setattr(main.generation_cache, 'put', put)
+    for user_id in (3, 4):
+        main.user_states[user_id].last_prompt = "cat"
+
+    runs = [
+        asyncio.create_task(main.run_generation(api, "cat", 1, 1024, 1024, make_status_message(), user_id, force_fresh=True))
+        for user_id in (3, 4)
+    ]
+    await asyncio.sleep(0.01)
+    done.set()
+
+    assert await asyncio.gather(*runs) == [True, True]
+    assert api.generate.await_count == 1
+    assert put.call_count == 1
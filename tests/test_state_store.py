@@ -0,0 +1,98 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.models.state_store import UserStateStore
+from src.utils.disk_cache import DiskCache
+
+class DummyState:
+    """Минимальное состояние пользователя для тестов"""
+    def __init__(self):
+        self.last_prompt = None
+        self.last_image_id = None
+        self.last_image_file_id = None
+
+def make_store(tmp_path, **kwargs):
+    """Создает хранилище с изображениями во временном каталоге"""
+    return UserStateStore(DummyState, blob_store=DiskCache(str(tmp_path), 1024 * 1024), **kwargs)
+
+def test_state_created_on_first_access(tmp_path):
+    """Тест: состояние создается при первом обращении и переиспользуется"""
+    store = make_store(tmp_path)
+    store[1].last_prompt = "cat"
+
+    assert store[1].last_prompt == "cat"
+    assert len(store) == 1
+
+@pytest.mark.asyncio
+async def test_images_are_stored_on_disk(tmp_path):
+    """Тест: изображение хранится на диске, в состоянии только его ID"""
+    store = make_store(tmp_path)
+    assert await store.load_image(1) is None
+
+    await store.save_image(1, b"image-bytes", "uuid-1")
+
+    assert store[1].last_image_id == "uuid-1"
+    assert not any(isinstance(value, bytes) for value in vars(store[1]).values())
+    assert await store.load_image(1) == b"image-bytes"
+
+@pytest.mark.asyncio
+async def test_lru_eviction_by_count_and_budget(tmp_path):
+    """Тест: при превышении лимитов вытесняются давно неактивные пользователи вместе с изображениями"""
+    store = make_store(tmp_path, max_users=2)
+    await store.save_image(1, b"image-1", "uuid-1")
+    store[2]
+    store[1]  # 1 снова активен
+    store[3]
+
+    assert 2 not in store
+    assert 1 in store and 3 in store
+    assert await store.load_image(1) == b"image-1"
+
+    budget_store = make_store(tmp_path / "budget", max_bytes=UserStateStore.STATE_OVERHEAD * 2 + 10)
+    budget_store[1].last_prompt = "x" * 100
+    budget_store[1]  # размер пересчитывается при обращении
+    budget_store[2]
+
+    assert 1 not in budget_store
+    assert budget_store.stats()['evictions'] == 1
+
+@pytest.mark.asyncio
+async def test_lookup_does_not_expire_idle_users(tmp_path):
+    """Тест: обращение не удаляет неактивных пользователей, это делает только фоновая очистка"""
+    store = make_store(tmp_path, idle_timeout=60)
+    await store.save_image(1, b"image-1", "uuid-1")
+
+    with patch('src.models.state_store.time.monotonic', return_value=time.monotonic() + 61):
+        store[2]
+        assert 1 in store
+        assert store.blob_store.get(store._blob_key(1)) == b"image-1"
+
+        assert store.expire_idle() == 1
+
+    assert 1 not in store
+    assert store.blob_store.get(store._blob_key(1)) is None
+
+@pytest.mark.asyncio
+async def test_expire_idle_without_access(tmp_path):
+    """Тест: фоновая очистка удаляет неактивных пользователей без обращений к хранилищу"""
+    store = make_store(tmp_path, idle_timeout=60)
+    await store.save_image(1, b"image-1", "uuid-1")
+    store[2]
+
+    assert store.expire_idle(time.monotonic() + 30) == 0
+    assert store.expire_idle(time.monotonic() + 61) == 2
+    assert len(store) == 0
+    assert store.blob_store.total_bytes == 0
+
+@pytest.mark.asyncio
+async def test_file_id_replaces_stored_bytes(tmp_path):
+    """Тест: после загрузки в Telegram хранится только file_id"""
+    store = make_store(tmp_path)
+    await store.save_image(1, b"image-bytes", "uuid-1")
+    await store.save_image(1, b"image-bytes", "uuid-2", file_id="telegram-file-id")
+
+    assert store[1].last_image_file_id == "telegram-file-id"
+    assert await store.load_image(1) is None
+    assert store.blob_store.total_bytes == 0
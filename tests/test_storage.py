@@ -0,0 +1,143 @@
+import asyncio
+import time
+from unittest.mock import patch
+import pytest
+from src.models.storage import MemoryStorage, SQLiteStorage, RedisStorage, StorageError
+from src.models.user_state import UserStateManager
+
+async def start_resp_stand_in():
+    """Запускает минимальный Redis-совместимый сервер (GET, SET, DEL) на свободном порту"""
+    data = {}
+
+    async def read_command(reader):
+        header = await reader.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def handle(reader, writer):
+        while True:
+            args = await read_command(reader)
+            if args is None:
+                break
+            command = args[0].upper()
+            if command == b"SET":
+                data[args[1]] = args[2]
+                writer.write(b"+OK\r\n")
+            elif command == b"GET":
+                value = data.get(args[1])
+                writer.write(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+            elif command == b"DEL":
+                writer.write(b":%d\r\n" % int(data.pop(args[1], None) is not None))
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+async def check_backend(storage):
+    """Общая проверка операций хранилища"""
+    assert await storage.load("settings", "1") is None
+    await storage.save_many("settings", {"1": {"style": "ANIME"}, "2": {"style": "RETRO"}})
+    assert await storage.load("settings", "1") == {"style": "ANIME"}
+    await storage.save("settings", "1", {"style": "DEFAULT"})
+    assert await storage.load("settings", "1") == {"style": "DEFAULT"}
+    await storage.delete("settings", "2")
+    assert await storage.load("settings", "2") is None
+
+@pytest.mark.asyncio
+async def test_memory_storage():
+    """Тест хранилища в памяти"""
+    await check_backend(MemoryStorage())
+
+@pytest.mark.asyncio
+async def test_sqlite_storage_persists(tmp_path):
+    """Тест: SQLite работает в режиме WAL и сохраняет данные между открытиями"""
+    path = str(tmp_path / "bot.sqlite3")
+    storage = SQLiteStorage(path)
+    await check_backend(storage)
+    assert storage._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    await storage.close()
+
+    reopened = SQLiteStorage(path)
+    assert await reopened.load("settings", "1") == {"style": "DEFAULT"}
+    await reopened.close()
+
+@pytest.mark.asyncio
+async def test_redis_storage_against_stand_in():
+    """Тест Redis-хранилища на локальном совместимом сервере"""
+    server, port = await start_resp_stand_in()
+    storage = RedisStorage.from_url(f"redis://127.0.0.1:{port}")
+    try:
+        await check_backend(storage)
+    finally:
+        await storage.close()
+        server.close()
+        await server.wait_closed()
+
+    with pytest.raises(StorageError):
+        await storage.load("settings", "1")
+
+@pytest.mark.asyncio
+async def test_settings_write_behind(tmp_path, monkeypatch):
+    """Тест: изменения настроек записываются в хранилище одной пачкой в фоне"""
+    storage = SQLiteStorage(str(tmp_path / "bot.sqlite3"))
+    UserStateManager.configure(storage)
+    monkeypatch.setattr(UserStateManager, 'FLUSH_INTERVAL', 0.01)
+    try:
+        UserStateManager.update_settings(1, style="ANIME")
+        UserStateManager.update_settings(2, width=1536)
+        assert await storage.load("settings", "1") is None  # запись отложена
+
+        await asyncio.sleep(0.1)
+        assert (await storage.load("settings", "1"))["style"] == "ANIME"
+        assert (await storage.load("settings", "2"))["width"] == 1536
+
+        # Другой процесс загрузит сохраненные настройки
+        UserStateManager.clear_user_data(1)
+        settings = await UserStateManager.load_settings(1)
+        assert settings.style == "ANIME"
+    finally:
+        UserStateManager.clear_user_data(1)
+        UserStateManager.clear_user_data(2)
+        await UserStateManager.shutdown()
+        UserStateManager.configure(MemoryStorage())
+
+@pytest.mark.asyncio
+async def test_settings_cache_is_bounded(monkeypatch):
+    """Тест: кэш настроек вытесняет давно неактивных, несохраненные остаются до записи"""
+    storage = MemoryStorage()
+    UserStateManager.configure(storage)
+    monkeypatch.setattr(UserStateManager, 'SETTINGS_CACHE_SIZE', 2)
+    monkeypatch.setattr(UserStateManager, 'FLUSH_INTERVAL', 60)
+    try:
+        UserStateManager.update_settings(1, style="ANIME")  # не сохранено
+        await UserStateManager.load_settings(2)
+        await UserStateManager.load_settings(3)
+        await UserStateManager.load_settings(4)
+
+        assert 1 in UserStateManager.settings
+        assert 2 not in UserStateManager.settings and 2 not in UserStateManager._loaded_at
+        assert list(UserStateManager._last_access) == [1, 4]
+
+        await UserStateManager.flush()
+        await UserStateManager.load_settings(5)
+        assert 1 not in UserStateManager.settings
+        assert (await UserStateManager.load_settings(1)).style == "ANIME"
+
+        # Неактивные дольше SETTINGS_IDLE_TIMEOUT убираются и без превышения лимита
+        later = time.monotonic() + UserStateManager.SETTINGS_IDLE_TIMEOUT + 1
+        with patch('src.models.user_state.time.monotonic', return_value=later):
+            await UserStateManager.load_settings(6)
+        assert list(UserStateManager._last_access) == [6]
+    finally:
+        for user_id in range(1, 7):
+            UserStateManager.clear_user_data(user_id)
+        await UserStateManager.shutdown()
+        UserStateManager.configure(MemoryStorage())